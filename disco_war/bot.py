@@ -1,42 +1,84 @@
+import logging
+import os
 import re
-from io import BytesIO
+from collections.abc import Awaitable, Callable
+from tempfile import SpooledTemporaryFile
 
+import aiohttp
 import discord
 from discord.ext import commands
 
-from disco_war.common_types import Login, GroupDescriptor
+from disco_war.common_types import Login, GameID
 from disco_war.controllers.results_processing import ResultAlreadyProcessed, WinnerNotInPlayersException
-from disco_war.markdown import MarkdownBuilder
-from disco_war.parsing import ReplayFileProcessing, ReplayProcessingResult, UnknownReplay
-from disco_war.repository.redis import make_redis
-from disco_war.repository import types
-from disco_war.configuration import make_redis_based_configuration
+from disco_war.markdown import MarkdownTablePages
+from disco_war.parsing import ReplayFileProcessing, ReplayProcessingResult, UnknownReplay, read_game_id
+from disco_war.configuration import make_configuration
 
 
 class SurvivalChaosClient(commands.Bot):
     def __init__(self, *, intents: discord.Intents):
         super().__init__(command_prefix='/', intents=intents)
 
-        r = make_redis()
-        self.r = r
-        self.configuration = make_redis_based_configuration(r)
+        self.configuration = make_configuration()
 
         @self.command()
-        async def stats(ctx: commands.Context):
-            await ctx.send(await self.make_stats_message())
+        async def stats(ctx: commands.Context, period: str | None = None):
+            if period is None:
+                await send_pages(ctx, await self.configuration.stats_messages_controller.stats_message())
+            else:
+                await send_pages(ctx, await self.configuration.stats_messages_controller.period_stats_message(period))
+
+        @self.command()
+        async def rating(ctx: commands.Context, player: str | None = None):
+            if player is None:
+                await send_pages(ctx, await self.configuration.stats_messages_controller.ratings_message())
+            else:
+                await ctx.send(await self.configuration.stats_messages_controller.player_rating_message(Login(player)))
+
+        @self.command()
+        async def vs(ctx: commands.Context, player: str, opponent: str):
+            await ctx.send(await self.configuration.stats_messages_controller.head_to_head_message(
+                Login(player),
+                Login(opponent),
+            ))
+
+        @self.command()
+        async def rivals(ctx: commands.Context, player: str):
+            await send_pages(ctx, await self.configuration.stats_messages_controller.rivals_message(Login(player)))
+
+        @self.command()
+        async def profile(ctx: commands.Context, player: str):
+            await ctx.send(await self.configuration.stats_messages_controller.profile_message(Login(player)))
+
+        @self.command()
+        async def groups(ctx: commands.Context, player: str):
+            await send_pages(ctx, await self.configuration.stats_messages_controller.player_groups_message(Login(player)))
+
+        @self.command()
+        async def best_group(ctx: commands.Context, player: str):
+            await ctx.send(await self.configuration.stats_messages_controller.best_group_message(Login(player)))
 
         @self.command()
         async def add_alias(ctx: commands.Context, alias: str, player: str):
             await self.configuration.players_controller.add_alias(Login(alias), Login(player))
 
     async def setup_hook(self):
-        await self.r.ping()
+        await self.configuration.start()
+        self.session = aiohttp.ClientSession()
+        self.attachment_processing = AttachmentProcessing(
+            self.session,
+            self.configuration.replay_processing.ensure_not_processed,
+        )
+
+    async def close(self):
+        await self.session.close()
+        await self.configuration.close()
+        await super().close()
 
     async def on_ready(self):
         print(f'Logged on as {self.user}!')
 
     async def on_message(self, message: discord.Message):
-        processing = AttachmentProcessing()
         winner_search = winner_re.search(message.content)
         if winner_search is None:
             winner = None
@@ -44,18 +86,24 @@ class SurvivalChaosClient(commands.Bot):
             winner = Login(winner_search.group(1))
         for attachment in message.attachments:
             try:
-                result = await processing.process(attachment)
+                result = await self.attachment_processing.process(attachment)
             except UnknownReplay as e:
                 await message.channel.send(f'Этот реплей карты {e.map_name} не похож на Survival Chaos')
                 continue
+            except AttachmentTooLarge as e:
+                await message.channel.send(
+                    f'Файл {attachment.filename} слишком большой ({e.size} байт, максимум {e.max_size} байт)'
+                )
+                continue
+            except ResultAlreadyProcessed as e:
+                await message.channel.send(f'Этот реплей (номер {e.result_id}) уже был обработан')
+                continue
             if result is None:
                 return
 
             if winner is not None:
                 result.winner = winner
 
-            result = await self.configuration.players_controller.normalize_logins(result)
-
             try:
                 await self.configuration.replay_processing.process(result)
             except ResultAlreadyProcessed:
@@ -66,37 +114,117 @@ class SurvivalChaosClient(commands.Bot):
                 continue
 
             await message.channel.send(result.formatted())
-            stats = await self.make_group_stats_message(GroupDescriptor(frozenset(p.login for p in result.players)))
+            stats = await self.configuration.stats_messages_controller.group_stats_message(result.group)
             await message.channel.send(stats)
         await self.process_commands(message)
 
-    async def make_stats_message(self) -> str:
-        stats = await self.configuration.individual_stats_controller.get()
-        return f'Статистика по всем игрокам:\n{self.format_stats_message(stats)}'
 
-    async def make_group_stats_message(self, group: GroupDescriptor) -> str:
-        stats = await self.configuration.individual_stats_controller.get_group(group)
-        return f'Статистика по группе:\n{self.format_stats_message(stats)}'
+class PagesView(discord.ui.View):
+    def __init__(self, pages: MarkdownTablePages, timeout: float = float(os.getenv('PAGES_TIMEOUT', 600))):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.current = 0
+        self.update_buttons()
+
+    @discord.ui.button(label='◀', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.current - 1)
+
+    @discord.ui.button(style=discord.ButtonStyle.secondary, disabled=True)
+    async def page_number(self, interaction: discord.Interaction, button: discord.ui.Button):
+        pass
+
+    @discord.ui.button(label='▶', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.current + 1)
+
+    async def show(self, interaction: discord.Interaction, page: int):
+        self.current = page
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.pages.page(page), view=self)
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.current == 0
+        self.next_page.disabled = self.current == self.pages.pages_count - 1
+        self.page_number.label = f'{self.current + 1}/{self.pages.pages_count}'
+
 
-    def format_stats_message(self, stats: list[types.IndividualStats]) -> str:
-        return (MarkdownBuilder(new_line_size=1)
-                .text('```')
-                .table()
-                .with_header(('Игрок', 'Побед', 'Игр сыграно'))
-                .with_rows([(p.login, f'{p.games_won}', f'{p.games_played}') for p in stats])
-                .text('```')
-                .build())
+async def send_pages(ctx: commands.Context, message: str | MarkdownTablePages):
+    if isinstance(message, str):
+        await ctx.send(message)
+    elif message.pages_count == 1:
+        await ctx.send(message.page(0))
+    else:
+        await ctx.send(message.page(0), view=PagesView(message))
+
+
+class AttachmentTooLarge(Exception):
+    def __init__(self, size: int, max_size: int):
+        self.size = size
+        self.max_size = max_size
+
+    def __str__(self):
+        return f'Attachment of {self.size} bytes exceeds the limit of {self.max_size} bytes!'
 
 
 class AttachmentProcessing:
-    def __init__(self):
+    def __init__(
+            self,
+            session: aiohttp.ClientSession,
+            precheck: Callable[[GameID], Awaitable[None]],
+            max_size: int = int(os.getenv('MAX_ATTACHMENT_SIZE', 8 * 1024 * 1024)),
+            spool_size: int = int(os.getenv('ATTACHMENT_SPOOL_SIZE', 1024 * 1024)),
+    ):
         self.file_processing = ReplayFileProcessing()
+        self.session = session
+        self.precheck = precheck
+        self.max_size = max_size
+        self.spool_size = spool_size
 
     async def process(self, attachment: discord.Attachment) -> ReplayProcessingResult | None:
-        if '.w3g' not in attachment.filename:
+        if not attachment.filename.lower().endswith(REPLAY_EXTENSION):
             return None
-        file = BytesIO(await attachment.read())
-        return await self.file_processing.process(file)
+        if attachment.size > self.max_size:
+            raise AttachmentTooLarge(attachment.size, self.max_size)
+        with SpooledTemporaryFile(max_size=self.spool_size) as file:
+            await self.download(attachment, file)
+            file.seek(0)
+            return await self.file_processing.process(file)
+
+    async def download(self, attachment: discord.Attachment, file: SpooledTemporaryFile):
+        downloaded = 0
+        prefix = bytearray()
+        async with self.session.get(attachment.url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                downloaded += len(chunk)
+                if downloaded > self.max_size:
+                    raise AttachmentTooLarge(downloaded, self.max_size)
+                file.write(chunk)
+                if prefix is not None:
+                    prefix += chunk
+                    prefix = await self.check_prefix(prefix)
+
+    async def check_prefix(self, prefix: bytearray) -> bytearray | None:
+        # Duplicates are detected by the game id from the replay's header, so reposts are not downloaded completely.
+        try:
+            game_id = read_game_id(bytes(prefix))
+            if game_id is not None:
+                await self.precheck(game_id)
+                return None
+        except ResultAlreadyProcessed:
+            raise
+        except Exception:
+            logger.exception('Failed to check the replay header, downloading the whole replay')
+            return None
+        if len(prefix) >= GAME_ID_PREFIX_LIMIT:
+            return None
+        return prefix
+
 
+REPLAY_EXTENSION = '.w3g'
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+GAME_ID_PREFIX_LIMIT = 256 * 1024
 
 winner_re = re.compile(r'\+[\d ]*(\w+)')
+logger = logging.getLogger(__name__)
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Protocol
+
+import redis.asyncio as redis
+
+from disco_war.common_types import GroupDescriptor
+from disco_war.repository.redis import RedisKeysManager
+
+StatsCacheKey = GroupDescriptor | None
+
+
+class StatsCache(Protocol):
+    async def get(self, key: StatsCacheKey) -> str | None: ...
+    async def set(self, key: StatsCacheKey, value: str): ...
+    async def invalidate(self, *keys: StatsCacheKey): ...
+    async def invalidate_all(self): ...
+
+
+class NoStatsCache:
+    async def get(self, key: StatsCacheKey) -> str | None:
+        return None
+
+    async def set(self, key: StatsCacheKey, value: str):
+        pass
+
+    async def invalidate(self, *keys: StatsCacheKey):
+        pass
+
+    async def invalidate_all(self):
+        pass
+
+
+@dataclass
+class InMemoryStatsCache:
+    # Only this process invalidates the entries, so other bots, imports and rebuilds are picked up after the TTL.
+    max_size: int = 1024
+    ttl: float = float(os.getenv('STATS_CACHE_TTL', 60))
+    _entries: OrderedDict[StatsCacheKey, tuple[str, float]] = field(default_factory=OrderedDict)
+
+    async def get(self, key: StatsCacheKey) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: StatsCacheKey, value: str):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, *keys: StatsCacheKey):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def invalidate_all(self):
+        self._entries.clear()
+
+
+@dataclass
+class RedisStatsCache:
+    r: redis.Redis
+    keys_manager: RedisKeysManager
+    ttl: int = 24 * 60 * 60
+
+    async def get(self, key: StatsCacheKey) -> str | None:
+        return await self.r.hget(self.keys_manager.key(STATS_CACHE_KEY), serialize_cache_key(key))
+
+    async def set(self, key: StatsCacheKey, value: str):
+        cache_key = self.keys_manager.key(STATS_CACHE_KEY)
+        async with self.r.pipeline(transaction=False) as p:
+            await p.hset(cache_key, serialize_cache_key(key), value)
+            await p.expire(cache_key, self.ttl)
+            await p.execute()
+
+    async def invalidate(self, *keys: StatsCacheKey):
+        await self.r.hdel(self.keys_manager.key(STATS_CACHE_KEY), *map(serialize_cache_key, keys))
+
+    async def invalidate_all(self):
+        await self.r.delete(self.keys_manager.key(STATS_CACHE_KEY))
+
+
+@dataclass
+class CachedRedisStatsCache(RedisStatsCache):
+    # Keeps the tables in the process too and publishes invalidations to the other processes. Nothing is kept while
+    # unsubscribed, because messages published meanwhile are lost.
+    max_size: int = 1024
+    reconnect_delay: float = 1.0
+    _entries: OrderedDict[str, str] = field(default_factory=OrderedDict)
+    _epoch: int = 0
+    _subscribed: bool = False
+    _listener: asyncio.Task | None = None
+
+    async def start(self):
+        pubsub = self.r.pubsub()
+        await pubsub.subscribe(self.keys_manager.key(STATS_CACHE_CHANNEL))
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    async def get(self, key: StatsCacheKey) -> str | None:
+        field_name = serialize_cache_key(key)
+        value = self._entries.get(field_name)
+        if value is not None:
+            self._entries.move_to_end(field_name)
+            return value
+        epoch = self._epoch
+        value = await super().get(key)
+        if value is not None:
+            self._keep(field_name, value, epoch)
+        return value
+
+    async def set(self, key: StatsCacheKey, value: str):
+        epoch = self._epoch
+        await super().set(key, value)
+        self._keep(serialize_cache_key(key), value, epoch)
+
+    async def invalidate(self, *keys: StatsCacheKey):
+        await self._publish([serialize_cache_key(key) for key in keys])
+
+    async def invalidate_all(self):
+        await self._publish(None)
+
+    async def _publish(self, fields: list[str] | None):
+        cache_key = self.keys_manager.key(STATS_CACHE_KEY)
+        async with self.r.pipeline(transaction=False) as p:
+            if fields is None:
+                await p.delete(cache_key)
+            else:
+                await p.hdel(cache_key, *fields)
+            await p.publish(self.keys_manager.key(STATS_CACHE_CHANNEL), json.dumps(fields))
+            await p.execute()
+        # The own message comes later, the next read of this process has to miss already.
+        self._forget(fields)
+
+    def _keep(self, field_name: str, value: str, epoch: int):
+        if not self._subscribed or epoch != self._epoch:
+            return
+        self._entries[field_name] = value
+        self._entries.move_to_end(field_name)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _forget(self, fields: list[str] | None):
+        self._epoch += 1
+        if fields is None:
+            self._entries.clear()
+        for field_name in fields or ():
+            self._entries.pop(field_name, None)
+
+    async def _listen(self, pubsub: redis.client.PubSub):
+        async with pubsub:
+            while True:
+                try:
+                    async for message in pubsub.listen():
+                        self._on_message(message)
+                except redis.ConnectionError:
+                    self._subscribed = False
+                    self._forget(None)
+                    await asyncio.sleep(self.reconnect_delay)
+
+    def _on_message(self, message: dict):
+        match message['type']:
+            case 'message':
+                self._forget(json.loads(message['data']))
+            case 'subscribe':
+                self._subscribed = True
+                self._forget(None)
+
+
+def serialize_cache_key(key: StatsCacheKey) -> str:
+    if key is None:
+        return ALL_PLAYERS_FIELD
+    return ','.join(sorted(key))
+
+
+STATS_CACHE_KEY = '#stats_tables'
+# Carries the invalidated fields of STATS_CACHE_KEY as a JSON list, or null when all of them are.
+STATS_CACHE_CHANNEL = '#stats_tables_channel'
+ALL_PLAYERS_FIELD = '#all'
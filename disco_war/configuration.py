@@ -1,10 +1,23 @@
-from dataclasses import dataclass
+import os
+from dataclasses import dataclass, field
 
 import redis.asyncio as redis
 
-from disco_war.repository import types, redis as redis_types
+from disco_war import cache
+from disco_war.metrics import MetricsServer
+from disco_war.periods import PeriodsCalendar
+from disco_war.profiles import ProfileAggregation
+from disco_war.ratings import EloRating
+from disco_war.repository import types, memory as memory_types, redis as redis_types, sqlite as sqlite_types
 from disco_war.controllers.results_processing import ReplayResultsProcessing, IndividualStatsController
+from disco_war.controllers.journal import JournaledReplayResultsProcessing
 from disco_war.controllers.players_controller import PlayersController
+from disco_war.controllers.ratings import RatingsController
+from disco_war.controllers.head_to_head import HeadToHeadController
+from disco_war.controllers.profiles import ProfilesController
+from disco_war.controllers.stats_import import StatsImportController
+from disco_war.controllers.stats_messages import StatsMessagesController
+from disco_war.controllers.stats_rebuild import StatsRebuildController
 
 
 @dataclass
@@ -13,33 +26,356 @@ class AppConfiguration:
 
     individual_stats_repository: types.IndividualStatsRepository
     games_repository: types.GamesRepository
+    game_records_repository: types.GameRecordsRepository
+    players_repository: types.PlayersRepository
+    period_stats_repository: types.PeriodStatsRepository
+    ratings_repository: types.RatingsRepository
+    head_to_head_repository: types.HeadToHeadRepository
+    profiles_repository: types.ProfilesRepository
 
-    replay_processing: ReplayResultsProcessing
+    replay_processing: ReplayResultsProcessing | JournaledReplayResultsProcessing
     individual_stats_controller: IndividualStatsController
     players_controller: PlayersController
+    ratings_controller: RatingsController
+    head_to_head_controller: HeadToHeadController
+    profiles_controller: ProfilesController
+    stats_messages_controller: StatsMessagesController
+    stats_import_controller: StatsImportController
+    stats_rebuild_controller: StatsRebuildController
 
+    services: list[types.Service] = field(default_factory=list)
 
-def make_redis_based_configuration(r: redis.Redis) -> AppConfiguration:
-    context_manager = redis_types.RepositoryContextManager(r)
+    async def start(self):
+        for service in self.services:
+            await service.start()
 
-    main_keys_manager = redis_types.RedisKeysManager('main')
-    individual_stats_keys_manager = main_keys_manager.namespace('individual_stats')
+    async def close(self):
+        for service in reversed(self.services):
+            await service.close()
+
+
+def make_configuration(
+        storage: str = os.getenv('STORAGE', 'redis'),
+        metrics_port: str | None = os.getenv('METRICS_PORT'),
+        journal_path: str | None = os.getenv('JOURNAL_PATH'),
+) -> AppConfiguration:
+    match storage:
+        case 'redis':
+            configuration = make_redis_based_configuration(redis_types.make_redis(), replica=redis_types.make_redis_replica())
+        case 'sqlite':
+            configuration = make_sqlite_based_configuration()
+        case 'memory':
+            configuration = make_memory_based_configuration()
+        case _:
+            raise ValueError(f'Unknown storage: {storage}')
+    if journal_path is not None:
+        # Started after the storage, so the journal left by the previous run can be applied right away.
+        configuration.replay_processing = JournaledReplayResultsProcessing(configuration.replay_processing, journal_path)
+        configuration.services.append(configuration.replay_processing)
+    if metrics_port is not None:
+        configuration.services.append(MetricsServer(int(metrics_port)))
+    return configuration
+
+
+def make_redis_based_configuration(
+        r: redis.Redis,
+        stats_cache_mode: str = os.getenv('STATS_CACHE', 'redis'),
+        stats_layout: str = os.getenv('STATS_LAYOUT', 'hashes'),
+        games_dedup_mode: str = os.getenv('GAMES_DEDUP', 'set'),
+        keys_root: str = 'main',
+        replica: redis.Redis | None = None,
+        transactions: bool = os.getenv('REDIS_TRANSACTIONS', '0') == '1',
+        replica_wait_timeout: int = int(os.getenv('REDIS_REPLICA_WAIT', 100)),
+        client_cache_size: int = int(os.getenv('REDIS_CLIENT_CACHE', 0)),
+        write_behind_games: int = int(os.getenv('WRITE_BEHIND_GAMES', 0)),
+        write_behind_interval: int = int(os.getenv('WRITE_BEHIND_INTERVAL', 200)),
+        generation_grace: float = float(os.getenv('REDIS_GENERATION_GRACE', 5)),
+) -> AppConfiguration:
+    cluster = isinstance(r, redis.RedisCluster)
+    if cluster and not isinstance(r, redis_types.RedisCluster):
+        # Commands awaited on the stock cluster pipeline are dropped instead of being sent, see AwaitableClusterPipeline.
+        raise ValueError('Redis Cluster needs the RedisCluster client of make_redis')
+    if cluster and transactions:
+        raise ValueError('Transactions are not supported in cluster mode')
+    if cluster and replica is not None:
+        raise ValueError('A separate replica is not supported in cluster mode')
+    if cluster and client_cache_size:
+        raise ValueError('The client side cache is not supported in cluster mode')
+    if cluster and write_behind_games:
+        raise ValueError('Write-behind is not supported in cluster mode')
+
+    main_keys_manager = redis_types.RedisKeysManager(keys_root, tagged=cluster)
+    generations = redis_types.RedisGenerations(r, main_keys_manager, cluster, generation_grace)
+    individual_stats_keys_manager = generations.keys_manager_for(main_keys_manager.namespace('individual_stats'))
     games_keys_manager = main_keys_manager.namespace('games')
     players_keys_manager = main_keys_manager.namespace('players')
+    cache_keys_manager = main_keys_manager.namespace('cache')
+    period_stats_keys_manager = generations.keys_manager_for(main_keys_manager.namespace('period_stats'))
+    ratings_keys_manager = generations.keys_manager_for(main_keys_manager.namespace('ratings'))
+    head_to_head_keys_manager = generations.keys_manager_for(main_keys_manager.namespace('head_to_head'))
+    profiles_keys_manager = generations.keys_manager_for(main_keys_manager.namespace('profiles'))
+
+    write_behind_buffer = None
+    if write_behind_games:
+        write_behind_buffer = redis_types.WriteBehindBuffer(
+            r,
+            main_keys_manager,
+            write_behind_games,
+            write_behind_interval / 1000,
+            replica_wait_timeout if replica is not None else None,
+        )
+    services: list[types.Service] = [
+        redis_types.RedisService(r, redis_types.LOADED_SCRIPTS.values(), write_behind_buffer),
+    ]
+    if replica is not None:
+        services.append(redis_types.RedisService(replica))
+    services.append(generations)
+    client_cache = None
+    if client_cache_size:
+        client_cache = redis_types.ClientSideCache(
+            replica if replica is not None else r,
+            [
+                individual_stats_keys_manager.key(''),
+                players_keys_manager.key(''),
+                period_stats_keys_manager.key(''),
+                head_to_head_keys_manager.key(''),
+                profiles_keys_manager.key(''),
+            ],
+            client_cache_size,
+        )
+        services.append(client_cache)
+    rating = EloRating()
+    aggregation = ProfileAggregation()
+    context_manager = redis_types.RepositoryContextManager(
+        r,
+        transactions,
+        replica,
+        replica_wait_timeout,
+        client_cache,
+        write_behind_buffer,
+    )
+    stats_cache = make_stats_cache(stats_cache_mode, r, cache_keys_manager, cluster)
+    if isinstance(stats_cache, cache.CachedRedisStatsCache):
+        services.append(stats_cache)
+    if cluster:
+        # The asyncio cluster client has no pub/sub, so the aliases are not cached.
+        players_repository = redis_types.PlayersRepository(r, players_keys_manager)
+    else:
+        players_repository = redis_types.CachedPlayersRepository(r, players_keys_manager)
+        services.append(players_repository)
+    return make_app_configuration(
+        context_manager,
+        make_individual_stats_repository(stats_layout, r, individual_stats_keys_manager),
+        make_games_repository(games_dedup_mode, r, games_keys_manager),
+        redis_types.GameRecordsRepository(r, games_keys_manager),
+        players_repository,
+        redis_types.PeriodStatsRepository(r, period_stats_keys_manager),
+        redis_types.RatingsRepository(r, ratings_keys_manager, rating),
+        redis_types.HeadToHeadRepository(r, head_to_head_keys_manager),
+        redis_types.ProfilesRepository(r, profiles_keys_manager, aggregation),
+        stats_cache,
+        rating,
+        aggregation,
+        services=services,
+    )
+
+
+def make_sqlite_based_configuration(
+        path: str = os.getenv('SQLITE_PATH', 'disco_war.sqlite3'),
+        stats_cache_mode: str = os.getenv('STATS_CACHE', 'memory'),
+) -> AppConfiguration:
+    database = sqlite_types.SQLiteDatabase(path)
+    rating = EloRating()
+    aggregation = ProfileAggregation()
+    return make_app_configuration(
+        sqlite_types.SQLiteRepositoryContextManager(database),
+        sqlite_types.SQLiteIndividualStatsRepository(),
+        sqlite_types.SQLiteGamesRepository(),
+        sqlite_types.SQLiteGameRecordsRepository(),
+        sqlite_types.SQLitePlayersRepository(),
+        sqlite_types.SQLitePeriodStatsRepository(),
+        sqlite_types.SQLiteRatingsRepository(rating),
+        sqlite_types.SQLiteHeadToHeadRepository(),
+        sqlite_types.SQLiteProfilesRepository(aggregation),
+        make_local_stats_cache(stats_cache_mode),
+        rating,
+        aggregation,
+        services=[database],
+    )
+
 
-    individual_stats_repository = redis_types.RedisIndividualStatsRepository(r, individual_stats_keys_manager)
-    games_repository = redis_types.GamesRepository(r, games_keys_manager)
-    players_repository = redis_types.PlayersRepository(r, players_keys_manager)
+def make_memory_based_configuration(stats_cache_mode: str = os.getenv('STATS_CACHE', 'memory')) -> AppConfiguration:
+    storage = memory_types.InMemoryStorage()
+    rating = EloRating()
+    aggregation = ProfileAggregation()
+    return make_app_configuration(
+        memory_types.InMemoryRepositoryContextManager(),
+        memory_types.InMemoryIndividualStatsRepository(storage),
+        memory_types.InMemoryGamesRepository(storage),
+        memory_types.InMemoryGameRecordsRepository(storage),
+        memory_types.InMemoryPlayersRepository(storage),
+        memory_types.InMemoryPeriodStatsRepository(storage),
+        memory_types.InMemoryRatingsRepository(storage, rating),
+        memory_types.InMemoryHeadToHeadRepository(storage),
+        memory_types.InMemoryProfilesRepository(storage, aggregation),
+        make_local_stats_cache(stats_cache_mode),
+        rating,
+        aggregation,
+        services=[],
+    )
 
-    replay_processing = ReplayResultsProcessing(context_manager, individual_stats_repository, games_repository)
-    individual_stats_controller = IndividualStatsController(context_manager, individual_stats_repository)
-    players_controller = PlayersController(context_manager, players_repository, individual_stats_repository)
+
+def make_app_configuration(
+        context_manager: types.RepositoryContextManager,
+        individual_stats_repository: types.IndividualStatsRepository,
+        games_repository: types.GamesRepository,
+        game_records_repository: types.GameRecordsRepository,
+        players_repository: types.PlayersRepository,
+        period_stats_repository: types.PeriodStatsRepository,
+        ratings_repository: types.RatingsRepository,
+        head_to_head_repository: types.HeadToHeadRepository,
+        profiles_repository: types.ProfilesRepository,
+        stats_cache: cache.StatsCache,
+        rating: EloRating,
+        aggregation: ProfileAggregation,
+        services: list[types.Service],
+) -> AppConfiguration:
+    calendar = PeriodsCalendar()
+    players_controller = PlayersController(
+        context_manager,
+        players_repository,
+        individual_stats_repository,
+        head_to_head_repository,
+        ratings_repository,
+        profiles_repository,
+        stats_cache,
+    )
+    replay_processing = ReplayResultsProcessing(
+        context_manager,
+        individual_stats_repository,
+        games_repository,
+        period_stats_repository,
+        ratings_repository,
+        head_to_head_repository,
+        profiles_repository,
+        players_controller,
+        stats_cache,
+        calendar,
+    )
+    individual_stats_controller = IndividualStatsController(
+        context_manager,
+        individual_stats_repository,
+        period_stats_repository,
+        players_repository,
+    )
+    ratings_controller = RatingsController(context_manager, ratings_repository)
+    head_to_head_controller = HeadToHeadController(context_manager, head_to_head_repository, players_repository)
+    profiles_controller = ProfilesController(context_manager, profiles_repository)
+    stats_messages_controller = StatsMessagesController(
+        individual_stats_controller,
+        ratings_controller,
+        head_to_head_controller,
+        profiles_controller,
+        stats_cache,
+        calendar,
+        aggregation,
+    )
+    stats_import_controller = StatsImportController(
+        context_manager,
+        individual_stats_repository,
+        players_repository,
+        players_controller,
+        stats_cache,
+    )
+    stats_rebuild_controller = StatsRebuildController(
+        context_manager,
+        game_records_repository,
+        individual_stats_repository,
+        players_repository,
+        period_stats_repository,
+        ratings_repository,
+        head_to_head_repository,
+        profiles_repository,
+        stats_cache,
+        calendar,
+        rating,
+        aggregation,
+    )
 
     return AppConfiguration(
         context_manager,
         individual_stats_repository,
         games_repository,
+        game_records_repository,
+        players_repository,
+        period_stats_repository,
+        ratings_repository,
+        head_to_head_repository,
+        profiles_repository,
         replay_processing,
         individual_stats_controller,
         players_controller,
+        ratings_controller,
+        head_to_head_controller,
+        profiles_controller,
+        stats_messages_controller,
+        stats_import_controller,
+        stats_rebuild_controller,
+        services=services,
     )
+
+
+def make_individual_stats_repository(
+        layout: str,
+        r: redis.Redis,
+        keys_manager: redis_types.RedisKeysManager,
+) -> redis_types.RedisIndividualStatsRepository:
+    match layout:
+        case 'hashes':
+            return redis_types.RedisIndividualStatsRepository(r, keys_manager)
+        case 'packed':
+            return redis_types.PackedRedisIndividualStatsRepository(
+                r,
+                keys_manager,
+                buckets=int(os.getenv('PACKED_STATS_BUCKETS', 64)),
+            )
+    raise ValueError(f'Unknown stats layout: {layout}')
+
+
+def make_games_repository(
+        mode: str,
+        r: redis.Redis,
+        keys_manager: redis_types.RedisKeysManager,
+) -> redis_types.GamesRepository:
+    match mode:
+        case 'set':
+            return redis_types.GamesRepository(r, keys_manager)
+        case 'bloom':
+            return redis_types.BloomGamesRepository(
+                r,
+                keys_manager,
+                capacity=int(os.getenv('GAMES_BLOOM_CAPACITY', 1_000_000)),
+                error_rate=float(os.getenv('GAMES_BLOOM_ERROR_RATE', 0.001)),
+                recent_window=int(os.getenv('GAMES_RECENT_WINDOW', 10_000)),
+            )
+    raise ValueError(f'Unknown games dedup mode: {mode}')
+
+
+def make_stats_cache(
+        mode: str,
+        r: redis.Redis,
+        keys_manager: redis_types.RedisKeysManager,
+        cluster: bool = False,
+) -> cache.StatsCache:
+    if mode == 'redis':
+        return cache.RedisStatsCache(r, keys_manager) if cluster else cache.CachedRedisStatsCache(r, keys_manager)
+    return make_local_stats_cache(mode)
+
+
+def make_local_stats_cache(mode: str) -> cache.StatsCache:
+    match mode:
+        case 'memory':
+            return cache.InMemoryStatsCache()
+        case 'none':
+            return cache.NoStatsCache()
+    raise ValueError(f'Unknown stats cache mode: {mode}')
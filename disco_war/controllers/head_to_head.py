@@ -0,0 +1,46 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from operator import attrgetter
+
+from disco_war.metrics import instrumented
+from disco_war.common_types import Login
+from disco_war.controllers.players_controller import patch_login
+from disco_war.repository import types
+
+
+@dataclass
+class HeadToHeadController:
+    context_manager: types.RepositoryContextManager
+    head_to_head_repository: types.HeadToHeadRepository
+    players_repository: types.PlayersRepository
+
+    @instrumented
+    async def get_rivals(self, player: Login) -> list[types.HeadToHead]:
+        async with self.context_manager.start() as c:
+            rivals = await self.head_to_head_repository.rivals(c, types.RivalsOptions(player))
+            opponents = [r.opponent for r in rivals]
+            login_to_normalized_login = dict(zip(opponents, await self.players_repository.normalize_players(c, opponents)))
+        # Hashes from before alias merges rewrote them may still have aliases as opponents, so those are merged on read.
+        deltas = defaultdict(types.HeadToHeadDelta)
+        for rival in rivals:
+            delta = deltas[patch_login(rival.opponent, login_to_normalized_login)]
+            delta.games_played += rival.games_played
+            delta.games_won += rival.games_won
+            delta.games_lost += rival.games_lost
+        rivals = [
+            types.HeadToHead(opponent, delta.games_played, delta.games_won, delta.games_lost)
+            for opponent, delta in deltas.items()
+            if opponent != player
+        ]
+        rivals.sort(key=games_played_getter, reverse=True)
+        return rivals
+
+    @instrumented
+    async def get_head_to_head(self, player: Login, opponent: Login) -> types.HeadToHead | None:
+        for rival in await self.get_rivals(player):
+            if rival.opponent == opponent:
+                return rival
+        return None
+
+
+games_played_getter = attrgetter('games_played')
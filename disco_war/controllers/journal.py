@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import BinaryIO
+
+import redis.asyncio as redis
+
+from disco_war.metrics import instrumented
+from disco_war.parsing import ReplayProcessingResult, Player
+from disco_war.common_types import GameID
+from disco_war.controllers.results_processing import (
+    ReplayResultsProcessing,
+    ResultAlreadyProcessed,
+    WinnerNotInPlayersException,
+)
+
+
+@dataclass
+class JournalEntry:
+    result: ReplayProcessingResult
+    played_at: float
+    claim_id: str | None
+    end: int
+    applied: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+@dataclass
+class JournaledReplayResultsProcessing:
+    # Results are acknowledged once they are fsynced to a local append-only journal and applied to the storage by
+    # a background task, and the journal is replayed on start. Each entry claims its game with its own claim id, so an
+    # entry retried after its writes were lost is applied again instead of being dropped as a duplicate.
+    processing: ReplayResultsProcessing
+    path: str
+    apply_timeout: float = 1.0
+    batch_size: int = 100
+    retry_delay: float = 1.0
+    _file: BinaryIO | None = None
+    _queue: list[JournalEntry] = field(default_factory=list)
+    _pending: dict[GameID, JournalEntry] = field(default_factory=dict)
+    _queued: asyncio.Event = field(default_factory=asyncio.Event)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    _applier: asyncio.Task | None = None
+
+    async def start(self):
+        entries, self._file = await asyncio.to_thread(self._open)
+        for result, played_at, claim_id, end in entries:
+            self._enqueue(JournalEntry(result, played_at, claim_id, end))
+        self._applier = asyncio.create_task(self._apply())
+
+    async def close(self):
+        if self._applier is not None:
+            self._applier.cancel()
+            self._applier = None
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+    @instrumented
+    async def ensure_not_processed(self, game_id: GameID):
+        if game_id in self._pending:
+            raise ResultAlreadyProcessed(game_id)
+        try:
+            await self.processing.ensure_not_processed(game_id)
+        except STORAGE_ERRORS:
+            logger.warning('Could not check whether game %s is processed', game_id, exc_info=True)
+
+    @instrumented
+    async def process(self, result: ReplayProcessingResult):
+        # The winner is checked when the game is applied, because it may be given by an alias.
+        if result.id in self._pending:
+            raise ResultAlreadyProcessed(result.id)
+
+        played_at = time.time()
+        claim_id = uuid.uuid4().hex
+        line = dump_entry(result, played_at, claim_id)
+        async with self._lock:
+            end = await asyncio.to_thread(self._append, line)
+            entry = JournalEntry(result, played_at, claim_id, end)
+            self._enqueue(entry)
+
+        # Waiting a little keeps the stats shown right after an upload fresh while the storage is fast.
+        try:
+            error = await asyncio.wait_for(asyncio.shield(entry.applied), self.apply_timeout)
+        except asyncio.TimeoutError:
+            return
+        if error is not None:
+            raise error
+
+    def _enqueue(self, entry: JournalEntry):
+        self._queue.append(entry)
+        self._pending[entry.result.id] = entry
+        self._queued.set()
+
+    async def _apply(self):
+        while True:
+            await self._queued.wait()
+            self._queued.clear()
+            while self._queue:
+                batch = self._queue[:self.batch_size]
+                for entry in batch:
+                    entry.applied.set_result(await self._apply_entry(entry))
+                    del self._pending[entry.result.id]
+                del self._queue[:len(batch)]
+                async with self._lock:
+                    await asyncio.to_thread(self._commit, batch[-1].end)
+
+    async def _apply_entry(self, entry: JournalEntry) -> Exception | None:
+        while True:
+            try:
+                await self.processing.process(entry.result, entry.played_at, entry.claim_id)
+                return None
+            except (ResultAlreadyProcessed, WinnerNotInPlayersException) as e:
+                return e
+            except STORAGE_ERRORS:
+                await asyncio.sleep(self.retry_delay)
+            except Exception as e:
+                # Retrying wouldn't help, so the entry is set aside for a manual look and the next ones go on.
+                logger.exception('Could not apply game %s, it is moved to %s', entry.result.id, self._failed_path)
+                await asyncio.to_thread(self._set_aside, dump_entry(entry.result, entry.played_at, entry.claim_id))
+                return e
+
+    def _open(self) -> tuple[list[tuple[ReplayProcessingResult, float, str | None, int]], BinaryIO]:
+        offset = 0
+        if os.path.exists(self._offset_path):
+            with open(self._offset_path) as f:
+                offset = int(f.read() or 0)
+        entries = []
+        with open(self.path, 'a+b') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(min(offset, size))
+            end = f.tell()
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                raw_result, played_at, *claim_id = json.loads(line)
+                end += len(line)
+                entries.append((load_result(raw_result), played_at, next(iter(claim_id), None), end))
+            # A line cut short by a crash was never acknowledged.
+            f.truncate(end)
+        return entries, open(self.path, 'ab')
+
+    def _append(self, line: bytes) -> int:
+        self._file.write(line)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def _commit(self, end: int):
+        if end == self._file.tell():
+            # Everything is applied, so the journal starts over. The offset is reset first: if the truncation
+            # doesn't happen, the applied entries are replayed and dropped as duplicates.
+            self._write_offset(0)
+            self._file.truncate(0)
+            self._file.seek(0)
+        else:
+            self._write_offset(end)
+
+    def _set_aside(self, line: bytes):
+        with open(self._failed_path, 'ab') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_offset(self, offset: int):
+        tmp_path = self._offset_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._offset_path)
+
+    @property
+    def _offset_path(self) -> str:
+        return self.path + '.offset'
+
+    @property
+    def _failed_path(self) -> str:
+        return self.path + '.failed'
+
+
+def dump_entry(result: ReplayProcessingResult, played_at: float, claim_id: str | None) -> bytes:
+    return json.dumps([dataclasses.asdict(result), played_at, claim_id], ensure_ascii=False).encode() + b'\n'
+
+
+def load_result(raw: dict) -> ReplayProcessingResult:
+    return ReplayProcessingResult(
+        players=[Player(**p) for p in raw['players']],
+        winner=raw['winner'],
+        replay_length=raw['replay_length'],
+        id=GameID(raw['id']),
+    )
+
+
+STORAGE_ERRORS = (redis.ConnectionError, redis.TimeoutError, OSError)
+
+logger = logging.getLogger(__name__)
@@ -1,43 +1,83 @@
+import asyncio
+import functools
+import random
 import re
+from collections.abc import Awaitable, Callable, Mapping
 from dataclasses import dataclass
+from typing import ParamSpec, TypeVar
 
+from disco_war.cache import StatsCache
+from disco_war.metrics import instrumented
 from disco_war.parsing import ReplayProcessingResult
 from disco_war.common_types import Login
 from disco_war.repository.types import (
-    ChangeIndividualStatsOptions,
     RepositoryContextManager,
     PlayersRepository,
     AddPlayerAliasOptions,
+    AddPlayerAliasesOptions,
     IndividualStatsRepository,
-    OneIndividualStatsOptions,
+    HeadToHeadRepository,
+    ProfilesRepository,
+    RatingsRepository,
+    MergePlayersOptions,
+    TransactionConflict,
 )
 
+P = ParamSpec('P')
+R = TypeVar('R')
+
+
+def retry_on_conflict(method: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    @functools.wraps(method)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        for attempt in range(CONFLICT_RETRIES):
+            try:
+                return await method(*args, **kwargs)
+            except TransactionConflict:
+                if attempt == CONFLICT_RETRIES - 1:
+                    raise
+                await asyncio.sleep(random.uniform(0, CONFLICT_BACKOFF * 2 ** attempt))
+
+    return wrapper
+
 
 @dataclass
 class PlayersController:
     context_manager: RepositoryContextManager
     players_repository: PlayersRepository
     individual_stats_repository: IndividualStatsRepository
+    head_to_head_repository: HeadToHeadRepository
+    ratings_repository: RatingsRepository
+    profiles_repository: ProfilesRepository
+    stats_cache: StatsCache
 
+    @instrumented
+    @retry_on_conflict
     async def add_alias(self, player: Login, alias: Login):
         async with self.context_manager.start() as c:
-            alias_stats = await self.individual_stats_repository.stats_for_player(c, OneIndividualStatsOptions(alias))
-            if alias_stats is not None:
-                await self.individual_stats_repository.add_game_played_for_player(
-                    c,
-                    ChangeIndividualStatsOptions(player=player, amount=alias_stats.games_played),
-                )
-                await self.individual_stats_repository.add_game_won_for_player(
-                    c,
-                    ChangeIndividualStatsOptions(player=player, amount=alias_stats.games_won),
-                )
-                await self.individual_stats_repository.remove_stats(c, OneIndividualStatsOptions(alias))
+            await self.individual_stats_repository.merge_players(c, MergePlayersOptions({alias: player}))
+            await self.head_to_head_repository.merge_players(c, MergePlayersOptions({alias: player}))
+            await self.ratings_repository.merge_players(c, MergePlayersOptions({alias: player}))
+            await self.profiles_repository.merge_players(c, MergePlayersOptions({alias: player}))
             await self.players_repository.add_alias(c, AddPlayerAliasOptions(alias=alias, login=player))
+        await self.stats_cache.invalidate_all()
 
+    @instrumented
+    @retry_on_conflict
+    async def add_aliases(self, aliases: Mapping[Login, Login]):
+        async with self.context_manager.start() as c:
+            await self.individual_stats_repository.merge_players(c, MergePlayersOptions(aliases))
+            await self.head_to_head_repository.merge_players(c, MergePlayersOptions(aliases))
+            await self.ratings_repository.merge_players(c, MergePlayersOptions(aliases))
+            await self.profiles_repository.merge_players(c, MergePlayersOptions(aliases))
+            await self.players_repository.add_aliases(c, AddPlayerAliasesOptions(aliases))
+        await self.stats_cache.invalidate_all()
+
+    @instrumented
     async def normalize_logins(self, result: ReplayProcessingResult) -> ReplayProcessingResult:
         logins = [p.login for p in result.players] + [result.winner]
         logins = [cleanup_login_re.sub('', login) for login in logins]
-        async with self.context_manager.start() as c:
+        async with self.context_manager.start(buffered=True) as c:
             login_to_normalized_login = dict(zip(
                 logins,
                 await self.players_repository.normalize_players(c, logins),
@@ -54,3 +94,6 @@ def patch_login(login: Login, login_to_normalized_login: dict[Login, Login]) ->
 
 
 cleanup_login_re = re.compile(r'#\d+$')
+
+CONFLICT_RETRIES = 5
+CONFLICT_BACKOFF = 0.01
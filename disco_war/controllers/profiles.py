@@ -0,0 +1,16 @@
+from dataclasses import dataclass
+
+from disco_war.metrics import instrumented
+from disco_war.common_types import Login
+from disco_war.repository import types
+
+
+@dataclass
+class ProfilesController:
+    context_manager: types.RepositoryContextManager
+    profiles_repository: types.ProfilesRepository
+
+    @instrumented
+    async def get(self, player: Login) -> types.PlayerProfile | None:
+        async with self.context_manager.start() as c:
+            return await self.profiles_repository.profile(c, types.OneProfileOptions(player))
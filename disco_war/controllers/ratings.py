@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+
+from disco_war.metrics import instrumented
+from disco_war.common_types import Login
+from disco_war.repository import types
+
+
+@dataclass
+class RatingsController:
+    context_manager: types.RepositoryContextManager
+    ratings_repository: types.RatingsRepository
+
+    @instrumented
+    async def get_leaderboard(self, offset: int = 0, limit: int = 20) -> list[types.PlayerRating]:
+        async with self.context_manager.start() as c:
+            return await self.ratings_repository.leaderboard(c, types.LeaderboardOptions(offset, limit))
+
+    @instrumented
+    async def get_player(self, player: Login) -> types.PlayerRating | None:
+        async with self.context_manager.start() as c:
+            return await self.ratings_repository.rating_for_player(c, types.OnePlayerRatingOptions(player))
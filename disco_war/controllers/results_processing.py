@@ -1,8 +1,14 @@
+import time
+from collections import defaultdict
 from dataclasses import dataclass
 from operator import attrgetter
 
+from disco_war.cache import StatsCache
+from disco_war.metrics import instrumented
 from disco_war.parsing import ReplayProcessingResult
+from disco_war.periods import PeriodBucket, PeriodsCalendar
 from disco_war.repository import types
+from disco_war.controllers.players_controller import PlayersController, patch_login
 from disco_war.common_types import GroupDescriptor, Login
 
 
@@ -27,17 +33,53 @@ class ReplayResultsProcessing:
     context_manager: types.RepositoryContextManager
     individual_stats_repository: types.IndividualStatsRepository
     games_repository: types.GamesRepository
-
-    async def process(self, result: ReplayProcessingResult):
+    period_stats_repository: types.PeriodStatsRepository
+    ratings_repository: types.RatingsRepository
+    head_to_head_repository: types.HeadToHeadRepository
+    profiles_repository: types.ProfilesRepository
+    players_controller: PlayersController
+    stats_cache: StatsCache
+    calendar: PeriodsCalendar
+
+    @instrumented
+    async def ensure_not_processed(self, game_id: types.GameID):
+        async with self.context_manager.start(buffered=True) as c:
+            if await self.games_repository.is_played_game(c, types.GameOptions(game_id)):
+                raise ResultAlreadyProcessed(game_id)
+
+    @instrumented
+    async def process(self, result: ReplayProcessingResult, played_at: float | None = None, claim_id: str | None = None):
+        result = await self.players_controller.normalize_logins(result)
         if result.winner not in result.group:
             raise WinnerNotInPlayersException(result.winner)
+        if played_at is None:
+            played_at = time.time()
 
-        async with self.context_manager.start() as c:
-            add_game_result = await self.games_repository.add_played_game(c, types.GameOptions(result.id))
+        record = make_game_record(result, played_at)
+        async with self.context_manager.start(buffered=True) as c:
+            add_game_result = await self.games_repository.add_played_game(
+                c,
+                types.GameOptions(result.id, record=record, claim_id=claim_id),
+            )
             if add_game_result.status == types.AddGameStatus.DUPLICATE:
                 raise ResultAlreadyProcessed(result.id)
 
             group = GroupDescriptor(frozenset(p.login for p in result.players))
+            c.on_commit.append(lambda: self.stats_cache.invalidate(None, group))
+            await self.period_stats_repository.add_game(c, types.AddPeriodGameOptions(
+                players=[p.login for p in result.players],
+                winner=result.winner,
+                buckets=self.calendar.game_buckets(played_at),
+            ))
+            await self.ratings_repository.add_game(c, types.RateGameOptions(
+                players=[p.login for p in result.players],
+                winner=result.winner,
+            ))
+            await self.head_to_head_repository.add_game(c, types.HeadToHeadGameOptions(
+                players=[p.login for p in result.players],
+                winner=result.winner,
+            ))
+            await self.profiles_repository.add_game(c, types.ProfileGameOptions(record.players))
 
             for player in result.players:
                 await self.individual_stats_repository.add_game_played_for_player(
@@ -48,34 +90,86 @@ class ReplayResultsProcessing:
                     c,
                     types.ChangeIndividualGroupStatsOptions(player=player.login, group=group),
                 )
-            if result.winner is None:
-                return
-            await self.individual_stats_repository.add_game_won_for_player(
-                c,
-                types.ChangeIndividualStatsOptions(player=result.winner),
-            )
-            await self.individual_stats_repository.add_game_won_in_group_for_player(
-                c,
-                types.ChangeIndividualGroupStatsOptions(player=result.winner, group=group),
-            )
+            if result.winner is not None:
+                await self.individual_stats_repository.add_game_won_for_player(
+                    c,
+                    types.ChangeIndividualStatsOptions(player=result.winner),
+                )
+                await self.individual_stats_repository.add_game_won_in_group_for_player(
+                    c,
+                    types.ChangeIndividualGroupStatsOptions(player=result.winner, group=group),
+                )
 
 
 @dataclass
 class IndividualStatsController:
     context_manager: types.RepositoryContextManager
     individual_stats_repository: types.IndividualStatsRepository
+    period_stats_repository: types.PeriodStatsRepository
+    players_repository: types.PlayersRepository
 
+    @instrumented
     async def get(self) -> list[types.IndividualStats]:
         async with self.context_manager.start() as c:
             stats = await self.individual_stats_repository.stats(c, types.AllIndividualStatsOptions())
         stats.sort(key=games_won_getter, reverse=True)
         return stats
 
+    @instrumented
+    async def get_for_period(self, buckets: list[PeriodBucket]) -> list[types.IndividualStats]:
+        async with self.context_manager.start() as c:
+            stats = await self.period_stats_repository.stats(c, types.PeriodStatsOptions(buckets))
+            logins = [s.login for s in stats]
+            login_to_normalized_login = dict(zip(logins, await self.players_repository.normalize_players(c, logins)))
+        # Buckets are not rewritten when aliases are merged, so the aliases are merged on read.
+        deltas = defaultdict(types.IndividualStatsDelta)
+        for s in stats:
+            delta = deltas[patch_login(s.login, login_to_normalized_login)]
+            delta.games_played += s.games_played
+            delta.games_won += s.games_won
+        stats = [types.IndividualStats(login, delta.games_played, delta.games_won) for login, delta in deltas.items()]
+        stats.sort(key=games_won_getter, reverse=True)
+        return stats
+
+    @instrumented
     async def get_group(self, group: GroupDescriptor) -> list[types.IndividualStats]:
         async with self.context_manager.start() as c:
             stats = await self.individual_stats_repository.group_stats(c, types.GroupIndividualStatsOptions(group))
         stats.sort(key=games_won_getter, reverse=True)
         return stats
 
+    @instrumented
+    async def get_player_groups(self, player: Login) -> list[types.PlayerGroupStats]:
+        async with self.context_manager.start() as c:
+            groups = await self.individual_stats_repository.groups_stats_for_player(
+                c,
+                types.OneIndividualStatsOptions(player),
+            )
+        groups.sort(key=group_games_played_getter, reverse=True)
+        return groups
+
+    @instrumented
+    async def get_best_group(self, player: Login, min_games_played: int = 3) -> types.PlayerGroupStats | None:
+        async with self.context_manager.start() as c:
+            return await self.individual_stats_repository.best_group_for_player(
+                c,
+                types.BestGroupOptions(player, min_games_played),
+            )
+
+
+def make_game_record(result: ReplayProcessingResult, played_at: float) -> types.GameRecord:
+    return types.GameRecord(
+        id=result.id,
+        # APM is rounded the way records are stored, so the profiles of a rebuild match the ones built by the games.
+        players=[
+            types.GamePlayerRecord(p.login, round(p.apm, 2), p.research_cancels, p.small_defense_used, p.ultimate_used)
+            for p in result.players
+        ],
+        winner=result.winner,
+        replay_length=result.replay_length,
+        played_at=played_at,
+    )
+
 
 games_won_getter = attrgetter('games_won')
+group_games_played_getter = attrgetter('stats.games_played')
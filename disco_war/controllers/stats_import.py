@@ -0,0 +1,67 @@
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+
+from disco_war.cache import StatsCache
+from disco_war.metrics import instrumented
+from disco_war.common_types import GroupDescriptor, Login
+from disco_war.controllers.players_controller import PlayersController, patch_login
+from disco_war.repository import types
+
+
+@dataclass
+class StatsImportController:
+    context_manager: types.RepositoryContextManager
+    individual_stats_repository: types.IndividualStatsRepository
+    players_repository: types.PlayersRepository
+    players_controller: PlayersController
+    stats_cache: StatsCache
+
+    @instrumented
+    async def import_stats(
+            self,
+            players: Iterable[types.IndividualStats] = (),
+            groups: Mapping[GroupDescriptor, Iterable[types.IndividualStats]] | None = None,
+            aliases: Mapping[Login, Login] | None = None,
+            batch_size: int = 1000,
+    ):
+        players = list(players)
+        groups = {group: list(stats) for group, stats in (groups or {}).items()}
+        aliases = aliases or {}
+        if aliases:
+            await self.players_controller.add_aliases(aliases)
+
+        logins = list({s.login for s in players} | {s.login for stats in groups.values() for s in stats})
+        async with self.context_manager.start() as c:
+            login_to_normalized_login = dict(zip(
+                logins,
+                await self.players_repository.normalize_players(c, logins),
+            ))
+            login_to_normalized_login.update(aliases)
+
+            players_deltas = defaultdict(types.IndividualStatsDelta)
+            add_to_deltas(players_deltas, players, login_to_normalized_login)
+            groups_deltas = defaultdict(lambda: defaultdict(types.IndividualStatsDelta))
+            for group, stats in groups.items():
+                normalized_group = GroupDescriptor(frozenset(
+                    patch_login(login, login_to_normalized_login) for login in group
+                ))
+                add_to_deltas(groups_deltas[normalized_group], stats, login_to_normalized_login)
+
+            await self.individual_stats_repository.import_stats(c, types.ImportIndividualStatsOptions(
+                players=players_deltas,
+                groups=groups_deltas,
+                batch_size=batch_size,
+            ))
+        await self.stats_cache.invalidate_all()
+
+
+def add_to_deltas(
+        deltas: dict[Login, types.IndividualStatsDelta],
+        stats: Iterable[types.IndividualStats],
+        login_to_normalized_login: dict[Login, Login],
+):
+    for s in stats:
+        delta = deltas[patch_login(s.login, login_to_normalized_login)]
+        delta.games_played += s.games_played
+        delta.games_won += s.games_won
@@ -0,0 +1,179 @@
+import math
+import time
+from dataclasses import dataclass
+
+from disco_war.cache import StatsCache
+from disco_war.metrics import instrumented
+from disco_war.common_types import GroupDescriptor, Login
+from disco_war.controllers.results_processing import IndividualStatsController
+from disco_war.controllers.ratings import RatingsController
+from disco_war.controllers.head_to_head import HeadToHeadController
+from disco_war.controllers.profiles import ProfilesController
+from disco_war.markdown import MarkdownBuilder, MarkdownTablePages
+from disco_war.periods import PeriodsCalendar, UnknownPeriod
+from disco_war.profiles import PROFILE_METRICS, ProfileAggregation
+from disco_war.repository import types
+
+
+@dataclass
+class StatsMessagesController:
+    individual_stats_controller: IndividualStatsController
+    ratings_controller: RatingsController
+    head_to_head_controller: HeadToHeadController
+    profiles_controller: ProfilesController
+    stats_cache: StatsCache
+    calendar: PeriodsCalendar
+    aggregation: ProfileAggregation
+
+    @instrumented
+    async def stats_message(self) -> MarkdownTablePages:
+        table = await self.stats_cache.get(None)
+        if table is None:
+            table = format_stats_table(await self.individual_stats_controller.get())
+            await self.stats_cache.set(None, table)
+        return make_pages('Статистика по всем игрокам', table)
+
+    @instrumented
+    async def period_stats_message(self, query: str) -> str | MarkdownTablePages:
+        try:
+            title, buckets = self.calendar.parse(query, time.time())
+        except UnknownPeriod:
+            return (f'Не знаю период {query}: укажите season, month, week, today '
+                    f'или число дней, например 30d (не больше {self.calendar.max_window_days}d)')
+        stats = await self.individual_stats_controller.get_for_period(buckets)
+        if not stats:
+            return f'За {title} не сыграно ни одной игры'
+        return make_pages(f'Статистика за {title}', format_stats_table(stats))
+
+    @instrumented
+    async def ratings_message(self) -> str | MarkdownTablePages:
+        ratings = await self.ratings_controller.get_leaderboard(limit=LEADERBOARD_SIZE)
+        if not ratings:
+            return 'Рейтинг пока пуст'
+        return make_pages('Рейтинг игроков', format_ratings_table(ratings))
+
+    @instrumented
+    async def player_rating_message(self, player: Login) -> str:
+        rating = await self.ratings_controller.get_player(player)
+        if rating is None:
+            return f'У игрока {player} ещё нет рейтинга'
+        return make_pages(f'Рейтинг игрока {player}', format_ratings_table([rating])).page(0)
+
+    @instrumented
+    async def rivals_message(self, player: Login) -> str | MarkdownTablePages:
+        rivals = await self.head_to_head_controller.get_rivals(player)
+        if not rivals:
+            return f'Игрок {player} ещё не сыграл ни одной игры'
+        return make_pages(f'Соперники игрока {player}', format_rivals_table(rivals))
+
+    @instrumented
+    async def head_to_head_message(self, player: Login, opponent: Login) -> str:
+        rival = await self.head_to_head_controller.get_head_to_head(player, opponent)
+        if rival is None:
+            return f'Игроки {player} и {opponent} ещё не играли вместе'
+        return make_pages(f'{player} против {opponent}', format_rivals_table([rival])).page(0)
+
+    @instrumented
+    async def profile_message(self, player: Login) -> str:
+        profile = await self.profiles_controller.get(player)
+        if profile is None:
+            return f'Игрок {player} ещё не сыграл ни одной игры'
+        percentiles = ', '.join(
+            f'{title} {self.aggregation.quantile(profile.apm_sketch, q):.0f}'
+            for title, q in PROFILE_APM_PERCENTILES
+        )
+        return (f'Профиль игрока {player}, игр: {profile.games}\n'
+                f'{format_profile_message(profile)}\n'
+                f'APM: {percentiles}')
+
+    @instrumented
+    async def group_stats_message(self, group: GroupDescriptor) -> str:
+        table = await self.stats_cache.get(group)
+        if table is None:
+            table = format_stats_table(await self.individual_stats_controller.get_group(group))
+            await self.stats_cache.set(group, table)
+        # A group has at most 8 players, so its table always fits into one message.
+        return make_pages('Статистика по группе', table).page(0)
+
+    @instrumented
+    async def player_groups_message(self, player: Login) -> str | MarkdownTablePages:
+        groups = await self.individual_stats_controller.get_player_groups(player)
+        if not groups:
+            return f'Игрок {player} ещё не сыграл ни одной игры'
+        return make_pages(f'Группы игрока {player}', format_groups_table(groups))
+
+    @instrumented
+    async def best_group_message(self, player: Login) -> str:
+        group = await self.individual_stats_controller.get_best_group(player)
+        if group is None:
+            return f'У игрока {player} нет группы с достаточным количеством игр'
+        return make_pages(f'Лучшая группа игрока {player}', format_groups_table([group])).page(0)
+
+
+def make_pages(title: str, table: str) -> MarkdownTablePages:
+    return MarkdownTablePages(table, before=f'{title}:\n```', after='```')
+
+
+def format_groups_table(groups: list[types.PlayerGroupStats]) -> str:
+    return (MarkdownBuilder(new_line_size=1)
+            .table()
+            .with_header(('Группа', 'Побед', 'Игр сыграно'))
+            .with_rows([
+                (', '.join(sorted(g.group)), f'{g.stats.games_won}', f'{g.stats.games_played}')
+                for g in groups
+            ])
+            .build())
+
+
+def format_stats_table(stats: list[types.IndividualStats]) -> str:
+    return (MarkdownBuilder(new_line_size=1)
+            .table()
+            .with_header(('Игрок', 'Побед', 'Игр сыграно'))
+            .with_rows([(p.login, f'{p.games_won}', f'{p.games_played}') for p in stats])
+            .build())
+
+
+def format_ratings_table(ratings: list[types.PlayerRating]) -> str:
+    return (MarkdownBuilder(new_line_size=1)
+            .table()
+            .with_header(('Место', 'Игрок', 'Рейтинг'))
+            .with_rows([(f'{r.place}', r.login, f'{r.rating:.0f}') for r in ratings])
+            .build())
+
+
+def format_rivals_table(rivals: list[types.HeadToHead]) -> str:
+    return (MarkdownBuilder(new_line_size=1)
+            .table()
+            .with_header(('Соперник', 'Игр вместе', 'Побед над ним', 'Поражений от него'))
+            .with_rows([
+                (r.opponent, f'{r.games_played}', f'{r.games_won}', f'{r.games_lost}')
+                for r in rivals
+            ])
+            .build())
+
+
+def format_profile_message(profile: types.PlayerProfile) -> str:
+    rows = []
+    for metric in PROFILE_METRICS:
+        aggregate = profile.metrics[metric]
+        mean = aggregate.total / profile.games
+        # Rounding errors may push the variance of equal values slightly below zero.
+        deviation = math.sqrt(max(aggregate.total_squares / profile.games - mean * mean, 0))
+        rows.append((PROFILE_METRICS_TITLES[metric], f'{mean:.1f}', f'{deviation:.1f}', f'{aggregate.ewma:.1f}'))
+    return (MarkdownBuilder(new_line_size=1)
+            .text('```')
+            .table()
+            .with_header(('Показатель', 'В среднем', 'Разброс', 'Последние игры'))
+            .with_rows(rows)
+            .text('```')
+            .build())
+
+
+PROFILE_METRICS_TITLES = {
+    'apm': 'APM',
+    'research_cancels': 'Отмены исследований',
+    'small_defense_used': 'Малая защита',
+    'ultimate_used': 'Ультимейт',
+}
+PROFILE_APM_PERCENTILES = (('10%', 0.1), ('медиана', 0.5), ('90%', 0.9))
+LEADERBOARD_SIZE = 1000
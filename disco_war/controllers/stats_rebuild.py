@@ -0,0 +1,139 @@
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from disco_war.cache import StatsCache
+from disco_war.metrics import instrumented
+from disco_war.common_types import GroupDescriptor, Login
+from disco_war.controllers.players_controller import patch_login
+from disco_war.periods import PeriodBucket, PeriodsCalendar
+from disco_war.profiles import ProfileAggregation
+from disco_war.ratings import EloRating
+from disco_war.repository import types
+
+
+@dataclass
+class StatsRebuildController:
+    context_manager: types.RepositoryContextManager
+    game_records_repository: types.GameRecordsRepository
+    individual_stats_repository: types.IndividualStatsRepository
+    players_repository: types.PlayersRepository
+    period_stats_repository: types.PeriodStatsRepository
+    ratings_repository: types.RatingsRepository
+    head_to_head_repository: types.HeadToHeadRepository
+    profiles_repository: types.ProfilesRepository
+    stats_cache: StatsCache
+    calendar: PeriodsCalendar
+    rating: EloRating
+    aggregation: ProfileAggregation
+
+    @instrumented
+    async def rebuild(self, batch_size: int = 1000) -> int:
+        async with self.context_manager.start() as c:
+            records = [
+                record
+                async for record in self.game_records_repository.game_records(c, types.AllGameRecordsOptions(batch_size))
+            ]
+            logins = list({p.login for record in records for p in record.players})
+            login_to_normalized_login = dict(zip(
+                logins,
+                await self.players_repository.normalize_players(c, logins),
+            ))
+
+            players_deltas = defaultdict(types.IndividualStatsDelta)
+            groups_deltas = defaultdict(lambda: defaultdict(types.IndividualStatsDelta))
+            periods_deltas = defaultdict(lambda: defaultdict(types.IndividualStatsDelta))
+            ratings = {}
+            head_to_head = defaultdict(lambda: defaultdict(types.HeadToHeadDelta))
+            profiles = defaultdict(types.PlayerProfile)
+            now = time.time()
+            for record in records:
+                add_game_to_deltas(players_deltas, groups_deltas, record, login_to_normalized_login)
+                buckets = [b for b in self.calendar.game_buckets(record.played_at) if b.expires_at is None or b.expires_at > now]
+                add_game_to_period_deltas(periods_deltas, buckets, record, login_to_normalized_login)
+                # Ratings depend on the order of the games, so the records are replayed in the order they were added.
+                rate_game(ratings, self.rating, record, login_to_normalized_login)
+                add_game_to_head_to_head(head_to_head, record, login_to_normalized_login)
+                for player in record.players:
+                    self.aggregation.add(profiles[patch_login(player.login, login_to_normalized_login)], player)
+
+            await self.individual_stats_repository.replace_stats(c, types.ImportIndividualStatsOptions(
+                players=players_deltas,
+                groups=groups_deltas,
+                batch_size=batch_size,
+            ))
+            await self.period_stats_repository.replace_stats(c, types.ImportPeriodStatsOptions(
+                buckets=periods_deltas,
+                batch_size=batch_size,
+            ))
+            await self.ratings_repository.replace_ratings(c, types.ImportRatingsOptions(ratings, batch_size))
+            await self.head_to_head_repository.replace_stats(c, types.ImportHeadToHeadOptions(head_to_head, batch_size))
+            await self.profiles_repository.replace_profiles(c, types.ImportProfilesOptions(profiles, batch_size))
+        await self.stats_cache.invalidate_all()
+        return len(records)
+
+
+def add_game_to_deltas(
+        players_deltas: dict[Login, types.IndividualStatsDelta],
+        groups_deltas: dict[GroupDescriptor, dict[Login, types.IndividualStatsDelta]],
+        record: types.GameRecord,
+        login_to_normalized_login: dict[Login, Login],
+):
+    logins = [patch_login(p.login, login_to_normalized_login) for p in record.players]
+    group_deltas = groups_deltas[GroupDescriptor(frozenset(logins))]
+    for login in logins:
+        players_deltas[login].games_played += 1
+        group_deltas[login].games_played += 1
+    if record.winner is not None:
+        winner = patch_login(record.winner, login_to_normalized_login)
+        players_deltas[winner].games_won += 1
+        group_deltas[winner].games_won += 1
+
+
+def add_game_to_period_deltas(
+        periods_deltas: dict[PeriodBucket, dict[Login, types.IndividualStatsDelta]],
+        buckets: list[PeriodBucket],
+        record: types.GameRecord,
+        login_to_normalized_login: dict[Login, Login],
+):
+    logins = [patch_login(p.login, login_to_normalized_login) for p in record.players]
+    for bucket in buckets:
+        bucket_deltas = periods_deltas[bucket]
+        for login in logins:
+            bucket_deltas[login].games_played += 1
+        if record.winner is not None:
+            bucket_deltas[patch_login(record.winner, login_to_normalized_login)].games_won += 1
+
+
+def rate_game(
+        ratings: dict[Login, float],
+        rating: EloRating,
+        record: types.GameRecord,
+        login_to_normalized_login: dict[Login, Login],
+):
+    if record.winner is None:
+        return
+    logins = [patch_login(p.login, login_to_normalized_login) for p in record.players]
+    current = [ratings.get(login, rating.initial) for login in logins]
+    winner = logins.index(patch_login(record.winner, login_to_normalized_login))
+    for login, player_rating, delta in zip(logins, current, rating.deltas(current, winner)):
+        ratings[login] = player_rating + delta
+
+
+def add_game_to_head_to_head(
+        head_to_head: dict[Login, dict[Login, types.HeadToHeadDelta]],
+        record: types.GameRecord,
+        login_to_normalized_login: dict[Login, Login],
+):
+    logins = [patch_login(p.login, login_to_normalized_login) for p in record.players]
+    winner = patch_login(record.winner, login_to_normalized_login) if record.winner is not None else None
+    for login in logins:
+        for opponent in logins:
+            if opponent == login:
+                continue
+            delta = head_to_head[login][opponent]
+            delta.games_played += 1
+            if login == winner:
+                delta.games_won += 1
+            elif opponent == winner:
+                delta.games_lost += 1
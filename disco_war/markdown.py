@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from collections.abc import Sequence
+
 
 class MarkdownBuilder:
     def __init__(self, new_line_size=2):
@@ -35,14 +37,51 @@ class MarkdownTableBuilderWithHeader:
         self._builder = builder
         self._header = header
 
-    def with_rows(self, rows: list[tuple[str, ...]]) -> MarkdownBuilder:
-        rows_lengths = [max(map(len, column)) for column in zip(*rows, self._header)]
-        rows_formats = [f'%{row_length}s' for row_length in rows_lengths]
-        header_str = f"|{'|'.join(row_format % cell for cell, row_format in zip(self._header, rows_formats))}|"
-        delimiter_str = f"|{'|'.join('-' * row_length for row_length in rows_lengths)}|"
-        rows_str = '\n'.join(
-            f"|{'|'.join(row_format % cell for cell, row_format in zip(row, rows_formats))}|"
-            for row in rows
-        )
-        self._builder.text(f'{header_str}\n{delimiter_str}\n{rows_str}')
+    def with_rows(self, rows: Sequence[tuple[str, ...]]) -> MarkdownBuilder:
+        widths = [len(cell) for cell in self._header]
+        for row in rows:
+            for i, cell in enumerate(row):
+                if len(cell) > widths[i]:
+                    widths[i] = len(cell)
+        rows_formats = [f'%{width}s' for width in widths]
+        lines = [format_row(self._header, rows_formats), f"|{'|'.join('-' * width for width in widths)}|"]
+        lines.extend(format_row(row, rows_formats) for row in rows)
+        if not rows:
+            # Keeps the line break after the delimiter, so the header of an empty table is cut the same way.
+            lines.append('')
+        self._builder.text('\n'.join(lines))
         return self._builder
+
+
+class MarkdownTablePages:
+    # Splits a table into pages of at most max_size characters at row boundaries, with the header on every page. All
+    # lines of the table have the same width, so pages are cut out of it by offsets.
+    def __init__(self, table: str, before: str = '', after: str = '', max_size: int = 2000):
+        space = max_size - len(before) - len(after)
+        self._line_size = table.index('\n') + 1
+        if 3 * self._line_size - 1 > space:
+            # Not even the header and one row fit, so all lines are cut to the width that does.
+            width = max((space - 2) // 3, 0)
+            table = '\n'.join(line[:width] for line in table.split('\n'))
+            self._line_size = width + 1
+        self._header = table[:2 * self._line_size]
+        self._rows = table[2 * self._line_size:]
+        self._before = before
+        self._after = after
+        self._max_size = max_size
+        rows_count = (len(self._rows) + 1) // self._line_size
+        available = space - len(self._header) + 1
+        self.rows_per_page = max(available // self._line_size, 1)
+        self.pages_count = max(-(-rows_count // self.rows_per_page), 1)
+
+    def page(self, page: int) -> str:
+        if not 0 <= page < self.pages_count:
+            raise IndexError(f'Page {page} is out of {self.pages_count} pages')
+        start = page * self.rows_per_page * self._line_size
+        rows = self._rows[start:start + self.rows_per_page * self._line_size - 1]
+        # Only a before and after longer than a page make it longer.
+        return f'{self._before}{self._header}{rows}{self._after}'[:self._max_size]
+
+
+def format_row(row: tuple[str, ...], rows_formats: list[str]) -> str:
+    return f"|{'|'.join(row_format % cell for cell, row_format in zip(row, rows_formats))}|"
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import functools
+import math
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields
+from typing import ParamSpec, TypeVar
+
+from aiohttp import web
+
+
+@dataclass
+class OperationCounters:
+    commands: int = 0
+    pipelines: int = 0
+    round_trips: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...]
+    counts: list[int] = field(init=False)
+    total: float = 0
+    count: int = 0
+
+    def __post_init__(self):
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+@dataclass
+class OperationsRegistry:
+    histograms: dict[tuple[str, str], Histogram] = field(default_factory=dict)
+
+    def observe(self, operation: str, counters: OperationCounters):
+        for counter in COUNTERS:
+            key = (operation, counter)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(BYTES_BUCKETS if counter.startswith('bytes') else COUNT_BUCKETS)
+            self.histograms[key].observe(getattr(counters, counter))
+
+    def means(self) -> dict[str, dict[str, float]]:
+        result = {}
+        for (operation, counter), histogram in self.histograms.items():
+            result.setdefault(operation, {})[counter] = histogram.total / histogram.count
+        return result
+
+    def render(self) -> str:
+        lines = []
+        for counter in COUNTERS:
+            metric = f'disco_war_operation_{counter}'
+            lines.append(f'# TYPE {metric} histogram')
+            for (operation, histogram_counter), histogram in sorted(self.histograms.items()):
+                if histogram_counter != counter:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if math.isinf(bound) else str(bound)
+                    lines.append(f'{metric}_bucket{{operation="{operation}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{operation="{operation}"}} {histogram.total:g}')
+                lines.append(f'{metric}_count{{operation="{operation}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        self.histograms.clear()
+
+
+@dataclass
+class MetricsServer:
+    port: int
+    host: str = '0.0.0.0'
+    registry: OperationsRegistry = field(default_factory=lambda: REGISTRY)
+    _runner: web.AppRunner | None = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain')
+
+
+P = ParamSpec('P')
+R = TypeVar('R')
+
+
+def instrumented(method: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    operation = method.__qualname__
+
+    @functools.wraps(method)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        counters = OperationCounters()
+        # Nested operations are counted both on their own and as a part of the enclosing ones.
+        token = current_operations.set((*current_operations.get(), counters))
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            current_operations.reset(token)
+            REGISTRY.observe(operation, counters)
+
+    return wrapper
+
+
+def detach():
+    # Tasks copy the context of the operation that started them, which may be over before they are done.
+    current_operations.set(())
+
+
+def count(commands: int = 0, pipelines: int = 0, round_trips: int = 0, bytes_sent: int = 0, bytes_received: int = 0):
+    for counters in current_operations.get():
+        counters.commands += commands
+        counters.pipelines += pipelines
+        counters.round_trips += round_trips
+        counters.bytes_sent += bytes_sent
+        counters.bytes_received += bytes_received
+
+
+COUNTERS = tuple(f.name for f in fields(OperationCounters))
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, math.inf)
+BYTES_BUCKETS = (0, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, math.inf)
+
+REGISTRY = OperationsRegistry()
+current_operations: ContextVar[tuple[OperationCounters, ...]] = ContextVar('current_operations', default=())
@@ -1,8 +1,9 @@
 import sys
+import zlib
 from collections import Counter, defaultdict
 from collections.abc import Callable
 from dataclasses import dataclass
-from io import IOBase
+from io import BytesIO, IOBase
 import re
 
 from disco_war import w3g
@@ -126,6 +127,48 @@ class ReplayFileProcessing:
         return {player_id: count / minutes for player_id, count in count.items()}
 
 
+class ReplayPrefix(w3g.File):
+    def __init__(self, prefix: bytes):
+        self.f = BytesIO(prefix)
+        self._read_header()
+
+    def game_id(self) -> GameID | None:
+        f = self.f
+        self.loc = self.header_size
+        block_header_size = REFORGED_BLOCK_HEADER_SIZE if self.is_reforged else BLOCK_HEADER_SIZE
+        data = b''
+        for _ in range(self.nblocks):
+            block_header = f.read(block_header_size)
+            if len(block_header) < block_header_size:
+                return None
+            block_size = w3g.b2i(block_header[:w3g.WORD])
+            decompressed_offset = 2 * w3g.WORD if self.is_reforged else w3g.WORD
+            block_size_decomp = w3g.b2i(block_header[decompressed_offset:decompressed_offset + w3g.WORD])
+            raw = f.read(block_size)
+            if len(raw) < block_size:
+                return None
+            data += zlib.decompressobj().decompress(raw, block_size_decomp)
+            try:
+                offset = self._parse_startup(data)
+            except (IndexError, AssertionError, ValueError, ZeroDivisionError):
+                continue
+            if offset <= len(data):
+                return GameID(int.from_bytes(self.random_seed, sys.byteorder))
+        return None
+
+
+def read_game_id(prefix: bytes) -> GameID | None:
+    if len(prefix) < REPLAY_HEADER_SIZE:
+        return None
+    try:
+        replay = ReplayPrefix(prefix)
+    except ValueError:
+        return None
+    if len(prefix) < replay.header_size:
+        return None
+    return replay.game_id()
+
+
 def format_clock(clock: int) -> str:
     clock //= 1000
     hours = clock // HOUR
@@ -135,6 +178,10 @@ def format_clock(clock: int) -> str:
     return f'{(str(hours) + ":") if hours else ""}{minutes:02}:{seconds:02}'
 
 
+REPLAY_HEADER_SIZE = 0x44
+BLOCK_HEADER_SIZE = 8
+REFORGED_BLOCK_HEADER_SIZE = 12
+
 HOUR = 3600
 MINUTE = 60
 SURRENDER_MESSAGES = frozenset({'-END'})
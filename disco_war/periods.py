@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from enum import Enum
+
+
+class Period(Enum):
+    DAY = 'd'
+    WEEK = 'w'
+    MONTH = 'm'
+    SEASON = 's'
+
+
+@dataclass(frozen=True)
+class PeriodBucket:
+    period: Period
+    start: date
+    # Unix time after which the bucket may be gone, buckets of long periods are kept forever.
+    expires_at: int | None = field(default=None, compare=False)
+
+    @property
+    def id(self) -> str:
+        return f'{self.period.value}{self.start.isoformat()}'
+
+
+class UnknownPeriod(Exception):
+    def __init__(self, query: str):
+        self.query = query
+
+    def __str__(self):
+        return f'Unknown period: {self.query}!'
+
+
+@dataclass
+class PeriodsCalendar:
+    # Seasons start in January and then every season_months months, all periods are in UTC.
+    season_months: int = int(os.getenv('SEASON_MONTHS', 3))
+    max_window_days: int = int(os.getenv('STATS_WINDOW_DAYS', 90))
+
+    def game_buckets(self, played_at: float) -> list[PeriodBucket]:
+        day = datetime.fromtimestamp(played_at, timezone.utc).date()
+        return [self.bucket(period, day) for period in Period]
+
+    def bucket(self, period: Period, day: date) -> PeriodBucket:
+        match period:
+            case Period.DAY:
+                start = day
+            case Period.WEEK:
+                start = day - timedelta(days=day.weekday())
+            case Period.MONTH:
+                start = day.replace(day=1)
+            case Period.SEASON:
+                start = day.replace(month=(day.month - 1) // self.season_months * self.season_months + 1, day=1)
+        expires_at = None
+        if period in EXPIRING_PERIODS_DAYS:
+            # Kept as long as a window of max_window_days may still need the bucket.
+            end = start + timedelta(days=EXPIRING_PERIODS_DAYS[period] + self.max_window_days)
+            expires_at = int(datetime.combine(end, time(), timezone.utc).timestamp())
+        return PeriodBucket(period, start, expires_at)
+
+    def window(self, days: int, today: date) -> list[PeriodBucket]:
+        buckets = []
+        day = today - timedelta(days=days - 1)
+        while day <= today:
+            if day.weekday() == 0 and day + timedelta(days=6) <= today:
+                buckets.append(self.bucket(Period.WEEK, day))
+                day += timedelta(days=7)
+            else:
+                buckets.append(self.bucket(Period.DAY, day))
+                day += timedelta(days=1)
+        return buckets
+
+    def parse(self, query: str, now: float) -> tuple[str, list[PeriodBucket]]:
+        today = datetime.fromtimestamp(now, timezone.utc).date()
+        query = query.strip().lower()
+        if query in NAMED_PERIODS:
+            bucket = self.bucket(NAMED_PERIODS[query], today)
+            return f'{PERIODS_TITLES[bucket.period]} с {bucket.start:%d.%m.%Y}', [bucket]
+        window_match = window_re.fullmatch(query)
+        if window_match is None or not 0 < int(window_match.group(1)) <= self.max_window_days:
+            raise UnknownPeriod(query)
+        days = int(window_match.group(1))
+        return f'последние {days} дн.', self.window(days, today)
+
+
+EXPIRING_PERIODS_DAYS = {Period.DAY: 1, Period.WEEK: 7}
+NAMED_PERIODS = {'season': Period.SEASON, 'month': Period.MONTH, 'week': Period.WEEK, 'today': Period.DAY}
+PERIODS_TITLES = {Period.SEASON: 'сезон', Period.MONTH: 'месяц', Period.WEEK: 'неделю', Period.DAY: 'день'}
+
+window_re = re.compile(r'(\d+)d')
@@ -0,0 +1,60 @@
+import math
+import os
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+from disco_war.repository.types import GamePlayerRecord, MetricAggregate, PlayerProfile
+
+
+@dataclass
+class ProfileAggregation:
+    # APM percentiles come from a sketch of logarithmic buckets, every percentile is off by at most sketch_accuracy
+    # of its value. PROFILE_GAME_SCRIPT of the Redis repository does the same in Lua.
+    ewma_alpha: float = float(os.getenv('PROFILE_EWMA_ALPHA', 0.1))
+    sketch_accuracy: float = float(os.getenv('APM_SKETCH_ACCURACY', 0.01))
+
+    @property
+    def gamma(self) -> float:
+        return (1 + self.sketch_accuracy) / (1 - self.sketch_accuracy)
+
+    def add(self, profile: PlayerProfile, player: GamePlayerRecord):
+        profile.games += 1
+        for metric in PROFILE_METRICS:
+            value = getattr(player, metric)
+            aggregate = profile.metrics.setdefault(metric, MetricAggregate())
+            aggregate.total += value
+            aggregate.total_squares += value * value
+            aggregate.ewma = value if aggregate.ewma is None else aggregate.ewma + self.ewma_alpha * (value - aggregate.ewma)
+        bucket = self.sketch_bucket(player.apm)
+        profile.apm_sketch[bucket] = profile.apm_sketch.get(bucket, 0) + 1
+
+    def merge(self, profile: PlayerProfile, other: PlayerProfile):
+        # The order of the games is lost, so the EWMA is the mean of both weighted by their games until a rebuild.
+        for metric, other_aggregate in other.metrics.items():
+            aggregate = profile.metrics.setdefault(metric, MetricAggregate())
+            aggregate.total += other_aggregate.total
+            aggregate.total_squares += other_aggregate.total_squares
+            if aggregate.ewma is None:
+                aggregate.ewma = other_aggregate.ewma
+            elif other_aggregate.ewma is not None:
+                weighted = aggregate.ewma * profile.games + other_aggregate.ewma * other.games
+                aggregate.ewma = weighted / (profile.games + other.games)
+        profile.games += other.games
+        for bucket, count in other.apm_sketch.items():
+            profile.apm_sketch[bucket] = profile.apm_sketch.get(bucket, 0) + count
+
+    def sketch_bucket(self, value: float) -> int:
+        # APM below 1 is counted as 1, so there are no buckets for zero and negative logarithms.
+        return math.ceil(math.log(max(value, 1)) / math.log(self.gamma))
+
+    def quantile(self, sketch: Mapping[int, int], q: float) -> float | None:
+        rank = q * (sum(sketch.values()) - 1)
+        seen = 0
+        for bucket in sorted(sketch):
+            seen += sketch[bucket]
+            if seen > rank:
+                return 2 * self.gamma ** bucket / (self.gamma + 1)
+        return None
+
+
+PROFILE_METRICS = ('apm', 'research_cancels', 'small_defense_used', 'ultimate_used')
@@ -0,0 +1,24 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass
+class EloRating:
+    # Free-for-all games only have a winner, so the winner is rated as having beaten every other player of the game
+    # and a game moves at most k points in total. RATE_GAME_SCRIPT of the Redis repository does the same in Lua.
+    k: float = float(os.getenv('RATING_K', 32))
+    initial: float = float(os.getenv('RATING_INITIAL', 1500))
+
+    def deltas(self, ratings: list[float], winner: int) -> list[float]:
+        deltas = [0.0] * len(ratings)
+        for i, rating in enumerate(ratings):
+            if i != winner:
+                expected = 1 / (1 + 10 ** ((rating - ratings[winner]) / 400))
+                change = self.k * (1 - expected) / (len(ratings) - 1)
+                deltas[i] -= change
+                deltas[winner] += change
+        return deltas
+
+    def merge(self, rating: float, alias_rating: float) -> float:
+        # Ratings depend on the order of the games, so an alias only passes on what it won or lost until a rebuild.
+        return rating + alias_rating - self.initial
@@ -0,0 +1,23 @@
+import asyncio
+import time
+
+from disco_war.configuration import make_configuration
+
+
+async def rebuild_stats():
+    configuration = make_configuration()
+    await configuration.start()
+    started = time.perf_counter()
+    try:
+        games = await configuration.stats_rebuild_controller.rebuild()
+    finally:
+        await configuration.close()
+    print(f'Rebuilt stats from {games} games in {time.perf_counter() - started:.2f}s')
+
+
+def main():
+    asyncio.run(rebuild_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections.abc import Iterable, Mapping
+
+from disco_war.common_types import Login, GroupDescriptor, GameName
+from disco_war.repository import types
+
+
+def choose_best_group(groups: Iterable[types.PlayerGroupStats], min_games_played: int) -> types.PlayerGroupStats | None:
+    # The same order as SELECT_BEST_GROUP of the SQLite repository, ties are broken by the dumped group.
+    return min(
+        (g for g in groups if g.stats.games_played >= max(min_games_played, 1)),
+        key=lambda g: (-g.stats.games_won / g.stats.games_played, -g.stats.games_played, dump_group(g.group)),
+        default=None,
+    )
+
+
+def serialize_group(group: GroupDescriptor) -> str:
+    return hashlib.blake2b('\n'.join(sorted(group)).encode(), digest_size=GROUP_ID_SIZE).hexdigest()
+
+
+def pack_field(login: Login, stats_field: str) -> str:
+    return f'{login}:{stats_field}'
+
+
+def dump_group(group: GroupDescriptor) -> str:
+    return json.dumps(sorted(group), ensure_ascii=False)
+
+
+def load_group(raw: str) -> GroupDescriptor:
+    return GroupDescriptor(frozenset(json.loads(raw)))
+
+
+def dump_profile(profile: types.PlayerProfile) -> dict[str, str | int]:
+    mapping = {PROFILE_GAMES_FIELD: profile.games}
+    for metric, aggregate in profile.metrics.items():
+        metric_field = PROFILE_METRIC_FIELDS[metric]
+        mapping[pack_field(metric_field, PROFILE_TOTAL_FIELD)] = repr(aggregate.total)
+        mapping[pack_field(metric_field, PROFILE_SQUARES_FIELD)] = repr(aggregate.total_squares)
+        mapping[pack_field(metric_field, PROFILE_EWMA_FIELD)] = repr(aggregate.ewma)
+    for bucket, count in profile.apm_sketch.items():
+        mapping[pack_field(PROFILE_SKETCH_FIELD, str(bucket))] = count
+    return mapping
+
+
+def load_profile(raw: Mapping[str, str]) -> types.PlayerProfile:
+    profile = types.PlayerProfile()
+    metrics = {metric_field: metric for metric, metric_field in PROFILE_METRIC_FIELDS.items()}
+    for packed_field, value in raw.items():
+        if packed_field == PROFILE_GAMES_FIELD:
+            profile.games = int(value)
+            continue
+        prefix, suffix = packed_field.split(':', 1)
+        if prefix == PROFILE_SKETCH_FIELD:
+            profile.apm_sketch[int(suffix)] = int(value)
+            continue
+        aggregate = profile.metrics.setdefault(metrics[prefix], types.MetricAggregate())
+        if suffix == PROFILE_TOTAL_FIELD:
+            aggregate.total = float(value)
+        elif suffix == PROFILE_SQUARES_FIELD:
+            aggregate.total_squares = float(value)
+        else:
+            aggregate.ewma = float(value)
+    return profile
+
+
+def dump_game_record(record: types.GameRecord) -> str:
+    logins = [p.login for p in record.players]
+    return json.dumps([
+        record.id,
+        round(record.played_at),
+        record.replay_length,
+        logins.index(record.winner) if record.winner is not None else None,
+        [[p.login, round(p.apm, 2), p.research_cancels, p.small_defense_used, p.ultimate_used] for p in record.players],
+    ], ensure_ascii=False, separators=(',', ':'))
+
+
+def load_game_record(raw: str, game_name: GameName) -> types.GameRecord:
+    game_id, played_at, replay_length, winner_index, raw_players = json.loads(raw)
+    players = [types.GamePlayerRecord(Login(login), *metrics) for login, *metrics in raw_players]
+    return types.GameRecord(
+        id=game_id,
+        players=players,
+        winner=players[winner_index].login if winner_index is not None else None,
+        replay_length=replay_length,
+        played_at=played_at,
+        game_name=game_name,
+    )
+
+
+# Group ids and profile fields are the same in every storage, SQLite stores profiles as the JSON of the Redis hashes.
+GROUP_ID_SIZE = 8
+PROFILE_GAMES_FIELD = 'n'
+PROFILE_TOTAL_FIELD = 's'
+PROFILE_SQUARES_FIELD = 'q'
+PROFILE_EWMA_FIELD = 'e'
+PROFILE_SKETCH_FIELD = 'apm'
+PROFILE_METRIC_FIELDS = {'apm': 'a', 'research_cancels': 'rc', 'small_defense_used': 'sd', 'ultimate_used': 'u'}
@@ -0,0 +1,398 @@
+from __future__ import annotations
+
+import copy
+import dataclasses
+from collections import defaultdict
+from collections.abc import AsyncIterator, Callable, Iterable
+from dataclasses import dataclass, field
+from typing import AsyncContextManager
+
+from disco_war.repository import types
+from disco_war.repository.common import choose_best_group
+from disco_war.common_types import Login, GroupDescriptor, GameName, GameID
+from disco_war.periods import PeriodBucket
+from disco_war.profiles import ProfileAggregation
+from disco_war.ratings import EloRating
+
+
+class InMemoryContext(AsyncContextManager):
+    def __init__(self):
+        self.writes: list[Callable[[], None]] = []
+        self.on_commit: list[types.CommitCallback] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        # Like the Redis pipeline, writes are applied on exit and dropped on error.
+        if exc_value is None:
+            for write in self.writes:
+                write()
+            for callback in self.on_commit:
+                await callback()
+
+
+class InMemoryRepositoryContextManager:
+    def start(self, buffered: bool = False) -> InMemoryContext:
+        return InMemoryContext()
+
+
+@dataclass
+class InMemoryStorage:
+    stats: defaultdict[GameName, dict[Login, types.IndividualStatsDelta]] = field(
+        default_factory=lambda: defaultdict(dict),
+    )
+    group_stats: defaultdict[GameName, dict[GroupDescriptor, dict[Login, types.IndividualStatsDelta]]] = field(
+        default_factory=lambda: defaultdict(dict),
+    )
+    player_groups: defaultdict[GameName, defaultdict[Login, set[GroupDescriptor]]] = field(
+        default_factory=lambda: defaultdict(lambda: defaultdict(set)),
+    )
+    period_stats: defaultdict[GameName, defaultdict[PeriodBucket, dict[Login, types.IndividualStatsDelta]]] = field(
+        default_factory=lambda: defaultdict(lambda: defaultdict(dict)),
+    )
+    ratings: defaultdict[GameName, dict[Login, float]] = field(default_factory=lambda: defaultdict(dict))
+    head_to_head: defaultdict[GameName, defaultdict[Login, defaultdict[Login, types.HeadToHeadDelta]]] = field(
+        default_factory=lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(types.HeadToHeadDelta))),
+    )
+    profiles: defaultdict[GameName, dict[Login, types.PlayerProfile]] = field(default_factory=lambda: defaultdict(dict))
+    games: defaultdict[GameName, set[GameID]] = field(default_factory=lambda: defaultdict(set))
+    game_records: defaultdict[GameName, list[types.GameRecord]] = field(default_factory=lambda: defaultdict(list))
+    aliases: dict[Login, Login] = field(default_factory=dict)
+
+
+@dataclass
+class InMemoryIndividualStatsRepository:
+    storage: InMemoryStorage
+
+    async def add_game_played_for_player(self, context: InMemoryContext, options: types.ChangeIndividualStatsOptions):
+        stats = self.storage.stats[options.game_name]
+        context.writes.append(lambda: add_to_delta(stats, options.player, options.amount, 0))
+
+    async def add_game_won_for_player(self, context: InMemoryContext, options: types.ChangeIndividualStatsOptions):
+        stats = self.storage.stats[options.game_name]
+        context.writes.append(lambda: add_to_delta(stats, options.player, 0, options.amount))
+
+    async def add_game_played_in_group_for_player(self, context: InMemoryContext, options: types.ChangeIndividualGroupStatsOptions):
+        context.writes.append(lambda: self._add_group_delta(options, options.amount, 0))
+
+    async def add_game_won_in_group_for_player(self, context: InMemoryContext, options: types.ChangeIndividualGroupStatsOptions):
+        context.writes.append(lambda: self._add_group_delta(options, 0, options.amount))
+
+    async def stats(self, context: InMemoryContext, options: types.AllIndividualStatsOptions) -> list[types.IndividualStats]:
+        return to_stats(self.storage.stats[options.game_name])
+
+    async def stats_for_player(self, context: InMemoryContext, options: types.OneIndividualStatsOptions) -> types.IndividualStats | None:
+        delta = self.storage.stats[options.game_name].get(options.player)
+        if delta is None:
+            return None
+        return types.IndividualStats(options.player, delta.games_played, delta.games_won)
+
+    async def group_stats(self, context: InMemoryContext, options: types.GroupIndividualStatsOptions):
+        return to_stats(self.storage.group_stats[options.game_name].get(options.group, {}))
+
+    async def groups_stats_for_player(
+            self,
+            context: InMemoryContext,
+            options: types.OneIndividualStatsOptions,
+    ) -> list[types.PlayerGroupStats]:
+        group_stats = self.storage.group_stats[options.game_name]
+        result = []
+        for group in self.storage.player_groups[options.game_name].get(options.player, ()):
+            delta = group_stats[group].get(options.player, types.IndividualStatsDelta())
+            result.append(types.PlayerGroupStats(
+                group,
+                types.IndividualStats(options.player, delta.games_played, delta.games_won),
+            ))
+        return result
+
+    async def best_group_for_player(
+            self,
+            context: InMemoryContext,
+            options: types.BestGroupOptions,
+    ) -> types.PlayerGroupStats | None:
+        groups = await self.groups_stats_for_player(
+            context,
+            types.OneIndividualStatsOptions(options.player, options.game_name),
+        )
+        return choose_best_group(groups, options.min_games_played)
+
+    async def import_stats(self, context: InMemoryContext, options: types.ImportIndividualStatsOptions):
+        stats = self.storage.stats[options.game_name]
+        for player, delta in options.players.items():
+            add_to_delta(stats, player, delta.games_played, delta.games_won)
+        for group, players in options.groups.items():
+            for player, delta in players.items():
+                self._add_group_delta(
+                    types.ChangeIndividualGroupStatsOptions(player, group, game_name=options.game_name),
+                    delta.games_played,
+                    delta.games_won,
+                )
+
+    async def replace_stats(self, context: InMemoryContext, options: types.ImportIndividualStatsOptions):
+        for storage in (self.storage.stats, self.storage.group_stats, self.storage.player_groups):
+            storage.pop(options.game_name, None)
+        await self.import_stats(context, options)
+
+    async def merge_players(self, context: InMemoryContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if renames:
+            context.writes.append(lambda: self._merge_players(options.game_name, renames))
+
+    async def remove_stats(self, context: InMemoryContext, options: types.OneIndividualStatsOptions):
+        context.writes.append(lambda: self.storage.stats[options.game_name].pop(options.player, None))
+
+    def _add_group_delta(self, options: types.ChangeIndividualGroupStatsOptions, games_played: int, games_won: int):
+        add_to_delta(
+            self.storage.group_stats[options.game_name].setdefault(options.group, {}),
+            options.player,
+            games_played,
+            games_won,
+        )
+        self.storage.player_groups[options.game_name][options.player].add(options.group)
+
+    def _merge_players(self, game_name: GameName, renames: dict[Login, Login]):
+        stats = self.storage.stats[game_name]
+        for alias, player in renames.items():
+            if alias in stats:
+                delta = stats.pop(alias)
+                add_to_delta(stats, player, delta.games_played, delta.games_won)
+
+        groups_stats = self.storage.group_stats[game_name]
+        player_groups = self.storage.player_groups[game_name]
+        for group in set().union(*(player_groups.get(alias, ()) for alias in renames)):
+            new_group = GroupDescriptor(frozenset(renames.get(m, m) for m in group))
+            new_group_stats = groups_stats.setdefault(new_group, {})
+            for login, delta in groups_stats.pop(group, {}).items():
+                add_to_delta(new_group_stats, renames.get(login, login), delta.games_played, delta.games_won)
+            for member in group:
+                if member in player_groups:
+                    player_groups[member].discard(group)
+                player_groups[renames.get(member, member)].add(new_group)
+        for alias in renames:
+            player_groups.pop(alias, None)
+
+
+@dataclass
+class InMemoryPeriodStatsRepository:
+    storage: InMemoryStorage
+
+    async def add_game(self, context: InMemoryContext, options: types.AddPeriodGameOptions):
+        context.writes.append(lambda: self._add_game(options))
+
+    async def stats(self, context: InMemoryContext, options: types.PeriodStatsOptions) -> list[types.IndividualStats]:
+        period_stats = self.storage.period_stats[options.game_name]
+        deltas = {}
+        for bucket in options.buckets:
+            for login, delta in period_stats.get(bucket, {}).items():
+                add_to_delta(deltas, login, delta.games_played, delta.games_won)
+        return to_stats(deltas)
+
+    async def replace_stats(self, context: InMemoryContext, options: types.ImportPeriodStatsOptions):
+        period_stats = self.storage.period_stats[options.game_name]
+        period_stats.clear()
+        for bucket, players in options.buckets.items():
+            for login, delta in players.items():
+                add_to_delta(period_stats[bucket], login, delta.games_played, delta.games_won)
+
+    def _add_game(self, options: types.AddPeriodGameOptions):
+        period_stats = self.storage.period_stats[options.game_name]
+        for bucket in options.buckets:
+            for player in options.players:
+                add_to_delta(period_stats[bucket], player, 1, 0)
+            if options.winner is not None:
+                add_to_delta(period_stats[bucket], options.winner, 0, 1)
+
+
+@dataclass
+class InMemoryRatingsRepository:
+    storage: InMemoryStorage
+    rating: EloRating
+
+    async def add_game(self, context: InMemoryContext, options: types.RateGameOptions):
+        if options.winner is not None:
+            context.writes.append(lambda: self._add_game(options))
+
+    async def leaderboard(self, context: InMemoryContext, options: types.LeaderboardOptions) -> list[types.PlayerRating]:
+        ratings = sort_ratings(self.storage.ratings[options.game_name])
+        return [
+            types.PlayerRating(login, rating, options.offset + i + 1)
+            for i, (login, rating) in enumerate(ratings[options.offset:options.offset + options.limit])
+        ]
+
+    async def rating_for_player(self, context: InMemoryContext, options: types.OnePlayerRatingOptions) -> types.PlayerRating | None:
+        ratings = self.storage.ratings[options.game_name]
+        if options.player not in ratings:
+            return None
+        place = [login for login, _ in sort_ratings(ratings)].index(options.player) + 1
+        return types.PlayerRating(options.player, ratings[options.player], place)
+
+    async def replace_ratings(self, context: InMemoryContext, options: types.ImportRatingsOptions):
+        self.storage.ratings[options.game_name] = dict(options.ratings)
+
+    async def merge_players(self, context: InMemoryContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if renames:
+            context.writes.append(lambda: self._merge_players(options.game_name, renames))
+
+    def _merge_players(self, game_name: GameName, renames: dict[Login, Login]):
+        ratings = self.storage.ratings[game_name]
+        for alias, player in renames.items():
+            if alias in ratings:
+                ratings[player] = self.rating.merge(ratings.get(player, self.rating.initial), ratings.pop(alias))
+
+    def _add_game(self, options: types.RateGameOptions):
+        ratings = self.storage.ratings[options.game_name]
+        current = [ratings.get(p, self.rating.initial) for p in options.players]
+        for player, rating, delta in zip(options.players, current, self.rating.deltas(current, options.players.index(options.winner))):
+            ratings[player] = rating + delta
+
+
+@dataclass
+class InMemoryHeadToHeadRepository:
+    storage: InMemoryStorage
+
+    async def add_game(self, context: InMemoryContext, options: types.HeadToHeadGameOptions):
+        context.writes.append(lambda: self._add_game(options))
+
+    async def rivals(self, context: InMemoryContext, options: types.RivalsOptions) -> list[types.HeadToHead]:
+        opponents = self.storage.head_to_head[options.game_name].get(options.player, {})
+        return [
+            types.HeadToHead(opponent, delta.games_played, delta.games_won, delta.games_lost)
+            for opponent, delta in opponents.items()
+        ]
+
+    async def replace_stats(self, context: InMemoryContext, options: types.ImportHeadToHeadOptions):
+        head_to_head = self.storage.head_to_head[options.game_name]
+        head_to_head.clear()
+        for player, opponents in options.players.items():
+            for opponent, delta in opponents.items():
+                head_to_head[player][opponent] = dataclasses.replace(delta)
+
+    async def merge_players(self, context: InMemoryContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if renames:
+            context.writes.append(lambda: self._merge_players(options.game_name, renames))
+
+    def _merge_players(self, game_name: GameName, renames: dict[Login, Login]):
+        head_to_head = self.storage.head_to_head[game_name]
+        for player in list(head_to_head):
+            for opponent in list(head_to_head[player]):
+                new_player, new_opponent = renames.get(player, player), renames.get(opponent, opponent)
+                if (new_player, new_opponent) == (player, opponent):
+                    continue
+                delta = head_to_head[player].pop(opponent)
+                if new_player != new_opponent:
+                    merged = head_to_head[new_player][new_opponent]
+                    merged.games_played += delta.games_played
+                    merged.games_won += delta.games_won
+                    merged.games_lost += delta.games_lost
+        for alias in renames:
+            head_to_head.pop(alias, None)
+
+    def _add_game(self, options: types.HeadToHeadGameOptions):
+        head_to_head = self.storage.head_to_head[options.game_name]
+        for player in options.players:
+            for opponent in options.players:
+                if opponent != player:
+                    add_to_head_to_head(head_to_head[player][opponent], player, opponent, options.winner)
+
+
+@dataclass
+class InMemoryProfilesRepository:
+    storage: InMemoryStorage
+    aggregation: ProfileAggregation
+
+    async def add_game(self, context: InMemoryContext, options: types.ProfileGameOptions):
+        context.writes.append(lambda: self._add_game(options))
+
+    async def profile(self, context: InMemoryContext, options: types.OneProfileOptions) -> types.PlayerProfile | None:
+        profile = self.storage.profiles[options.game_name].get(options.player)
+        return copy.deepcopy(profile)
+
+    async def replace_profiles(self, context: InMemoryContext, options: types.ImportProfilesOptions):
+        self.storage.profiles[options.game_name] = copy.deepcopy(dict(options.profiles))
+
+    async def merge_players(self, context: InMemoryContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if renames:
+            context.writes.append(lambda: self._merge_players(options.game_name, renames))
+
+    def _merge_players(self, game_name: GameName, renames: dict[Login, Login]):
+        profiles = self.storage.profiles[game_name]
+        for alias, player in renames.items():
+            if alias in profiles:
+                self.aggregation.merge(profiles.setdefault(player, types.PlayerProfile()), profiles.pop(alias))
+
+    def _add_game(self, options: types.ProfileGameOptions):
+        profiles = self.storage.profiles[options.game_name]
+        for player in options.players:
+            self.aggregation.add(profiles.setdefault(player.login, types.PlayerProfile()), player)
+
+
+@dataclass
+class InMemoryGamesRepository:
+    storage: InMemoryStorage
+
+    async def add_played_game(self, context: InMemoryContext, options: types.GameOptions) -> types.AddGameResults:
+        games = self.storage.games[options.game_name]
+        if options.id in games:
+            return types.AddGameResults(types.AddGameStatus.DUPLICATE)
+        games.add(options.id)
+        if options.record is not None:
+            record = options.record
+            context.writes.append(lambda: self.storage.game_records[record.game_name].append(record))
+        return types.AddGameResults(types.AddGameStatus.ADDED)
+
+    async def is_played_game(self, context: InMemoryContext, options: types.GameOptions) -> bool:
+        return options.id in self.storage.games[options.game_name]
+
+
+@dataclass
+class InMemoryGameRecordsRepository:
+    storage: InMemoryStorage
+
+    async def game_records(
+            self,
+            context: InMemoryContext,
+            options: types.AllGameRecordsOptions,
+    ) -> AsyncIterator[types.GameRecord]:
+        for record in list(self.storage.game_records[options.game_name]):
+            yield record
+
+
+@dataclass
+class InMemoryPlayersRepository:
+    storage: InMemoryStorage
+
+    async def add_alias(self, context: InMemoryContext, options: types.AddPlayerAliasOptions):
+        context.writes.append(lambda: self.storage.aliases.update({options.alias: options.login}))
+
+    async def add_aliases(self, context: InMemoryContext, options: types.AddPlayerAliasesOptions):
+        context.writes.append(lambda: self.storage.aliases.update(options.aliases))
+
+    async def normalize_players(self, context: InMemoryContext, players: Iterable[Login]) -> Iterable[Login | None]:
+        return [self.storage.aliases.get(p) for p in players]
+
+
+def add_to_delta(deltas: dict[Login, types.IndividualStatsDelta], player: Login, games_played: int, games_won: int):
+    delta = deltas.setdefault(player, types.IndividualStatsDelta())
+    delta.games_played += games_played
+    delta.games_won += games_won
+
+
+def to_stats(deltas: dict[Login, types.IndividualStatsDelta]) -> list[types.IndividualStats]:
+    return [types.IndividualStats(login, delta.games_played, delta.games_won) for login, delta in deltas.items()]
+
+
+def sort_ratings(ratings: dict[Login, float]) -> list[tuple[Login, float]]:
+    # The order of ZREVRANGE, ties go in reverse order of logins.
+    return sorted(ratings.items(), key=lambda item: (item[1], item[0]), reverse=True)
+
+
+def add_to_head_to_head(delta: types.HeadToHeadDelta, player: Login, opponent: Login, winner: Login | None):
+    delta.games_played += 1
+    if player == winner:
+        delta.games_won += 1
+    elif opponent == winner:
+        delta.games_lost += 1
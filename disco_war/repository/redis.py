@@ -1,45 +1,382 @@
 from __future__ import annotations
 
+import asyncio
+import copy
+import dataclasses
+import hashlib
+import json
+import logging
+import math
 import os
-from collections.abc import Iterable
-from dataclasses import dataclass
-from typing import AsyncContextManager, Protocol
+import uuid
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import AsyncIterator, Generator, Iterable, Iterator, Mapping
+from dataclasses import dataclass, field
+from itertools import chain, islice
+from typing import AsyncContextManager, Protocol, TypeVar
 
 import redis.asyncio as redis
+from redis.asyncio.cluster import ClusterPipeline
+from redis.asyncio.connection import Connection, SSLConnection
+from redis.commands.core import AsyncScript
+from redis.crc import key_slot
+from redis.exceptions import NoScriptError
 
+from disco_war import metrics
+from disco_war.profiles import PROFILE_METRICS, ProfileAggregation
+from disco_war.ratings import EloRating
 from disco_war.repository import types
-from disco_war.common_types import Login, GroupDescriptor, GameName
+from disco_war.repository.common import (
+    PROFILE_METRIC_FIELDS,
+    choose_best_group,
+    dump_game_record,
+    dump_group,
+    dump_profile,
+    load_game_record,
+    load_group,
+    load_profile,
+    pack_field,
+    serialize_group,
+)
+from disco_war.common_types import Login, GroupDescriptor, GameName, SURVIVAL_CHAOS
 
 
 class RedisContext(AsyncContextManager):
-    def __init__(self, r: redis.Redis):
-        self.p = r.pipeline()
+    def __init__(
+            self,
+            r: redis.Redis,
+            transactional: bool = False,
+            replica: redis.Redis | None = None,
+            replica_wait_timeout: int | None = None,
+            cache: ClientSideCache | None = None,
+            buffer: WriteBehindBuffer | None = None,
+            buffered: bool = False,
+    ):
+        self.r = r
+        self.replica = replica if replica is not None else r
+        if cache is not None:
+            self.replica = cache.client(self.replica)
+        self.transactional = transactional
+        self.replica_wait_timeout = replica_wait_timeout if replica is not None else None
+        self.buffer = buffer
+        self.buffered = buffered
+        self.on_commit: list[types.CommitCallback] = []
+        self._pipeline = r.pipeline(transaction=transactional)
+
+    @property
+    def p(self) -> redis.client.Pipeline:
+        # A watching pipeline runs commands right away until MULTI, while writes always have to be queued.
+        if self.transactional and self._pipeline.watching and not self._pipeline.explicit_transaction:
+            self._pipeline.multi()
+        return self._pipeline
+
+    async def watch(self, *keys: str):
+        # Only transactional contexts watch, the keys have to be watched before they are read and before any write.
+        if not self.transactional or not keys:
+            return
+        if self._pipeline.explicit_transaction or self._pipeline.command_stack:
+            raise RuntimeError('Keys can only be watched before the first write of the context')
+        await self._pipeline.watch(*keys)
 
     async def __aenter__(self):
+        if self.buffer is not None and not self.buffered:
+            await self.buffer.flush()
         return self
 
+    def begin_transaction(self):
+        # Cluster pipelines can't run MULTI/EXEC, so their writes stay a plain pipeline.
+        if isinstance(self._pipeline, ClusterPipeline):
+            return
+        if not self._pipeline.is_transaction and not self._pipeline.explicit_transaction:
+            self._pipeline.multi()
+
     async def __aexit__(self, exc_type, exc_value, traceback):
-        if exc_value is None:
-            await self.p.execute()
+        if exc_value is not None:
+            await self._pipeline.reset()
+            return
+        if self.buffered and self.buffer is not None and self._pipeline.command_stack:
+            commands = [args for args, _ in self._pipeline.command_stack]
+            if WriteBehindBuffer.can_buffer(commands):
+                await self._pipeline.reset()
+                await self.buffer.add(commands, self.on_commit)
+                return
+            # Ratings depend on the order of the games, so the buffered games go first.
+            await self.buffer.flush()
+        if self.replica_wait_timeout and self._pipeline.command_stack:
+            # WAIT blocks for the replication of the writes made by its own connection, so it goes into the pipeline.
+            await self.p.wait(1, self.replica_wait_timeout)
+        try:
+            await execute_pipeline(self.r, self._pipeline)
+        except redis.WatchError as e:
+            raise types.TransactionConflict() from e
+        for callback in self.on_commit:
+            await callback()
 
 
 @dataclass
 class RepositoryContextManager:
     r: redis.Redis
+    transactional: bool = False
+    replica: redis.Redis | None = None
+    replica_wait_timeout: int | None = None
+    cache: ClientSideCache | None = None
+    buffer: WriteBehindBuffer | None = None
+
+    def start(self, buffered: bool = False) -> RedisContext:
+        return RedisContext(
+            self.r,
+            self.transactional,
+            self.replica,
+            self.replica_wait_timeout,
+            self.cache,
+            self.buffer,
+            buffered,
+        )
+
+
+@dataclass
+class WriteBehindBatch:
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    increments: Counter[tuple[str, str]] = field(default_factory=Counter)
+    members: defaultdict[str, set[str]] = field(default_factory=lambda: defaultdict(set))
+    new_fields: dict[tuple[str, str], str] = field(default_factory=dict)
+    scripts: list[tuple] = field(default_factory=list)
+    expirations: dict[str, str] = field(default_factory=dict)
+    on_commit: list[types.CommitCallback] = field(default_factory=list)
+    games: int = 0
+    sent: bool = False
+
+    def add(self, commands: list[tuple], on_commit: list[types.CommitCallback]):
+        for name, key, *args in commands:
+            match name:
+                case 'HINCRBY':
+                    field_name, amount = args
+                    self.increments[(key, field_name)] += int(amount)
+                case 'SADD':
+                    self.members[key].update(args)
+                case 'HSETNX':
+                    field_name, value = args
+                    self.new_fields.setdefault((key, field_name), value)
+                case 'EVAL' | 'EVALSHA':
+                    self.scripts.append((name, key, *args))
+                case 'EXPIREAT':
+                    self.expirations[key] = args[0]
+        self.on_commit.extend(on_commit)
+        self.games += 1
+
+
+@dataclass
+class WriteBehindBuffer:
+    # Applies the writes of buffered contexts in one MULTI/EXEC every max_games games or flush_interval seconds. The
+    # marker key set by a batch tells whether a retry of it after a failed EXEC was applied already.
+    r: redis.Redis
+    keys_manager: RedisKeysManager
+    max_games: int = 100
+    flush_interval: float = 0.2
+    replica_wait_timeout: int | None = None
+    _batch: WriteBehindBatch = field(default_factory=WriteBehindBatch)
+    _unconfirmed: list[WriteBehindBatch] = field(default_factory=list)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    _timer: asyncio.Task | None = None
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+    @staticmethod
+    def can_buffer(commands: list[tuple]) -> bool:
+        return all(args[0] in BUFFERED_COMMANDS for args in commands)
+
+    async def add(self, commands: list[tuple], on_commit: list[types.CommitCallback]):
+        self._batch.add(commands, on_commit)
+        if self._batch.games >= self.max_games:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        if not self._batch.games and not self._unconfirmed:
+            return
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._batch.games:
+                self._unconfirmed.append(self._batch)
+                self._batch = WriteBehindBatch()
+            while self._unconfirmed:
+                batch = self._unconfirmed[0]
+                await self._apply(batch)
+                self._unconfirmed.pop(0)
+                for callback in batch.on_commit:
+                    await callback()
+
+    async def _apply(self, batch: WriteBehindBatch):
+        marker_key = self.keys_manager.key(f'{WRITE_BEHIND_BATCH_KEY}:{batch.id}')
+        if batch.sent and await self.r.exists(marker_key):
+            return
+        batch.sent = True
+        async with self.r.pipeline(transaction=True) as p:
+            for key, values in batch.members.items():
+                await p.sadd(key, *values)
+            for (key, field_name), value in batch.new_fields.items():
+                await p.hsetnx(key, field_name, value)
+            for (key, field_name), amount in batch.increments.items():
+                await p.hincrby(key, field_name, amount)
+            for args in batch.scripts:
+                await p.execute_command(*args)
+            for key, when in batch.expirations.items():
+                await p.expireat(key, when)
+            await p.set(marker_key, 1, ex=WRITE_BEHIND_BATCH_TTL)
+            if self.replica_wait_timeout:
+                await p.wait(1, self.replica_wait_timeout)
+            await execute_pipeline(self.r, p)
 
-    def start(self) -> RedisContext:
-        return RedisContext(self.r)
+    async def _flush_later(self):
+        metrics.detach()
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        try:
+            await self.flush()
+        except (redis.ConnectionError, redis.TimeoutError):
+            if self._timer is None:
+                self._timer = asyncio.create_task(self._flush_later())
 
 
 @dataclass
 class RedisKeysManager:
+    # In cluster mode the last part of every key is a hash tag, so the keys of a player share the slot of the login.
     root: str
+    tagged: bool = False
 
     def key(self, k: str) -> str:
-        return f'{self.root}:{k}'
+        return f'{self.root}:{{{k}}}' if self.tagged else f'{self.root}:{k}'
 
     def namespace(self, k: str) -> RedisKeysManager:
-        return RedisKeysManager(f'{self.root}:{k}')
+        return RedisKeysManager(f'{self.root}:{k}', self.tagged)
+
+    def unit(self, k: str) -> RedisKeysManager:
+        return RedisKeysManager(f'{self.root}:{{{k}}}', True) if self.tagged else self.namespace(k)
+
+    def pattern(self) -> str:
+        return f'{self.root}:*'
+
+
+@dataclass
+class GenerationalKeysManager(RedisKeysManager):
+    # Keys written before generations existed are the generation '', see RedisGenerations.
+    generations: RedisGenerations | None = None
+
+    def namespace(self, k: str) -> RedisKeysManager:
+        return self.generation(self.generations.current(f'{self.root}:{k}')).namespace(k)
+
+    def generation(self, generation: str) -> RedisKeysManager:
+        if not generation:
+            return RedisKeysManager(self.root, self.tagged)
+        return RedisKeysManager(f'{self.root}:{GENERATION_KEY}{generation}', self.tagged)
+
+    async def begin_generation(self, r: redis.Redis, k: str) -> RedisKeysManager:
+        generation = await self.generations.begin(r, self, k)
+        return self.generation(generation)
+
+    async def commit_generation(self, r: redis.Redis, k: str, keys_manager: RedisKeysManager):
+        await self.generations.commit(r, self, k, keys_manager.root.removeprefix(f'{self.root}:{GENERATION_KEY}'))
+
+
+@dataclass
+class RedisGenerations:
+    # The live generation of every rebuilt namespace is a field of one hash, swapped by one HSET that also marks the old
+    # generation stale. Stale generations are deleted after grace seconds or by the next rebuild. Processes reload the
+    # pointers when they are published, or poll them in cluster mode.
+    r: redis.Redis
+    keys_manager: RedisKeysManager
+    cluster: bool = False
+    grace: float = 5.0
+    poll_interval: float = 1.0
+    reconnect_delay: float = 1.0
+    _current: dict[str, str] = field(default_factory=dict)
+    _listener: asyncio.Task | None = None
+    _retiring: set[asyncio.Task] = field(default_factory=set)
+
+    async def start(self):
+        if self.cluster:
+            await self._reload()
+            self._listener = asyncio.create_task(self._poll())
+            return
+        pubsub = self.r.pubsub()
+        await pubsub.subscribe(self.keys_manager.key(GENERATIONS_CHANNEL))
+        await self._reload()
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+
+    def keys_manager_for(self, keys_manager: RedisKeysManager) -> GenerationalKeysManager:
+        return GenerationalKeysManager(keys_manager.root, keys_manager.tagged, self)
+
+    def current(self, namespace: str) -> str:
+        return self._current.get(namespace, '')
+
+    async def begin(self, r: redis.Redis, keys_manager: GenerationalKeysManager, k: str) -> str:
+        namespace = f'{keys_manager.root}:{k}'
+        key = self.keys_manager.key(GENERATIONS_KEY)
+        stale = await r.hget(key, namespace + STALE_GENERATION_SUFFIX)
+        if stale is not None and stale != await r.hget(key, namespace):
+            await delete_namespace(r, keys_manager.generation(stale).namespace(k))
+        generation = uuid.uuid4().hex[:GENERATION_ID_SIZE]
+        await r.hset(key, namespace + STALE_GENERATION_SUFFIX, generation)
+        return generation
+
+    async def commit(self, r: redis.Redis, keys_manager: GenerationalKeysManager, k: str, generation: str):
+        namespace = f'{keys_manager.root}:{k}'
+        key = self.keys_manager.key(GENERATIONS_KEY)
+        old = await r.hget(key, namespace) or ''
+        async with r.pipeline(transaction=False) as p:
+            await p.hset(key, mapping={namespace: generation, namespace + STALE_GENERATION_SUFFIX: old})
+            if not self.cluster:
+                await p.publish(self.keys_manager.key(GENERATIONS_CHANNEL), namespace)
+            await p.execute()
+        self._current[namespace] = generation
+        task = asyncio.create_task(self._retire(r, keys_manager.generation(old).namespace(k), namespace, old))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def _retire(self, r: redis.Redis, keys_manager: RedisKeysManager, namespace: str, generation: str):
+        metrics.detach()
+        await asyncio.sleep(self.grace)
+        await delete_namespace(r, keys_manager)
+        key = self.keys_manager.key(GENERATIONS_KEY)
+        if await r.hget(key, namespace + STALE_GENERATION_SUFFIX) == generation:
+            await r.hdel(key, namespace + STALE_GENERATION_SUFFIX)
+
+    async def _reload(self):
+        pointers = await self.r.hgetall(self.keys_manager.key(GENERATIONS_KEY))
+        self._current = {k: v for k, v in pointers.items() if not k.endswith(STALE_GENERATION_SUFFIX)}
+
+    async def _listen(self, pubsub: redis.client.PubSub):
+        async with pubsub:
+            while True:
+                try:
+                    async for message in pubsub.listen():
+                        if message['type'] in ('message', 'subscribe'):
+                            # The client resubscribes after a reconnect, anything published meanwhile is lost.
+                            await self._reload()
+                except redis.ConnectionError:
+                    await asyncio.sleep(self.reconnect_delay)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._reload()
+            except (redis.ConnectionError, redis.TimeoutError):
+                pass
 
 
 class GroupOptions(Protocol):
@@ -50,7 +387,12 @@ class GroupOptions(Protocol):
 @dataclass
 class RedisIndividualStatsRepository:
     r: redis.Redis
-    keys_manager: RedisKeysManager
+    keys_manager: GenerationalKeysManager
+    read_batch_size: int = 500
+    _merge_players_script: AsyncScript = field(init=False)
+
+    def __post_init__(self):
+        self._merge_players_script = self.r.register_script(MERGE_PLAYERS_SCRIPT)
 
     async def add_game_played_for_player(self, context: RedisContext, options: types.ChangeIndividualStatsOptions):
         game_keys = self.keys_manager.namespace(options.game_name)
@@ -64,19 +406,16 @@ class RedisIndividualStatsRepository:
 
     async def stats(self, context: RedisContext, options: types.AllIndividualStatsOptions) -> list[types.IndividualStats]:
         game_keys = self.keys_manager.namespace(options.game_name)
-        players = await self.r.smembers(game_keys.key(INDIVIDUAL_PLAYERS_INDEX_KEY))
-        for p in players:
-            await context.p.hgetall(game_keys.key(p))
-        return [
-            self._parse_stats(p, s)
-            for p, s in zip(players, await context.p.execute())
-        ]
+        return await self._read_indexed_stats(context, game_keys.key(INDIVIDUAL_PLAYERS_INDEX_KEY), game_keys)
 
     async def add_game_played_in_group_for_player(self, context: RedisContext, options: types.ChangeIndividualGroupStatsOptions):
         group_namespace = self._get_group_namespace(options)
         key = group_namespace.key(options.player)
         await context.p.hincrby(key, GAMES_PLAYED_FIELD, options.amount)
         await context.p.sadd(group_namespace.key(GROUP_MEMBERS_KEY), options.player)
+        group_id = serialize_group(options.group)
+        await context.p.sadd(self._get_player_groups_key(options.game_name, options.player), group_id)
+        await context.p.hsetnx(self._get_group_registry_key(options.game_name), group_id, dump_group(options.group))
 
     async def add_game_won_in_group_for_player(self, context: RedisContext, options: types.ChangeIndividualGroupStatsOptions):
         key = self._get_player_group_stats_key(options)
@@ -84,32 +423,164 @@ class RedisIndividualStatsRepository:
 
     async def group_stats(self, context: RedisContext, options: types.GroupIndividualStatsOptions):
         group_namespace = self._get_group_namespace(options)
-        players = await self.r.smembers(group_namespace.key(GROUP_MEMBERS_KEY))
-        for p in players:
-            await context.p.hgetall(group_namespace.key(p))
-        return [
-            self._parse_stats(p, s)
-            for p, s in zip(players, await context.p.execute())
-        ]
+        return await self._read_indexed_stats(context, group_namespace.key(GROUP_MEMBERS_KEY), group_namespace)
 
     async def stats_for_player(self, context: RedisContext, options: types.OneIndividualStatsOptions) -> types.IndividualStats | None:
         game_keys = self.keys_manager.namespace(options.game_name)
-        raw = await self.r.hgetall(game_keys.key(options.player))
+        raw = await context.replica.hgetall(game_keys.key(options.player))
         if raw:
             return self._parse_stats(options.player, raw)
         return None
 
+    async def import_stats(self, context: RedisContext, options: types.ImportIndividualStatsOptions):
+        for writes in chunked(self._import_writes(options), options.batch_size):
+            async with context.r.pipeline(transaction=False) as p:
+                for keys, index_key, deltas, group in writes:
+                    await p.sadd(index_key, *deltas)
+                    if group is not None:
+                        group_id = serialize_group(group)
+                        await p.hsetnx(self._get_group_registry_key(options.game_name), group_id, dump_group(group))
+                        for player in deltas:
+                            await p.sadd(self._get_player_groups_key(options.game_name, player), group_id)
+                    for player, delta in deltas.items():
+                        if delta.games_played:
+                            await p.hincrby(keys.key(player), GAMES_PLAYED_FIELD, delta.games_played)
+                        if delta.games_won:
+                            await p.hincrby(keys.key(player), GAMES_WON_FIELD, delta.games_won)
+                await p.execute()
+
+    def _import_writes(
+            self,
+            options: types.ImportIndividualStatsOptions,
+    ) -> Iterator[tuple[RedisKeysManager, str, Mapping[Login, types.IndividualStatsDelta], GroupDescriptor | None]]:
+        game_keys = self.keys_manager.namespace(options.game_name)
+        for player, delta in options.players.items():
+            yield game_keys, game_keys.key(INDIVIDUAL_PLAYERS_INDEX_KEY), {player: delta}, None
+        for group, players in options.groups.items():
+            group_namespace = self._get_group_namespace(types.GroupIndividualStatsOptions(group, options.game_name))
+            yield group_namespace, group_namespace.key(GROUP_MEMBERS_KEY), players, group
+
+    async def merge_players(self, context: RedisContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if not renames:
+            return
+        game_keys = self.keys_manager.namespace(options.game_name)
+
+        aliases_groups_keys = [self._get_player_groups_key(options.game_name, alias) for alias in renames]
+        await context.watch(*aliases_groups_keys)
+        async with context.r.pipeline(transaction=False) as p:
+            for key in aliases_groups_keys:
+                await p.smembers(key)
+            groups_ids = list(set().union(*await p.execute()))
+        registry_key = self._get_group_registry_key(options.game_name)
+        raw_groups, groups_with_stats = [], []
+        if groups_ids:
+            await context.watch(registry_key, *(
+                self._get_group_namespace_by_id(options.game_name, group_id).key(GROUP_MEMBERS_KEY)
+                for group_id in groups_ids
+            ))
+            async with context.r.pipeline(transaction=False) as p:
+                await p.hmget(registry_key, groups_ids)
+                for group_id in groups_ids:
+                    await p.smembers(self._get_group_namespace_by_id(options.game_name, group_id).key(GROUP_MEMBERS_KEY))
+                raw_groups, *groups_with_stats = await p.execute()
+
+        call = MergeScriptCall(renames)
+        new_groups = {}
+        for group_id, raw_group, with_stats in zip(groups_ids, raw_groups, groups_with_stats):
+            # Groups written before the registry existed only know the members that have stats.
+            members = load_group(raw_group) if raw_group is not None else with_stats
+            new_group = GroupDescriptor(frozenset(renames.get(m, m) for m in members))
+            new_group_id = serialize_group(new_group)
+            new_groups[new_group_id] = new_group
+            group_namespace = self._get_group_namespace_by_id(options.game_name, group_id)
+            new_group_namespace = self._get_group_namespace_by_id(options.game_name, new_group_id)
+            for member in members:
+                call.merge_hashes(group_namespace.key(member), new_group_namespace.key(renames.get(member, member)))
+                call.replace_member(self._get_player_groups_key(options.game_name, member), group_id, new_group_id)
+            call.move_set(group_namespace.key(GROUP_MEMBERS_KEY), new_group_namespace.key(GROUP_MEMBERS_KEY))
+            call.delete_field(registry_key, group_id)
+        for new_group_id, new_group in new_groups.items():
+            call.set_field(registry_key, new_group_id, dump_group(new_group))
+        for alias, player in renames.items():
+            call.merge_hashes(game_keys.key(alias), game_keys.key(player))
+            call.replace_member(game_keys.key(INDIVIDUAL_PLAYERS_INDEX_KEY), alias, player)
+            call.move_set(
+                self._get_player_groups_key(options.game_name, alias),
+                self._get_player_groups_key(options.game_name, player),
+            )
+        await call.execute(context, self._merge_players_script, self.keys_manager.tagged)
+
+    async def groups_stats_for_player(
+            self,
+            context: RedisContext,
+            options: types.OneIndividualStatsOptions,
+    ) -> list[types.PlayerGroupStats]:
+        groups_ids = list(await context.replica.smembers(self._get_player_groups_key(options.game_name, options.player)))
+        if not groups_ids:
+            return []
+        async with context.replica.pipeline(transaction=False) as p:
+            await p.hmget(self._get_group_registry_key(options.game_name), groups_ids)
+            for group_id in groups_ids:
+                await p.hgetall(self._get_group_namespace_by_id(options.game_name, group_id).key(options.player))
+            raw_groups, *raw_stats = await p.execute()
+        return [
+            types.PlayerGroupStats(load_group(raw_group), self._parse_stats(options.player, raw))
+            for raw_group, raw in zip(raw_groups, raw_stats)
+            if raw_group is not None
+        ]
+
+    async def best_group_for_player(
+            self,
+            context: RedisContext,
+            options: types.BestGroupOptions,
+    ) -> types.PlayerGroupStats | None:
+        groups = await self.groups_stats_for_player(
+            context,
+            types.OneIndividualStatsOptions(options.player, options.game_name),
+        )
+        return choose_best_group(groups, options.min_games_played)
+
     async def remove_stats(self, context: RedisContext, options: types.OneIndividualStatsOptions):
-        key = self.keys_manager.namespace(options.game_name).key(options.player)
-        await context.p.delete(key)
+        game_keys = self.keys_manager.namespace(options.game_name)
+        await context.p.delete(game_keys.key(options.player))
+        await context.p.srem(game_keys.key(INDIVIDUAL_PLAYERS_INDEX_KEY), options.player)
+
+    async def replace_stats(self, context: RedisContext, options: types.ImportIndividualStatsOptions):
+        generation_keys = await self.keys_manager.begin_generation(context.r, options.game_name)
+        await dataclasses.replace(self, keys_manager=generation_keys).import_stats(context, options)
+        await self.keys_manager.commit_generation(context.r, options.game_name, generation_keys)
+
+    async def _read_indexed_stats(
+            self,
+            context: RedisContext,
+            index_key: str,
+            stats_keys: RedisKeysManager,
+    ) -> list[types.IndividualStats]:
+        result = []
+        async for players in batched(sscan_unique(context.replica, index_key, self.read_batch_size), self.read_batch_size):
+            async with context.replica.pipeline(transaction=False) as p:
+                for player in players:
+                    await p.hgetall(stats_keys.key(player))
+                raw_stats = await p.execute()
+            result.extend(self._parse_stats(player, raw) for player, raw in zip(players, raw_stats))
+        return result
 
     def _get_player_group_stats_key(self, options: types.ChangeIndividualGroupStatsOptions) -> str:
         group_keys = self._get_group_namespace(options)
         return group_keys.key(options.player)
 
     def _get_group_namespace(self, options: GroupOptions) -> RedisKeysManager:
-        game_keys = self.keys_manager.namespace(options.game_name).namespace(serialize_group(options.group))
-        return game_keys.namespace(GROUP_KEY)
+        return self._get_group_namespace_by_id(options.game_name, serialize_group(options.group))
+
+    def _get_group_namespace_by_id(self, game_name: GameName, group_id: str) -> RedisKeysManager:
+        return self.keys_manager.namespace(game_name).unit(group_id).namespace(GROUP_KEY)
+
+    def _get_player_groups_key(self, game_name: GameName, player: Login) -> str:
+        return self.keys_manager.namespace(game_name).namespace(PLAYER_GROUPS_KEY).key(player)
+
+    def _get_group_registry_key(self, game_name: GameName) -> str:
+        return self.keys_manager.namespace(game_name).key(GROUP_REGISTRY_KEY)
 
     @staticmethod
     def _parse_stats(login: Login, raw_stats: dict) -> types.IndividualStats:
@@ -120,16 +591,654 @@ class RedisIndividualStatsRepository:
         )
 
 
+@dataclass
+class PackedRedisIndividualStatsRepository(RedisIndividualStatsRepository):
+    buckets: int = 64
+
+    async def add_game_played_for_player(self, context: RedisContext, options: types.ChangeIndividualStatsOptions):
+        key = self._get_bucket_key(options.game_name, options.player)
+        await context.p.hincrby(key, pack_field(options.player, GAMES_PLAYED_FIELD), options.amount)
+
+    async def add_game_won_for_player(self, context: RedisContext, options: types.ChangeIndividualStatsOptions):
+        key = self._get_bucket_key(options.game_name, options.player)
+        await context.p.hincrby(key, pack_field(options.player, GAMES_WON_FIELD), options.amount)
+
+    async def stats(self, context: RedisContext, options: types.AllIndividualStatsOptions) -> list[types.IndividualStats]:
+        game_keys = self.keys_manager.namespace(options.game_name).namespace(PACKED_KEY)
+        result = []
+        for buckets in chunked(range(self.buckets), PACKED_READ_BUCKETS):
+            async with context.replica.pipeline(transaction=False) as p:
+                for bucket in buckets:
+                    await p.hgetall(game_keys.key(str(bucket)))
+                raw_buckets = await p.execute()
+            for raw in raw_buckets:
+                result.extend(self._parse_packed_stats(raw))
+        return result
+
+    async def add_game_played_in_group_for_player(self, context: RedisContext, options: types.ChangeIndividualGroupStatsOptions):
+        group_id = serialize_group(options.group)
+        key = self._get_packed_group_key(options.game_name, group_id)
+        await context.p.hincrby(key, pack_field(options.player, GAMES_PLAYED_FIELD), options.amount)
+        await context.p.sadd(self._get_player_groups_key(options.game_name, options.player), group_id)
+        await context.p.hsetnx(self._get_group_registry_key(options.game_name), group_id, dump_group(options.group))
+
+    async def add_game_won_in_group_for_player(self, context: RedisContext, options: types.ChangeIndividualGroupStatsOptions):
+        key = self._get_packed_group_key(options.game_name, serialize_group(options.group))
+        await context.p.hincrby(key, pack_field(options.player, GAMES_WON_FIELD), options.amount)
+
+    async def group_stats(self, context: RedisContext, options: types.GroupIndividualStatsOptions):
+        key = self._get_packed_group_key(options.game_name, serialize_group(options.group))
+        return self._parse_packed_stats(await context.replica.hgetall(key))
+
+    async def stats_for_player(self, context: RedisContext, options: types.OneIndividualStatsOptions) -> types.IndividualStats | None:
+        return self._parse_player_packed_stats(options.player, await context.replica.hmget(
+            self._get_bucket_key(options.game_name, options.player),
+            pack_field(options.player, GAMES_PLAYED_FIELD),
+            pack_field(options.player, GAMES_WON_FIELD),
+        ))
+
+    async def import_stats(self, context: RedisContext, options: types.ImportIndividualStatsOptions):
+        for writes in chunked(self._import_writes(options), options.batch_size):
+            async with context.r.pipeline(transaction=False) as p:
+                for key, deltas, group in writes:
+                    if group is not None:
+                        group_id = serialize_group(group)
+                        await p.hsetnx(self._get_group_registry_key(options.game_name), group_id, dump_group(group))
+                        for player in deltas:
+                            await p.sadd(self._get_player_groups_key(options.game_name, player), group_id)
+                    for player, delta in deltas.items():
+                        # HINCRBY by zero still creates the field, so the player shows up in the stats.
+                        await p.hincrby(key, pack_field(player, GAMES_PLAYED_FIELD), delta.games_played)
+                        if delta.games_won:
+                            await p.hincrby(key, pack_field(player, GAMES_WON_FIELD), delta.games_won)
+                await p.execute()
+
+    def _import_writes(
+            self,
+            options: types.ImportIndividualStatsOptions,
+    ) -> Iterator[tuple[str, Mapping[Login, types.IndividualStatsDelta], GroupDescriptor | None]]:
+        for player, delta in options.players.items():
+            yield self._get_bucket_key(options.game_name, player), {player: delta}, None
+        for group, players in options.groups.items():
+            yield self._get_packed_group_key(options.game_name, serialize_group(group)), players, group
+
+    async def merge_players(self, context: RedisContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if not renames:
+            return
+
+        aliases_groups_keys = [self._get_player_groups_key(options.game_name, alias) for alias in renames]
+        await context.watch(*aliases_groups_keys)
+        async with context.r.pipeline(transaction=False) as p:
+            for key in aliases_groups_keys:
+                await p.smembers(key)
+            groups_ids = list(set().union(*await p.execute()))
+        registry_key = self._get_group_registry_key(options.game_name)
+        raw_groups, groups_fields = [], []
+        if groups_ids:
+            await context.watch(registry_key, *(
+                self._get_packed_group_key(options.game_name, group_id)
+                for group_id in groups_ids
+            ))
+            async with context.r.pipeline(transaction=False) as p:
+                await p.hmget(registry_key, groups_ids)
+                for group_id in groups_ids:
+                    await p.hkeys(self._get_packed_group_key(options.game_name, group_id))
+                raw_groups, *groups_fields = await p.execute()
+
+        call = MergeScriptCall(renames)
+        new_groups = {}
+        for group_id, raw_group, fields in zip(groups_ids, raw_groups, groups_fields):
+            members = load_group(raw_group) if raw_group is not None else {f.rsplit(':', 1)[0] for f in fields}
+            new_group = GroupDescriptor(frozenset(renames.get(m, m) for m in members))
+            new_group_id = serialize_group(new_group)
+            new_groups[new_group_id] = new_group
+            group_key = self._get_packed_group_key(options.game_name, group_id)
+            new_group_key = self._get_packed_group_key(options.game_name, new_group_id)
+            for member in members:
+                for stats_field in STATS_FIELDS:
+                    call.move_field(
+                        group_key,
+                        pack_field(member, stats_field),
+                        new_group_key,
+                        pack_field(renames.get(member, member), stats_field),
+                    )
+                call.replace_member(self._get_player_groups_key(options.game_name, member), group_id, new_group_id)
+            call.delete_field(registry_key, group_id)
+        for new_group_id, new_group in new_groups.items():
+            call.set_field(registry_key, new_group_id, dump_group(new_group))
+        for alias, player in renames.items():
+            for stats_field in STATS_FIELDS:
+                call.move_field(
+                    self._get_bucket_key(options.game_name, alias),
+                    pack_field(alias, stats_field),
+                    self._get_bucket_key(options.game_name, player),
+                    pack_field(player, stats_field),
+                )
+            call.move_set(
+                self._get_player_groups_key(options.game_name, alias),
+                self._get_player_groups_key(options.game_name, player),
+            )
+        await call.execute(context, self._merge_players_script, self.keys_manager.tagged)
+
+    async def groups_stats_for_player(
+            self,
+            context: RedisContext,
+            options: types.OneIndividualStatsOptions,
+    ) -> list[types.PlayerGroupStats]:
+        groups_ids = list(await context.replica.smembers(self._get_player_groups_key(options.game_name, options.player)))
+        if not groups_ids:
+            return []
+        async with context.replica.pipeline(transaction=False) as p:
+            await p.hmget(self._get_group_registry_key(options.game_name), groups_ids)
+            for group_id in groups_ids:
+                await p.hmget(
+                    self._get_packed_group_key(options.game_name, group_id),
+                    pack_field(options.player, GAMES_PLAYED_FIELD),
+                    pack_field(options.player, GAMES_WON_FIELD),
+                )
+            raw_groups, *raw_stats = await p.execute()
+        return [
+            types.PlayerGroupStats(load_group(raw_group), self._parse_player_packed_stats(options.player, raw))
+            for raw_group, raw in zip(raw_groups, raw_stats)
+            if raw_group is not None
+        ]
+
+    async def remove_stats(self, context: RedisContext, options: types.OneIndividualStatsOptions):
+        await context.p.hdel(
+            self._get_bucket_key(options.game_name, options.player),
+            *(pack_field(options.player, stats_field) for stats_field in STATS_FIELDS),
+        )
+
+    def _get_bucket_key(self, game_name: GameName, player: Login) -> str:
+        bucket = zlib.crc32(player.encode()) % self.buckets
+        return self.keys_manager.namespace(game_name).namespace(PACKED_KEY).key(str(bucket))
+
+    def _get_packed_group_key(self, game_name: GameName, group_id: str) -> str:
+        return self.keys_manager.namespace(game_name).unit(group_id).key(PACKED_KEY)
+
+    @staticmethod
+    def _parse_packed_stats(raw_stats: dict[str, str]) -> list[types.IndividualStats]:
+        players = defaultdict(dict)
+        for packed_field, value in raw_stats.items():
+            login, stats_field = packed_field.rsplit(':', 1)
+            players[login][stats_field] = value
+        return [RedisIndividualStatsRepository._parse_stats(Login(p), raw) for p, raw in players.items()]
+
+    @staticmethod
+    def _parse_player_packed_stats(login: Login, raw_stats: list[str | None]) -> types.IndividualStats | None:
+        if all(value is None for value in raw_stats):
+            return None
+        return RedisIndividualStatsRepository._parse_stats(login, {
+            stats_field: value
+            for stats_field, value in zip(STATS_FIELDS, raw_stats)
+            if value is not None
+        })
+
+
+@dataclass
+class MergeScriptCall:
+    renames: dict[Login, Login]
+    keys: list[str] = field(default_factory=list)
+    ops: list[str | int] = field(default_factory=list)
+    steps: list[tuple[str, tuple[str, ...], tuple[str, ...]]] = field(default_factory=list)
+    _key_indexes: dict[str, int] = field(default_factory=dict)
+
+    def merge_hashes(self, src: str, dst: str):
+        self._add('H', (src, dst))
+
+    def move_set(self, src: str, dst: str):
+        self._add('S', (src, dst))
+
+    def replace_member(self, key: str, old: str, new: str):
+        self._add('R', (key,), (old, new))
+
+    def move_field(self, src: str, src_field: str, dst: str, dst_field: str):
+        self._add('M', (src, dst), (src_field, dst_field))
+
+    def set_field(self, key: str, field_name: str, value: str):
+        self._add('F', (key,), (field_name, value))
+
+    def delete_field(self, key: str, field_name: str):
+        self._add('X', (key,), (field_name,))
+
+    @property
+    def args(self) -> list[str | int]:
+        return [len(self.renames), *chain.from_iterable(self.renames.items()), *self.ops]
+
+    async def execute(self, context: RedisContext, script: AsyncScript, tagged: bool):
+        if not tagged:
+            await script(keys=self.keys, args=self.args, client=context.p)
+            return
+        # Tagged keys are in different slots, so the steps of a slot share a call and steps between slots go through
+        # TAKE_SCRIPT. Unlike the single script, this is not atomic.
+        call = MergeScriptCall(self.renames)
+        call_slot = None
+        for op, keys, fields in self.steps:
+            slots = {key_slot(key.encode()) for key in keys}
+            if slots != {call_slot} and call.steps:
+                await script(keys=call.keys, args=call.args, client=context.r)
+                call = MergeScriptCall(self.renames)
+            if len(slots) == 1:
+                call_slot = slots.pop()
+                call._add(op, keys, fields)
+            else:
+                call_slot = None
+                await self._move_between_slots(context.r, op, keys, fields)
+        if call.steps:
+            await script(keys=call.keys, args=call.args, client=context.r)
+
+    async def _move_between_slots(self, r: redis.Redis, op: str, keys: tuple[str, ...], fields: tuple[str, ...]):
+        src, dst = keys
+        taken = await r.eval(TAKE_SCRIPT, 1, src, op, *fields[:1])
+        if op == 'H':
+            async with r.pipeline(transaction=False) as p:
+                for field_name, value in zip(taken[::2], taken[1::2]):
+                    await p.hincrby(dst, field_name, value)
+                await p.execute()
+        elif op == 'S' and taken:
+            await r.sadd(dst, *(self.renames.get(member, member) for member in taken))
+        elif op == 'M' and taken is not None:
+            await r.hincrby(dst, fields[1], taken)
+
+    def _add(self, op: str, keys: tuple[str, ...], fields: tuple[str, ...] = ()):
+        self.steps.append((op, keys, fields))
+        self.ops.extend((op, *map(self._key_index, keys), *fields))
+
+    def _key_index(self, key: str) -> int:
+        if key not in self._key_indexes:
+            self.keys.append(key)
+            self._key_indexes[key] = len(self.keys)
+        return self._key_indexes[key]
+
+
+@dataclass
+class PeriodStatsRepository:
+    r: redis.Redis
+    keys_manager: GenerationalKeysManager
+
+    async def add_game(self, context: RedisContext, options: types.AddPeriodGameOptions):
+        game_keys = self.keys_manager.namespace(options.game_name)
+        for bucket in options.buckets:
+            key = game_keys.key(bucket.id)
+            for player in options.players:
+                await context.p.hincrby(key, pack_field(player, GAMES_PLAYED_FIELD), 1)
+            if options.winner is not None:
+                await context.p.hincrby(key, pack_field(options.winner, GAMES_WON_FIELD), 1)
+            if bucket.expires_at is not None:
+                await context.p.expireat(key, bucket.expires_at)
+
+    async def stats(self, context: RedisContext, options: types.PeriodStatsOptions) -> list[types.IndividualStats]:
+        game_keys = self.keys_manager.namespace(options.game_name)
+        async with context.replica.pipeline(transaction=False) as p:
+            for bucket in options.buckets:
+                await p.hgetall(game_keys.key(bucket.id))
+            raw_buckets = await p.execute()
+        deltas = defaultdict(types.IndividualStatsDelta)
+        for raw in raw_buckets:
+            for packed_field, value in raw.items():
+                login, stats_field = packed_field.rsplit(':', 1)
+                if stats_field == GAMES_PLAYED_FIELD:
+                    deltas[Login(login)].games_played += int(value)
+                else:
+                    deltas[Login(login)].games_won += int(value)
+        return [types.IndividualStats(login, delta.games_played, delta.games_won) for login, delta in deltas.items()]
+
+    async def replace_stats(self, context: RedisContext, options: types.ImportPeriodStatsOptions):
+        generation_keys = await self.keys_manager.begin_generation(context.r, options.game_name)
+        shadow_game_keys = generation_keys.namespace(options.game_name)
+        writes = (
+            (bucket, player, delta)
+            for bucket, players in options.buckets.items()
+            for player, delta in players.items()
+        )
+        for chunk in chunked(writes, options.batch_size):
+            async with context.r.pipeline(transaction=False) as p:
+                for bucket, player, delta in chunk:
+                    key = shadow_game_keys.key(bucket.id)
+                    await p.hincrby(key, pack_field(player, GAMES_PLAYED_FIELD), delta.games_played)
+                    if delta.games_won:
+                        await p.hincrby(key, pack_field(player, GAMES_WON_FIELD), delta.games_won)
+                await p.execute()
+        for buckets in chunked((b for b in options.buckets if b.expires_at is not None), options.batch_size):
+            async with context.r.pipeline(transaction=False) as p:
+                for bucket in buckets:
+                    await p.expireat(shadow_game_keys.key(bucket.id), bucket.expires_at)
+                await p.execute()
+        await self.keys_manager.commit_generation(context.r, options.game_name, generation_keys)
+
+
+@dataclass
+class RatingsRepository:
+    r: redis.Redis
+    keys_manager: GenerationalKeysManager
+    rating: EloRating
+
+    async def add_game(self, context: RedisContext, options: types.RateGameOptions):
+        if options.winner is None:
+            return
+        # Not a registered script, which the pipeline would check with an extra round trip on every game.
+        await context.p.evalsha(
+            RATE_GAME_SHA,
+            1,
+            self._get_ratings_key(options.game_name),
+            repr(self.rating.k),
+            repr(self.rating.initial),
+            options.players.index(options.winner) + 1,
+            *options.players,
+        )
+
+    async def leaderboard(self, context: RedisContext, options: types.LeaderboardOptions) -> list[types.PlayerRating]:
+        raw = await context.replica.zrevrange(
+            self._get_ratings_key(options.game_name),
+            options.offset,
+            options.offset + options.limit - 1,
+            withscores=True,
+        )
+        return [
+            types.PlayerRating(Login(login), rating, options.offset + i + 1)
+            for i, (login, rating) in enumerate(raw)
+        ]
+
+    async def rating_for_player(self, context: RedisContext, options: types.OnePlayerRatingOptions) -> types.PlayerRating | None:
+        key = self._get_ratings_key(options.game_name)
+        rating = await context.replica.zscore(key, options.player)
+        if rating is None:
+            return None
+        place = await context.replica.zrevrank(key, options.player)
+        return types.PlayerRating(options.player, rating, place + 1)
+
+    async def replace_ratings(self, context: RedisContext, options: types.ImportRatingsOptions):
+        generation_keys = await self.keys_manager.begin_generation(context.r, options.game_name)
+        shadow_game_keys = generation_keys.namespace(options.game_name)
+        for ratings in chunked(options.ratings.items(), options.batch_size):
+            await context.r.zadd(shadow_game_keys.key(RATINGS_KEY), dict(ratings))
+        await self.keys_manager.commit_generation(context.r, options.game_name, generation_keys)
+
+    async def merge_players(self, context: RedisContext, options: types.MergePlayersOptions):
+        renames = [login for alias, player in options.aliases.items() if alias != player for login in (alias, player)]
+        if renames:
+            await context.p.eval(
+                MERGE_RATINGS_SCRIPT,
+                1,
+                self._get_ratings_key(options.game_name),
+                repr(self.rating.initial),
+                *renames,
+            )
+
+    def _get_ratings_key(self, game_name: GameName) -> str:
+        return self.keys_manager.namespace(game_name).key(RATINGS_KEY)
+
+
+@dataclass
+class HeadToHeadRepository:
+    r: redis.Redis
+    keys_manager: GenerationalKeysManager
+    _merge_players_script: AsyncScript = field(init=False)
+
+    def __post_init__(self):
+        self._merge_players_script = self.r.register_script(MERGE_PLAYERS_SCRIPT)
+
+    async def add_game(self, context: RedisContext, options: types.HeadToHeadGameOptions):
+        game_keys = self.keys_manager.namespace(options.game_name)
+        for player in options.players:
+            key = game_keys.key(player)
+            for opponent in options.players:
+                if opponent == player:
+                    continue
+                await context.p.hincrby(key, pack_field(opponent, GAMES_PLAYED_FIELD), 1)
+                if player == options.winner:
+                    await context.p.hincrby(key, pack_field(opponent, GAMES_WON_FIELD), 1)
+                elif opponent == options.winner:
+                    await context.p.hincrby(key, pack_field(opponent, GAMES_LOST_FIELD), 1)
+
+    async def rivals(self, context: RedisContext, options: types.RivalsOptions) -> list[types.HeadToHead]:
+        raw = await context.replica.hgetall(self.keys_manager.namespace(options.game_name).key(options.player))
+        opponents = defaultdict(types.HeadToHeadDelta)
+        for packed_field, value in raw.items():
+            opponent, stats_field = packed_field.rsplit(':', 1)
+            delta = opponents[Login(opponent)]
+            if stats_field == GAMES_PLAYED_FIELD:
+                delta.games_played = int(value)
+            elif stats_field == GAMES_WON_FIELD:
+                delta.games_won = int(value)
+            else:
+                delta.games_lost = int(value)
+        return [
+            types.HeadToHead(opponent, delta.games_played, delta.games_won, delta.games_lost)
+            for opponent, delta in opponents.items()
+        ]
+
+    async def merge_players(self, context: RedisContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if not renames:
+            return
+        game_keys = self.keys_manager.namespace(options.game_name)
+        # Not watched, the individual stats have already written in the context. A rivalry of the alias first played
+        # between this read and the write of the alias stays on the alias until the next rebuild.
+        async with context.r.pipeline(transaction=False) as p:
+            for alias in renames:
+                await p.hkeys(game_keys.key(alias))
+            aliases_fields = await p.execute()
+
+        call = MergeScriptCall(renames)
+        for (alias, player), packed_fields in zip(renames.items(), aliases_fields):
+            alias_key = game_keys.key(alias)
+            for packed_field in packed_fields:
+                opponent, stats_field = packed_field.rsplit(':', 1)
+                opponent = Login(opponent)
+                new_opponent = renames.get(opponent, opponent)
+                if new_opponent == player:
+                    call.delete_field(alias_key, packed_field)
+                else:
+                    call.move_field(alias_key, packed_field, game_keys.key(player), pack_field(new_opponent, stats_field))
+                if opponent in renames:
+                    continue
+                opponent_key, alias_field = game_keys.key(opponent), pack_field(alias, stats_field)
+                if opponent == player:
+                    call.delete_field(opponent_key, alias_field)
+                else:
+                    call.move_field(opponent_key, alias_field, opponent_key, pack_field(player, stats_field))
+        await call.execute(context, self._merge_players_script, self.keys_manager.tagged)
+
+    async def replace_stats(self, context: RedisContext, options: types.ImportHeadToHeadOptions):
+        generation_keys = await self.keys_manager.begin_generation(context.r, options.game_name)
+        shadow_game_keys = generation_keys.namespace(options.game_name)
+        for players in chunked(options.players.items(), options.batch_size):
+            async with context.r.pipeline(transaction=False) as p:
+                for player, opponents in players:
+                    mapping = {}
+                    for opponent, delta in opponents.items():
+                        mapping[pack_field(opponent, GAMES_PLAYED_FIELD)] = delta.games_played
+                        if delta.games_won:
+                            mapping[pack_field(opponent, GAMES_WON_FIELD)] = delta.games_won
+                        if delta.games_lost:
+                            mapping[pack_field(opponent, GAMES_LOST_FIELD)] = delta.games_lost
+                    if mapping:
+                        await p.hset(shadow_game_keys.key(player), mapping=mapping)
+                await p.execute()
+        await self.keys_manager.commit_generation(context.r, options.game_name, generation_keys)
+
+
+@dataclass
+class ProfilesRepository:
+    r: redis.Redis
+    keys_manager: GenerationalKeysManager
+    aggregation: ProfileAggregation
+
+    async def add_game(self, context: RedisContext, options: types.ProfileGameOptions):
+        game_keys = self.keys_manager.namespace(options.game_name)
+        calls = [[player] for player in options.players] if self.keys_manager.tagged else [options.players]
+        for players in calls:
+            args = [repr(self.aggregation.ewma_alpha), len(PROFILE_METRICS), *PROFILE_METRIC_FIELDS.values()]
+            for player in players:
+                args.extend(repr(getattr(player, metric)) for metric in PROFILE_METRICS)
+                args.append(self.aggregation.sketch_bucket(player.apm))
+            await context.p.evalsha(
+                PROFILE_GAME_SHA,
+                len(players),
+                *(game_keys.key(player.login) for player in players),
+                *args,
+            )
+
+    async def profile(self, context: RedisContext, options: types.OneProfileOptions) -> types.PlayerProfile | None:
+        raw = await context.replica.hgetall(self.keys_manager.namespace(options.game_name).key(options.player))
+        if not raw:
+            return None
+        return load_profile(raw)
+
+    async def replace_profiles(self, context: RedisContext, options: types.ImportProfilesOptions):
+        generation_keys = await self.keys_manager.begin_generation(context.r, options.game_name)
+        shadow_game_keys = generation_keys.namespace(options.game_name)
+        for profiles in chunked(options.profiles.items(), options.batch_size):
+            async with context.r.pipeline(transaction=False) as p:
+                for player, profile in profiles:
+                    await p.hset(shadow_game_keys.key(player), mapping=dump_profile(profile))
+                await p.execute()
+        await self.keys_manager.commit_generation(context.r, options.game_name, generation_keys)
+
+    async def merge_players(self, context: RedisContext, options: types.MergePlayersOptions):
+        game_keys = self.keys_manager.namespace(options.game_name)
+        for alias, player in options.aliases.items():
+            if alias == player:
+                continue
+            if not self.keys_manager.tagged:
+                await context.p.eval(MERGE_PROFILE_SCRIPT, 2, game_keys.key(player), game_keys.key(alias))
+                continue
+            # The alias hash is in another slot, so it is taken first and passed to the script.
+            taken = await context.r.eval(TAKE_SCRIPT, 1, game_keys.key(alias), 'H')
+            if taken:
+                await context.p.eval(MERGE_PROFILE_SCRIPT, 1, game_keys.key(player), *taken)
+
+
 @dataclass
 class GamesRepository:
+    # The record is appended by the script that claims the id, so buffered writes never hold the only trace of a game.
     r: redis.Redis
     keys_manager: RedisKeysManager
+    _claim_game_script: AsyncScript = field(init=False)
+
+    def __post_init__(self):
+        self._claim_game_script = self.r.register_script(CLAIM_GAME_SCRIPT)
 
     async def add_played_game(self, context: RedisContext, options: types.GameOptions) -> types.AddGameResults:
-        key = self.keys_manager.namespace(options.game_name).key(GAMES_INDEX_KEY)
-        added = await self.r.sadd(key, options.id)
-        status = types.AddGameStatus.ADDED if added else types.AddGameStatus.DUPLICATE
-        return types.AddGameResults(status)
+        game_keys = self.keys_manager.unit(options.game_name)
+        added = await self._claim_game_script(
+            keys=[game_keys.key(GAMES_INDEX_KEY), self._get_records_key(options.game_name), game_keys.key(GAME_CLAIMS_KEY)],
+            args=[options.id, options.claim_id or '', *record_args(options.record)],
+            client=self.r,
+        )
+        return await self._added(context, options, added)
+
+    async def _added(self, context: RedisContext, options: types.GameOptions, added: int) -> types.AddGameResults:
+        if not added:
+            return types.AddGameResults(types.AddGameStatus.DUPLICATE)
+        if options.claim_id is not None:
+            # The claim is released by the transaction that writes the stats of the game, so until it commits
+            # the same claim id can apply the game again.
+            context.begin_transaction()
+            await context.p.hdel(self.keys_manager.unit(options.game_name).key(GAME_CLAIMS_KEY), options.id)
+        return types.AddGameResults(types.AddGameStatus.ADDED)
+
+    async def is_played_game(self, context: RedisContext, options: types.GameOptions) -> bool:
+        key = self.keys_manager.unit(options.game_name).key(GAMES_INDEX_KEY)
+        return bool(await context.r.sismember(key, options.id))
+
+    def _get_records_key(self, game_name: GameName) -> str:
+        return self.keys_manager.unit(game_name).key(GAME_RECORDS_KEY)
+
+
+@dataclass
+class BloomGamesRepository(GamesRepository):
+    capacity: int = 1_000_000
+    error_rate: float = 0.001
+    recent_window: int = 10_000
+    bits: int = field(init=False)
+    hashes: int = field(init=False)
+    _add_game_script: AsyncScript = field(init=False)
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.bits = bloom_bits(self.capacity, self.error_rate)
+        self.hashes = bloom_hashes(self.bits, self.capacity)
+        self._add_game_script = self.r.register_script(ADD_GAME_SCRIPT)
+        self._is_played_game_script = self.r.register_script(IS_PLAYED_GAME_SCRIPT)
+
+    async def add_played_game(self, context: RedisContext, options: types.GameOptions) -> types.AddGameResults:
+        added = await self._add_game_script(
+            keys=[
+                *self._get_dedup_keys(options.game_name),
+                self._get_records_key(options.game_name),
+                self.keys_manager.unit(options.game_name).key(GAME_CLAIMS_KEY),
+            ],
+            args=[options.id, self.recent_window, self.bits, self.hashes, options.claim_id or '', *record_args(options.record)],
+            client=context.r,
+        )
+        return await self._added(context, options, added)
+
+    async def is_played_game(self, context: RedisContext, options: types.GameOptions) -> bool:
+        played = await self._is_played_game_script(
+            keys=self._get_dedup_keys(options.game_name)[:2],
+            args=[options.id, self.bits, self.hashes],
+            client=context.r,
+        )
+        return bool(played)
+
+    async def rebuild_filter(
+            self,
+            context: RedisContext,
+            games_ids: AsyncIterator[str],
+            batch_size: int = 1000,
+            game_name: GameName = SURVIVAL_CHAOS,
+    ):
+        # The filter is filled next to the live one and renamed over it at once. Games pushed out of the recent window
+        # in the meantime only reach the old filter, so the bot has to be stopped first.
+        game_keys = self.keys_manager.unit(game_name)
+        shadow_key = game_keys.key(GAMES_BLOOM_REBUILD_KEY)
+        await context.r.delete(shadow_key)
+        async for ids in batched(games_ids, batch_size):
+            await context.r.eval(ADD_TO_BLOOM_SCRIPT, 1, shadow_key, self.bits, self.hashes, *ids)
+        if await context.r.exists(shadow_key):
+            await context.r.rename(shadow_key, game_keys.key(GAMES_BLOOM_KEY))
+        else:
+            await context.r.delete(game_keys.key(GAMES_BLOOM_KEY))
+
+    def _get_dedup_keys(self, game_name: GameName) -> list[str]:
+        game_keys = self.keys_manager.unit(game_name)
+        return [game_keys.key(RECENT_GAMES_KEY), game_keys.key(GAMES_BLOOM_KEY), game_keys.key(GAMES_SEQUENCE_KEY)]
+
+
+@dataclass
+class GameRecordsRepository:
+    r: redis.Redis
+    keys_manager: RedisKeysManager
+
+    async def game_records(
+            self,
+            context: RedisContext,
+            options: types.AllGameRecordsOptions,
+    ) -> AsyncIterator[types.GameRecord]:
+        key = self._get_records_key(options.game_name)
+        start = '-'
+        while entries := await context.r.xrange(key, min=start, count=options.batch_size):
+            for _, entry in entries:
+                yield load_game_record(entry[GAME_RECORD_FIELD], options.game_name)
+            start = f'({entries[-1][0]}'
+
+    def _get_records_key(self, game_name: GameName) -> str:
+        return self.keys_manager.unit(game_name).key(GAME_RECORDS_KEY)
+
+
+def record_args(record: types.GameRecord | None) -> list[str]:
+    return [] if record is None else [GAME_RECORD_FIELD, dump_game_record(record)]
+
+
+def bloom_bits(capacity: int, error_rate: float) -> int:
+    return math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+
+
+def bloom_hashes(bits: int, capacity: int) -> int:
+    return max(1, round(bits / capacity * math.log(2)))
 
 
 @dataclass
@@ -144,11 +1253,374 @@ class PlayersRepository:
             options.login,
         )
 
+    async def add_aliases(self, context: RedisContext, options: types.AddPlayerAliasesOptions):
+        if options.aliases:
+            await context.p.hset(self.keys_manager.key(ALIASES_KEY), mapping=dict(options.aliases))
+
     async def normalize_players(self, context: RedisContext, players: Iterable[Login]) -> Iterable[Login | None]:
-        return await self.r.hmget(
-            self.keys_manager.key(ALIASES_KEY),
-            list(players),
+        players = list(players)
+        if not players:
+            return []
+        return await context.replica.hmget(self.keys_manager.key(ALIASES_KEY), players)
+
+
+@dataclass
+class CachedPlayersRepository(PlayersRepository):
+    reconnect_delay: float = 1.0
+    _aliases: dict[Login, Login] = field(default_factory=dict)
+    _listener: asyncio.Task | None = None
+
+    async def start(self):
+        pubsub = self.r.pubsub()
+        await pubsub.subscribe(self.keys_manager.key(ALIASES_CHANNEL))
+        await self._reload()
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    async def add_alias(self, context: RedisContext, options: types.AddPlayerAliasOptions):
+        await super().add_alias(context, options)
+        await context.p.publish(
+            self.keys_manager.key(ALIASES_CHANNEL),
+            json.dumps([options.alias, options.login]),
         )
+        context.on_commit.append(lambda: self._update_aliases({options.alias: options.login}))
+
+    async def add_aliases(self, context: RedisContext, options: types.AddPlayerAliasesOptions):
+        await super().add_aliases(context, options)
+        for alias, login in options.aliases.items():
+            await context.p.publish(self.keys_manager.key(ALIASES_CHANNEL), json.dumps([alias, login]))
+        context.on_commit.append(lambda: self._update_aliases(options.aliases))
+
+    async def normalize_players(self, context: RedisContext, players: Iterable[Login]) -> Iterable[Login | None]:
+        if self._listener is None:
+            return await super().normalize_players(context, players)
+        return [self._aliases.get(p) for p in players]
+
+    async def _update_aliases(self, aliases: Mapping[Login, Login]):
+        self._aliases.update(aliases)
+
+    async def _reload(self):
+        self._aliases = await self.r.hgetall(self.keys_manager.key(ALIASES_KEY))
+
+    async def _listen(self, pubsub: redis.client.PubSub):
+        async with pubsub:
+            while True:
+                try:
+                    async for message in pubsub.listen():
+                        await self._on_message(message)
+                except redis.ConnectionError:
+                    await asyncio.sleep(self.reconnect_delay)
+
+    async def _on_message(self, message: dict):
+        match message['type']:
+            case 'message':
+                alias, login = json.loads(message['data'])
+                self._aliases[Login(alias)] = Login(login)
+            case 'subscribe':
+                # The client resubscribes after a reconnect, anything published meanwhile is lost.
+                await self._reload()
+
+
+@dataclass
+class ClientSideCache:
+    # Server-assisted caching in the RESP2 broadcasting mode, changes under the prefixes are published to the listener.
+    r: redis.Redis
+    prefixes: list[str]
+    max_keys: int = 10_000
+    reconnect_delay: float = 1.0
+    _entries: OrderedDict[str, dict[tuple, object]] = field(default_factory=OrderedDict)
+    _reading: Counter[str] = field(default_factory=Counter)
+    _invalidated: set[str] = field(default_factory=set)
+    _epoch: int = 0
+    _enabled: bool = False
+    _listener: asyncio.Task | None = None
+
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def client(self, r: redis.Redis) -> CachedReadsClient:
+        return CachedReadsClient(r, self)
+
+    async def execute(self, r: redis.Redis, commands: list[tuple[str, tuple, dict]]) -> list:
+        results = [self._get(command) for command in commands] if self._enabled else [MISSING] * len(commands)
+        misses = [i for i, result in enumerate(results) if result is MISSING]
+        if not misses:
+            return results
+        epoch = self._epoch
+        keys = [commands[i][1][0] for i in misses if commands[i][0] in CACHED_COMMANDS]
+        self._reading.update(keys)
+        try:
+            async with r.pipeline(transaction=False) as p:
+                for i in misses:
+                    name, args, kwargs = commands[i]
+                    await getattr(p, name)(*args, **kwargs)
+                values = await p.execute()
+            for i, value in zip(misses, values):
+                results[i] = value
+                name, args, _ = commands[i]
+                # A value read while its key was invalidated may be older than the invalidation.
+                if name in CACHED_COMMANDS and self._enabled and self._epoch == epoch and args[0] not in self._invalidated:
+                    self._set(commands[i], copy.copy(value))
+        finally:
+            self._reading.subtract(keys)
+            for key in keys:
+                if self._reading[key] <= 0:
+                    del self._reading[key]
+                    self._invalidated.discard(key)
+        return results
+
+    def _get(self, command: tuple[str, tuple, dict]) -> object:
+        name, args, _ = command
+        if name not in CACHED_COMMANDS:
+            return MISSING
+        key, *args = args
+        entries = self._entries.get(key)
+        if entries is None:
+            return MISSING
+        self._entries.move_to_end(key)
+        value = entries.get((name, tuple(args)), MISSING)
+        return value if value is MISSING else copy.copy(value)
+
+    def _set(self, command: tuple[str, tuple, dict], value: object):
+        name, (key, *args), _ = command
+        self._entries.setdefault(key, {})[(name, tuple(args))] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+    def _invalidate(self, keys: list[str] | None):
+        if keys is None:
+            self._clear()
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+            if key in self._reading:
+                self._invalidated.add(key)
+
+    def _clear(self):
+        self._entries.clear()
+        self._epoch += 1
+
+    async def _listen(self):
+        while True:
+            try:
+                await self._track()
+            except (redis.ConnectionError, redis.TimeoutError, OSError):
+                await asyncio.sleep(self.reconnect_delay)
+            except Exception:
+                logger.exception('Client side cache tracking failed')
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                self._enabled = False
+                self._clear()
+
+    async def _track(self):
+        pool = self.r.connection_pool
+        invalidations = pool.connection_class(**pool.connection_kwargs)
+        tracking = pool.connection_class(**pool.connection_kwargs)
+        try:
+            await invalidations.connect()
+            await invalidations.send_command('CLIENT', 'ID')
+            client_id = await invalidations.read_response()
+            await invalidations.send_command('SUBSCRIBE', INVALIDATION_CHANNEL)
+            await invalidations.read_response()
+            await tracking.connect()
+            await tracking.send_command(
+                'CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST',
+                *chain.from_iterable(('PREFIX', prefix) for prefix in self.prefixes),
+            )
+            await tracking.read_response()
+            self._enabled = True
+            while True:
+                message = await invalidations.read_response(timeout=TRACKING_CHECK_INTERVAL)
+                if message is None:
+                    # Tracking ends silently with its connection, so the connection is checked while nothing changes.
+                    await tracking.send_command('PING')
+                    await tracking.read_response()
+                elif message[0] == 'message':
+                    self._invalidate(message[2])
+        finally:
+            await invalidations.disconnect()
+            await tracking.disconnect()
+
+
+class CachedReadsClient:
+    def __init__(self, r: redis.Redis, cache: ClientSideCache):
+        self._r = r
+        self._cache = cache
+
+    def __getattr__(self, name: str):
+        return getattr(self._r, name)
+
+    async def hgetall(self, key: str) -> dict:
+        return (await self._cache.execute(self._r, [('hgetall', (key,), {})]))[0]
+
+    async def hmget(self, key: str, keys, *args) -> list:
+        return (await self._cache.execute(self._r, [('hmget', (key, *hmget_fields(keys, args)), {})]))[0]
+
+    async def smembers(self, key: str) -> set:
+        return (await self._cache.execute(self._r, [('smembers', (key,), {})]))[0]
+
+    def pipeline(self, transaction: bool = False) -> CachedReadsPipeline:
+        return CachedReadsPipeline(self._r, self._cache)
+
+
+class CachedReadsPipeline(AsyncContextManager):
+    def __init__(self, r: redis.Redis, cache: ClientSideCache):
+        self._r = r
+        self._cache = cache
+        self._commands: list[tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        async def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+
+        return queue
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._commands = []
+
+    async def hgetall(self, key: str):
+        self._commands.append(('hgetall', (key,), {}))
+
+    async def hmget(self, key: str, keys, *args):
+        self._commands.append(('hmget', (key, *hmget_fields(keys, args)), {}))
+
+    async def smembers(self, key: str):
+        self._commands.append(('smembers', (key,), {}))
+
+    async def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return await self._cache.execute(self._r, commands)
+
+
+@dataclass
+class RedisService:
+    r: redis.Redis
+    scripts: Iterable[str] = ()
+    buffer: WriteBehindBuffer | None = None
+
+    async def start(self):
+        await self.r.ping()
+        for script in self.scripts:
+            await self.r.script_load(script)
+
+    async def close(self):
+        if self.buffer is not None:
+            await self.buffer.close()
+        await self.r.close()
+
+
+class CountingStreamReader:
+    def __init__(self, reader: asyncio.StreamReader):
+        self._reader = reader
+
+    def __getattr__(self, name: str):
+        return getattr(self._reader, name)
+
+    async def read(self, n: int = -1) -> bytes:
+        data = await self._reader.read(n)
+        metrics.count(bytes_received=len(data))
+        return data
+
+    async def readline(self) -> bytes:
+        data = await self._reader.readline()
+        metrics.count(bytes_received=len(data))
+        return data
+
+    async def readexactly(self, n: int) -> bytes:
+        data = await self._reader.readexactly(n)
+        metrics.count(bytes_received=len(data))
+        return data
+
+
+class InstrumentedConnectionMixin:
+    def pack_command(self, *args):
+        metrics.count(commands=1)
+        return super().pack_command(*args)
+
+    def pack_commands(self, commands):
+        metrics.count(pipelines=1)
+        return super().pack_commands(commands)
+
+    async def send_packed_command(self, command, check_health: bool = True):
+        if isinstance(command, str):
+            command = command.encode()
+        size = len(command) if isinstance(command, bytes) else sum(map(len, command))
+        metrics.count(round_trips=1, bytes_sent=size)
+        await super().send_packed_command(command, check_health)
+
+    async def _connect(self):
+        await super()._connect()
+        self._reader = CountingStreamReader(self._reader)
+
+
+class InstrumentedConnection(InstrumentedConnectionMixin, Connection):
+    pass
+
+
+class InstrumentedSSLConnection(InstrumentedConnectionMixin, SSLConnection):
+    pass
+
+
+class AwaitableClusterPipeline(ClusterPipeline):
+    def __await__(self) -> Generator[None, None, AwaitableClusterPipeline]:
+        # Commands of the cluster pipeline return the pipeline itself and awaiting it used to clear the queued ones,
+        # while the repositories await every command as they do on a regular pipeline.
+        yield from ()
+        return self
+
+    def evalsha(self, sha: str, numkeys: int, *keys_and_args) -> AwaitableClusterPipeline:
+        # Registered scripts can't be reloaded after NOSCRIPT here, so their source is sent. The pipeline blocks
+        # evalsha(), so loaded scripts are queued as a command, see execute_pipeline.
+        if sha in LOADED_SCRIPTS:
+            return self.execute_command('EVALSHA', sha, numkeys, *keys_and_args)
+        return self.eval(self._client.scripts[sha], numkeys, *keys_and_args)
+
+    async def reset(self):
+        self._command_stack = []
+
+
+class RedisCluster(redis.RedisCluster):
+    def __init__(self, *args, ssl: bool = False, **kwargs):
+        super().__init__(*args, ssl=ssl, **kwargs)
+        self.scripts: dict[str, str] = {}
+        # RedisCluster() doesn't accept a connection class, new nodes take it from the shared connection kwargs.
+        connection_class = InstrumentedSSLConnection if ssl else InstrumentedConnection
+        self.nodes_manager.connection_kwargs['connection_class'] = connection_class
+        for node in self.nodes_manager.startup_nodes.values():
+            node.connection_class = connection_class
+
+    def pipeline(self, transaction: bool | None = None, shard_hint: str | None = None) -> AwaitableClusterPipeline:
+        if transaction or shard_hint:
+            raise redis.RedisClusterException('Transactions are not supported by the cluster pipeline')
+        return AwaitableClusterPipeline(self)
+
+    def register_script(self, script: str) -> AsyncScript:
+        registered = super().register_script(script)
+        self.scripts[registered.sha] = script
+        return registered
+
+
+def make_redis_replica(
+        host: str | None = os.getenv('REDIS_REPLICA_HOST'),
+        port: int = int(os.getenv('REDIS_REPLICA_PORT', 6379)),
+) -> redis.Redis | None:
+    if host is None:
+        return None
+    return make_redis(host, port, cluster=False)
 
 
 def make_redis(
@@ -156,8 +1628,18 @@ def make_redis(
         port: int = int(os.getenv('REDIS_PORT', 6379)),
         password: str | None = os.getenv('REDIS_PASSWORD'),
         cert_path: str | None = os.getenv('CERT_PATH'),
-) -> redis.Redis:
-    return redis.Redis(
+        cluster: bool = os.getenv('REDIS_CLUSTER', '0') == '1',
+) -> redis.Redis | RedisCluster:
+    if cluster:
+        return RedisCluster(
+            host=host,
+            port=port,
+            password=password,
+            decode_responses=True,
+            ssl=cert_path is not None,
+            ssl_ca_certs=cert_path,
+        )
+    r = redis.Redis(
         host=host,
         port=port,
         password=password,
@@ -165,16 +1647,384 @@ def make_redis(
         ssl=cert_path is not None,
         ssl_ca_certs=cert_path,
     )
+    # Redis() picks the connection class by the ssl flag, so the instrumented one is set on the pool afterwards.
+    r.connection_pool.connection_class = InstrumentedSSLConnection if cert_path is not None else InstrumentedConnection
+    return r
+
+
+T = TypeVar('T')
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+async def sscan_unique(r: redis.Redis, key: str, count: int) -> AsyncIterator[str]:
+    # SSCAN may return an element more than once while the set is being rehashed.
+    seen = set()
+    async for member in r.sscan_iter(key, count=count):
+        if member not in seen:
+            seen.add(member)
+            yield member
+
+
+async def batched(items: AsyncIterator[str], size: int) -> AsyncIterator[list[str]]:
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 
+async def delete_namespace(r: redis.Redis, keys_manager: RedisKeysManager):
+    async for keys in batched(r.scan_iter(match=keys_manager.pattern(), count=SCAN_BATCH_SIZE), SCAN_BATCH_SIZE):
+        await r.unlink(*keys)
 
-def serialize_group(group: GroupDescriptor) -> str:
-    return ''.join(login[:2] for login in sorted(group))
+
+async def execute_pipeline(r: redis.Redis, p: redis.client.Pipeline | ClusterPipeline) -> list:
+    # Scripts of LOADED_SCRIPTS are sent as EVALSHA. The server loses them on a restart or SCRIPT FLUSH, and a lost one
+    # fails with NOSCRIPT without running, so it is run again with its source, which also loads it for the next games.
+    if isinstance(p, ClusterPipeline):
+        commands = [command.args for command in p._command_stack]
+    else:
+        commands = [args for args, _ in p.command_stack]
+    results = await p.execute(raise_on_error=False)
+    for i, (args, result) in enumerate(zip(commands, results)):
+        if isinstance(result, NoScriptError) and args[0] == 'EVALSHA' and args[1] in LOADED_SCRIPTS:
+            results[i] = await r.eval(LOADED_SCRIPTS[args[1]], *args[2:])
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+def script_sha(script: str) -> str:
+    return hashlib.sha1(script.encode()).hexdigest()
+
+
+def hmget_fields(keys, args: tuple) -> tuple:
+    return (*keys, *args) if isinstance(keys, (list, tuple)) else (keys, *args)
 
 
 GROUP_KEY = 'gr'
 GROUP_MEMBERS_KEY = 'members'
+PLAYER_GROUPS_KEY = '#groups'
+GROUP_REGISTRY_KEY = '#group_registry'
 GAMES_PLAYED_FIELD = 'ga'
 GAMES_WON_FIELD = 'gw'
+GAMES_LOST_FIELD = 'gl'
+STATS_FIELDS = (GAMES_PLAYED_FIELD, GAMES_WON_FIELD)
+PACKED_KEY = '#packed'
+PACKED_READ_BUCKETS = 16
 INDIVIDUAL_PLAYERS_INDEX_KEY = '#index'
 GAMES_INDEX_KEY = '#index'
+RECENT_GAMES_KEY = '#recent'
+GAMES_BLOOM_KEY = '#bloom'
+GAMES_BLOOM_REBUILD_KEY = '#bloom_rebuild'
+GAMES_SEQUENCE_KEY = '#sequence'
+GAME_RECORDS_KEY = '#records'
+GAME_CLAIMS_KEY = '#claims'
+GAME_RECORD_FIELD = 'g'
+RATINGS_KEY = '#ratings'
+GENERATIONS_KEY = '#generations'
+GENERATIONS_CHANNEL = '#generations_channel'
+GENERATION_KEY = '#g'
+GENERATION_ID_SIZE = 8
+STALE_GENERATION_SUFFIX = ':#stale'
+SCAN_BATCH_SIZE = 1000
+BUFFERED_COMMANDS = frozenset(('HINCRBY', 'SADD', 'HSETNX', 'EXPIREAT', 'EVAL', 'EVALSHA'))
+WRITE_BEHIND_BATCH_KEY = '#write_behind'
+WRITE_BEHIND_BATCH_TTL = 86400
+INVALIDATION_CHANNEL = '__redis__:invalidate'
+TRACKING_CHECK_INTERVAL = 5.0
+MISSING = object()
+CACHED_COMMANDS = frozenset(('hgetall', 'hmget', 'smembers'))
 ALIASES_KEY = '#aliases'
+ALIASES_CHANNEL = '#aliases_channel'
+
+# Merges stats of aliases into their players. ARGV starts with the number of (alias, player) pairs followed by
+# the pairs themselves, then come the operations over KEYS referenced by index:
+#   H src dst       - HINCRBY every field of hash src into dst and delete src
+#   S src dst       - move all members of set src into dst, renaming aliases to their players
+#   R key old new   - replace member old with new in set key if it is there
+#   M src dst sf df - HINCRBY field df of hash dst by field sf of hash src and HDEL it from src
+#   X key field     - HDEL field from hash key
+#   F key field val - HSET field of hash key to val
+MERGE_PLAYERS_SCRIPT = """
+local renames = {}
+local renames_count = tonumber(ARGV[1])
+for i = 2, 2 * renames_count, 2 do
+    renames[ARGV[i]] = ARGV[i + 1]
+end
+local i = 2 * renames_count + 2
+while i <= #ARGV do
+    local op = ARGV[i]
+    if op == 'H' then
+        local src, dst = KEYS[tonumber(ARGV[i + 1])], KEYS[tonumber(ARGV[i + 2])]
+        if src ~= dst then
+            local fields = redis.call('HGETALL', src)
+            for j = 1, #fields, 2 do
+                redis.call('HINCRBY', dst, fields[j], fields[j + 1])
+            end
+            redis.call('DEL', src)
+        end
+        i = i + 3
+    elseif op == 'S' then
+        local src, dst = KEYS[tonumber(ARGV[i + 1])], KEYS[tonumber(ARGV[i + 2])]
+        local members = redis.call('SMEMBERS', src)
+        redis.call('DEL', src)
+        for _, member in ipairs(members) do
+            redis.call('SADD', dst, renames[member] or member)
+        end
+        i = i + 3
+    elseif op == 'R' then
+        local key = KEYS[tonumber(ARGV[i + 1])]
+        if redis.call('SREM', key, ARGV[i + 2]) == 1 then
+            redis.call('SADD', key, ARGV[i + 3])
+        end
+        i = i + 4
+    elseif op == 'M' then
+        local src, dst = KEYS[tonumber(ARGV[i + 1])], KEYS[tonumber(ARGV[i + 2])]
+        local src_field, dst_field = ARGV[i + 3], ARGV[i + 4]
+        if src ~= dst or src_field ~= dst_field then
+            local value = redis.call('HGET', src, src_field)
+            if value then
+                redis.call('HDEL', src, src_field)
+                redis.call('HINCRBY', dst, dst_field, value)
+            end
+        end
+        i = i + 5
+    elseif op == 'X' then
+        redis.call('HDEL', KEYS[tonumber(ARGV[i + 1])], ARGV[i + 2])
+        i = i + 3
+    elseif op == 'F' then
+        redis.call('HSET', KEYS[tonumber(ARGV[i + 1])], ARGV[i + 2], ARGV[i + 3])
+        i = i + 4
+    else
+        return redis.error_reply('unknown merge operation ' .. op)
+    end
+end
+"""
+
+
+# Removes and returns what a step of MERGE_PLAYERS_SCRIPT moves out of KEYS[1] when its destination is in another
+# cluster slot: the hash for H, the members for S and the field ARGV[2] for M.
+TAKE_SCRIPT = """
+local value
+if ARGV[1] == 'H' then
+    value = redis.call('HGETALL', KEYS[1])
+    redis.call('DEL', KEYS[1])
+elseif ARGV[1] == 'S' then
+    value = redis.call('SMEMBERS', KEYS[1])
+    redis.call('DEL', KEYS[1])
+else
+    value = redis.call('HGET', KEYS[1], ARGV[2])
+    redis.call('HDEL', KEYS[1], ARGV[2])
+end
+return value
+"""
+
+BLOOM_POSITIONS_FUNCTION = """
+local function positions(member, bits, hashes)
+    local digest = redis.sha1hex(member)
+    local h1 = tonumber(string.sub(digest, 1, 8), 16)
+    local h2 = tonumber(string.sub(digest, 9, 16), 16)
+    local result = {}
+    for i = 0, hashes - 1 do
+        result[#result + 1] = (h1 + i * h2) % bits
+    end
+    return result
+end
+local function in_bloom(key, member, bits, hashes)
+    for _, position in ipairs(positions(member, bits, hashes)) do
+        if redis.call('GETBIT', key, position) == 0 then
+            return false
+        end
+    end
+    return true
+end
+"""
+
+# Claims the game id ARGV[1] in the set KEYS[1] and appends its record ARGV[3] to the stream KEYS[2] as field ARGV[2]
+# when they are given. Returns 1 if the game is new and 0 if it is a duplicate.
+CLAIM_GAME_SCRIPT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    if ARGV[2] ~= '' and redis.call('HGET', KEYS[3], ARGV[1]) == ARGV[2] then
+        return 1
+    end
+    return 0
+end
+if ARGV[2] ~= '' then
+    redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+end
+if ARGV[3] then
+    redis.call('XADD', KEYS[2], '*', ARGV[3], ARGV[4])
+end
+return 1
+"""
+
+# Exact dedup for the last ARGV[2] games in the sorted set KEYS[1], ordered by the counter KEYS[3]. Older games go to
+# the Bloom filter bitmap KEYS[2] of ARGV[3] bits and ARGV[4] hashes. The record ARGV[6] of a new game is appended to
+# the stream KEYS[4] as field ARGV[5]. Returns 1 if ARGV[1] is new and 0 if it is (probably) a duplicate.
+ADD_GAME_SCRIPT = BLOOM_POSITIONS_FUNCTION + """
+local id, window, bits, hashes = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+if redis.call('ZSCORE', KEYS[1], id) or in_bloom(KEYS[2], id, bits, hashes) then
+    if ARGV[5] ~= '' and redis.call('HGET', KEYS[5], id) == ARGV[5] then
+        return 1
+    end
+    return 0
+end
+if ARGV[5] ~= '' then
+    redis.call('HSET', KEYS[5], id, ARGV[5])
+end
+if ARGV[6] then
+    redis.call('XADD', KEYS[4], '*', ARGV[6], ARGV[7])
+end
+redis.call('ZADD', KEYS[1], redis.call('INCR', KEYS[3]), id)
+local overflow = redis.call('ZCARD', KEYS[1]) - window
+if overflow > 0 then
+    for _, old in ipairs(redis.call('ZRANGE', KEYS[1], 0, overflow - 1)) do
+        for _, position in ipairs(positions(old, bits, hashes)) do
+            redis.call('SETBIT', KEYS[2], position, 1)
+        end
+    end
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, overflow - 1)
+end
+return 1
+"""
+
+# Sets the bits of the game ids ARGV[3..] in the Bloom filter bitmap KEYS[1] of ARGV[1] bits with ARGV[2] hash functions.
+ADD_TO_BLOOM_SCRIPT = BLOOM_POSITIONS_FUNCTION + """
+local bits, hashes = tonumber(ARGV[1]), tonumber(ARGV[2])
+for i = 3, #ARGV do
+    for _, position in ipairs(positions(ARGV[i], bits, hashes)) do
+        redis.call('SETBIT', KEYS[1], position, 1)
+    end
+end
+"""
+
+# Read-only counterpart of ADD_GAME_SCRIPT: returns 1 if ARGV[1] is (probably) already processed.
+IS_PLAYED_GAME_SCRIPT = BLOOM_POSITIONS_FUNCTION + """
+local id, bits, hashes = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+if redis.call('ZSCORE', KEYS[1], id) or in_bloom(KEYS[2], id, bits, hashes) then
+    return 1
+end
+return 0
+"""
+
+# Rates a game in the sorted set KEYS[1] the way EloRating.deltas does: ARGV holds k, the initial rating, the index of
+# the winner and the players. Scores are written with 17 digits, so they match the ratings computed by a rebuild.
+RATE_GAME_SCRIPT = """
+local k, initial, winner = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local players, ratings = {}, {}
+for i = 4, #ARGV do
+    players[#players + 1] = ARGV[i]
+    ratings[#ratings + 1] = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[i])) or initial
+end
+local won = 0
+for i = 1, #players do
+    if i ~= winner then
+        local expected = 1 / (1 + 10 ^ ((ratings[i] - ratings[winner]) / 400))
+        local change = k * (1 - expected) / (#players - 1)
+        won = won + change
+        redis.call('ZADD', KEYS[1], string.format('%.17g', ratings[i] - change), players[i])
+    end
+end
+redis.call('ZADD', KEYS[1], string.format('%.17g', ratings[winner] + won), players[winner])
+"""
+
+# Merges ratings of aliases in the sorted set KEYS[1] the way EloRating.merge does: ARGV holds the initial rating and
+# the (alias, player) pairs.
+MERGE_RATINGS_SCRIPT = """
+local initial = tonumber(ARGV[1])
+for i = 2, #ARGV, 2 do
+    local rating = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[i]))
+    if rating then
+        local current = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[i + 1])) or initial
+        redis.call('ZREM', KEYS[1], ARGV[i])
+        redis.call('ZADD', KEYS[1], string.format('%.17g', current + rating - initial), ARGV[i + 1])
+    end
+end
+"""
+
+# Adds a game to the profiles in KEYS the way ProfileAggregation.add does: ARGV holds the EWMA alpha, the number of
+# metrics and their fields, then the metrics values and the APM sketch bucket of every player in the order of KEYS.
+PROFILE_GAME_SCRIPT = """
+local alpha, metrics = tonumber(ARGV[1]), tonumber(ARGV[2])
+local fields = {}
+for m = 1, metrics do
+    local prefix = ARGV[2 + m]
+    fields[#fields + 1] = prefix .. ':s'
+    fields[#fields + 1] = prefix .. ':q'
+    fields[#fields + 1] = prefix .. ':e'
+end
+local i = 3 + metrics
+for _, key in ipairs(KEYS) do
+    local current = redis.call('HMGET', key, unpack(fields))
+    local updated = {}
+    for m = 1, metrics do
+        local value = tonumber(ARGV[i + m - 1])
+        local total = (tonumber(current[3 * m - 2]) or 0) + value
+        local squares = (tonumber(current[3 * m - 1]) or 0) + value * value
+        local ewma = tonumber(current[3 * m])
+        if ewma then
+            ewma = ewma + alpha * (value - ewma)
+        else
+            ewma = value
+        end
+        for j, aggregate in ipairs({total, squares, ewma}) do
+            updated[#updated + 1] = fields[3 * m - 3 + j]
+            updated[#updated + 1] = string.format('%.17g', aggregate)
+        end
+    end
+    redis.call('HSET', key, unpack(updated))
+    redis.call('HINCRBY', key, 'n', 1)
+    redis.call('HINCRBY', key, 'apm:' .. ARGV[i + metrics], 1)
+    i = i + metrics + 1
+end
+"""
+
+# Merges the profile of an alias into the profile KEYS[1] the way ProfileAggregation.merge does. The alias profile is
+# taken from KEYS[2] when it is given and from ARGV as its HGETALL otherwise.
+MERGE_PROFILE_SCRIPT = """
+local alias = ARGV
+if KEYS[2] then
+    alias = redis.call('HGETALL', KEYS[2])
+    redis.call('DEL', KEYS[2])
+end
+local fields = {}
+for i = 1, #alias, 2 do
+    fields[alias[i]] = alias[i + 1]
+end
+local games = tonumber(redis.call('HGET', KEYS[1], 'n')) or 0
+local alias_games = tonumber(fields['n']) or 0
+local updated = {}
+for field, value in pairs(fields) do
+    if field == 'n' or string.sub(field, 1, 4) == 'apm:' then
+        redis.call('HINCRBY', KEYS[1], field, value)
+    else
+        local current, merged = tonumber(redis.call('HGET', KEYS[1], field)), tonumber(value)
+        if current and string.sub(field, -2) == ':e' then
+            merged = (current * games + merged * alias_games) / (games + alias_games)
+        elseif current then
+            merged = current + merged
+        end
+        updated[#updated + 1] = field
+        updated[#updated + 1] = string.format('%.17g', merged)
+    end
+end
+if #updated > 0 then
+    redis.call('HSET', KEYS[1], unpack(updated))
+end
+"""
+
+RATE_GAME_SHA = script_sha(RATE_GAME_SCRIPT)
+PROFILE_GAME_SHA = script_sha(PROFILE_GAME_SCRIPT)
+LOADED_SCRIPTS = {RATE_GAME_SHA: RATE_GAME_SCRIPT, PROFILE_GAME_SHA: PROFILE_GAME_SCRIPT}
+
+logger = logging.getLogger(__name__)
@@ -0,0 +1,665 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import time
+from collections.abc import AsyncIterator, Iterable, Mapping
+from dataclasses import dataclass, field
+from typing import Any, AsyncContextManager
+
+from disco_war.profiles import ProfileAggregation
+from disco_war.ratings import EloRating
+from disco_war.repository import types
+from disco_war.repository.common import (
+    serialize_group,
+    dump_group,
+    load_group,
+    dump_game_record,
+    load_game_record,
+    dump_profile,
+    load_profile,
+)
+from disco_war.common_types import Login, GroupDescriptor
+
+
+@dataclass
+class SQLiteDatabase:
+    path: str
+    busy_timeout: int = 5000
+    connection: sqlite3.Connection | None = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    async def start(self):
+        self.connection = await asyncio.to_thread(self._connect)
+
+    async def close(self):
+        if self.connection is not None:
+            await asyncio.to_thread(self.connection.close)
+            self.connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connection.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        connection.executescript(SCHEMA)
+        return connection
+
+
+class SQLiteContext(AsyncContextManager):
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+        self.on_commit: list[types.CommitCallback] = []
+
+    async def __aenter__(self):
+        # One connection is shared by the process, so contexts are serialized and must not be nested.
+        await self.database.lock.acquire()
+        try:
+            await self.execute('BEGIN')
+        except BaseException:
+            self.database.lock.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            await self.execute('COMMIT' if exc_value is None else 'ROLLBACK')
+        finally:
+            self.database.lock.release()
+        if exc_value is None:
+            for callback in self.on_commit:
+                await callback()
+
+    async def execute(self, sql: str, parameters: Iterable[Any] = ()) -> int:
+        return await asyncio.to_thread(lambda: self.database.connection.execute(sql, tuple(parameters)).rowcount)
+
+    async def executemany(self, sql: str, parameters: Iterable[Iterable[Any]]):
+        await asyncio.to_thread(self.database.connection.executemany, sql, parameters)
+
+    async def fetchall(self, sql: str, parameters: Iterable[Any] = ()) -> list[tuple]:
+        return await asyncio.to_thread(lambda: self.database.connection.execute(sql, tuple(parameters)).fetchall())
+
+    async def fetchone(self, sql: str, parameters: Iterable[Any] = ()) -> tuple | None:
+        return await asyncio.to_thread(lambda: self.database.connection.execute(sql, tuple(parameters)).fetchone())
+
+
+@dataclass
+class SQLiteRepositoryContextManager:
+    database: SQLiteDatabase
+
+    def start(self, buffered: bool = False) -> SQLiteContext:
+        return SQLiteContext(self.database)
+
+
+@dataclass
+class SQLiteIndividualStatsRepository:
+    async def add_game_played_for_player(self, context: SQLiteContext, options: types.ChangeIndividualStatsOptions):
+        await context.execute(UPSERT_STATS, (options.game_name, options.player, options.amount, 0))
+
+    async def add_game_won_for_player(self, context: SQLiteContext, options: types.ChangeIndividualStatsOptions):
+        await context.execute(UPSERT_STATS, (options.game_name, options.player, 0, options.amount))
+
+    async def add_game_played_in_group_for_player(self, context: SQLiteContext, options: types.ChangeIndividualGroupStatsOptions):
+        group_id = serialize_group(options.group)
+        await context.execute(INSERT_GROUP, (options.game_name, group_id, dump_group(options.group)))
+        await context.execute(UPSERT_GROUP_STATS, (options.game_name, group_id, options.player, options.amount, 0))
+
+    async def add_game_won_in_group_for_player(self, context: SQLiteContext, options: types.ChangeIndividualGroupStatsOptions):
+        group_id = serialize_group(options.group)
+        await context.execute(UPSERT_GROUP_STATS, (options.game_name, group_id, options.player, 0, options.amount))
+
+    async def stats(self, context: SQLiteContext, options: types.AllIndividualStatsOptions) -> list[types.IndividualStats]:
+        rows = await context.fetchall(
+            'SELECT login, games_played, games_won FROM individual_stats WHERE game_name = ?',
+            (options.game_name,),
+        )
+        return [types.IndividualStats(*row) for row in rows]
+
+    async def stats_for_player(self, context: SQLiteContext, options: types.OneIndividualStatsOptions) -> types.IndividualStats | None:
+        row = await context.fetchone(
+            'SELECT login, games_played, games_won FROM individual_stats WHERE game_name = ? AND login = ?',
+            (options.game_name, options.player),
+        )
+        return types.IndividualStats(*row) if row is not None else None
+
+    async def group_stats(self, context: SQLiteContext, options: types.GroupIndividualStatsOptions):
+        rows = await context.fetchall(
+            'SELECT login, games_played, games_won FROM group_stats WHERE game_name = ? AND group_id = ?',
+            (options.game_name, serialize_group(options.group)),
+        )
+        return [types.IndividualStats(*row) for row in rows]
+
+    async def groups_stats_for_player(
+            self,
+            context: SQLiteContext,
+            options: types.OneIndividualStatsOptions,
+    ) -> list[types.PlayerGroupStats]:
+        rows = await context.fetchall(SELECT_PLAYER_GROUPS, (options.game_name, options.player))
+        return [
+            types.PlayerGroupStats(load_group(members), types.IndividualStats(options.player, games_played, games_won))
+            for members, games_played, games_won in rows
+        ]
+
+    async def best_group_for_player(
+            self,
+            context: SQLiteContext,
+            options: types.BestGroupOptions,
+    ) -> types.PlayerGroupStats | None:
+        row = await context.fetchone(SELECT_BEST_GROUP, (options.game_name, options.player, options.min_games_played))
+        if row is None:
+            return None
+        members, games_played, games_won = row
+        return types.PlayerGroupStats(load_group(members), types.IndividualStats(options.player, games_played, games_won))
+
+    async def import_stats(self, context: SQLiteContext, options: types.ImportIndividualStatsOptions):
+        await context.executemany(UPSERT_STATS, (
+            (options.game_name, player, delta.games_played, delta.games_won)
+            for player, delta in options.players.items()
+        ))
+        groups_ids = {group: serialize_group(group) for group in options.groups}
+        await context.executemany(INSERT_GROUP, (
+            (options.game_name, group_id, dump_group(group))
+            for group, group_id in groups_ids.items()
+        ))
+        await context.executemany(UPSERT_GROUP_STATS, (
+            (options.game_name, groups_ids[group], player, delta.games_played, delta.games_won)
+            for group, players in options.groups.items()
+            for player, delta in players.items()
+        ))
+
+    async def replace_stats(self, context: SQLiteContext, options: types.ImportIndividualStatsOptions):
+        # The whole context is one transaction, so readers see either the old or the new stats.
+        for table in STATS_TABLES:
+            await context.execute(f'DELETE FROM {table} WHERE game_name = ?', (options.game_name,))
+        await self.import_stats(context, options)
+
+    async def merge_players(self, context: SQLiteContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if not renames:
+            return
+        await fill_renames(context, renames)
+        await context.execute('DELETE FROM temp.group_renames')
+
+        new_groups = {}
+        groups_renames = []
+        for group_id, members in await context.fetchall(SELECT_RENAMED_GROUPS, (options.game_name,)):
+            new_group = GroupDescriptor(frozenset(renames.get(m, m) for m in load_group(members)))
+            new_group_id = serialize_group(new_group)
+            new_groups[new_group_id] = new_group
+            groups_renames.append((group_id, new_group_id))
+        await context.executemany('INSERT INTO temp.group_renames (group_id, new_group_id) VALUES (?, ?)', groups_renames)
+        await context.executemany(INSERT_GROUP, (
+            (options.game_name, group_id, dump_group(group))
+            for group_id, group in new_groups.items()
+        ))
+
+        for statement in MERGE_PLAYERS_STATEMENTS:
+            await context.execute(statement, (options.game_name,))
+
+    async def remove_stats(self, context: SQLiteContext, options: types.OneIndividualStatsOptions):
+        await context.execute(
+            'DELETE FROM individual_stats WHERE game_name = ? AND login = ?',
+            (options.game_name, options.player),
+        )
+
+
+@dataclass
+class SQLitePeriodStatsRepository:
+    async def add_game(self, context: SQLiteContext, options: types.AddPeriodGameOptions):
+        await context.execute('DELETE FROM period_stats WHERE expires_at <= ?', (int(time.time()),))
+        await context.executemany(UPSERT_PERIOD_STATS, (
+            (options.game_name, bucket.id, player, 1, int(player == options.winner), bucket.expires_at)
+            for bucket in options.buckets
+            for player in options.players
+        ))
+
+    async def stats(self, context: SQLiteContext, options: types.PeriodStatsOptions) -> list[types.IndividualStats]:
+        rows = await context.fetchall(
+            SELECT_PERIOD_STATS,
+            (options.game_name, json.dumps([bucket.id for bucket in options.buckets]), int(time.time())),
+        )
+        return [types.IndividualStats(*row) for row in rows]
+
+    async def replace_stats(self, context: SQLiteContext, options: types.ImportPeriodStatsOptions):
+        await context.execute('DELETE FROM period_stats WHERE game_name = ?', (options.game_name,))
+        await context.executemany(UPSERT_PERIOD_STATS, (
+            (options.game_name, bucket.id, player, delta.games_played, delta.games_won, bucket.expires_at)
+            for bucket, players in options.buckets.items()
+            for player, delta in players.items()
+        ))
+
+
+@dataclass
+class SQLiteRatingsRepository:
+    rating: EloRating
+
+    async def add_game(self, context: SQLiteContext, options: types.RateGameOptions):
+        if options.winner is None:
+            return
+        ratings = dict(await context.fetchall(
+            'SELECT login, rating FROM ratings WHERE game_name = ? AND login IN (SELECT value FROM json_each(?))',
+            (options.game_name, json.dumps(options.players)),
+        ))
+        current = [ratings.get(p, self.rating.initial) for p in options.players]
+        deltas = self.rating.deltas(current, options.players.index(options.winner))
+        await context.executemany(UPSERT_RATING, (
+            (options.game_name, player, rating + delta)
+            for player, rating, delta in zip(options.players, current, deltas)
+        ))
+
+    async def leaderboard(self, context: SQLiteContext, options: types.LeaderboardOptions) -> list[types.PlayerRating]:
+        rows = await context.fetchall(
+            'SELECT login, rating FROM ratings WHERE game_name = ? ORDER BY rating DESC, login DESC LIMIT ? OFFSET ?',
+            (options.game_name, options.limit, options.offset),
+        )
+        return [types.PlayerRating(login, rating, options.offset + i + 1) for i, (login, rating) in enumerate(rows)]
+
+    async def rating_for_player(self, context: SQLiteContext, options: types.OnePlayerRatingOptions) -> types.PlayerRating | None:
+        row = await context.fetchone(SELECT_PLAYER_RATING, (options.game_name, options.player))
+        return types.PlayerRating(options.player, *row) if row is not None else None
+
+    async def replace_ratings(self, context: SQLiteContext, options: types.ImportRatingsOptions):
+        await context.execute('DELETE FROM ratings WHERE game_name = ?', (options.game_name,))
+        await context.executemany(UPSERT_RATING, (
+            (options.game_name, player, rating)
+            for player, rating in options.ratings.items()
+        ))
+
+    async def merge_players(self, context: SQLiteContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if not renames:
+            return
+        ratings = dict(await context.fetchall(
+            'SELECT login, rating FROM ratings WHERE game_name = ? AND login IN (SELECT value FROM json_each(?))',
+            (options.game_name, json.dumps([*renames, *renames.values()])),
+        ))
+        merged = {}
+        for alias, player in renames.items():
+            if alias in ratings:
+                ratings[player] = merged[player] = self.rating.merge(
+                    ratings.get(player, self.rating.initial),
+                    ratings.pop(alias),
+                )
+        await context.executemany(
+            'DELETE FROM ratings WHERE game_name = ? AND login = ?',
+            ((options.game_name, alias) for alias in renames),
+        )
+        await context.executemany(UPSERT_RATING, ((options.game_name, player, rating) for player, rating in merged.items()))
+
+
+@dataclass
+class SQLiteHeadToHeadRepository:
+    async def add_game(self, context: SQLiteContext, options: types.HeadToHeadGameOptions):
+        await context.executemany(UPSERT_HEAD_TO_HEAD, (
+            (
+                options.game_name,
+                player,
+                opponent,
+                1,
+                int(player == options.winner),
+                int(opponent == options.winner),
+            )
+            for player in options.players
+            for opponent in options.players
+            if opponent != player
+        ))
+
+    async def rivals(self, context: SQLiteContext, options: types.RivalsOptions) -> list[types.HeadToHead]:
+        rows = await context.fetchall(
+            'SELECT opponent, games_played, games_won, games_lost FROM head_to_head WHERE game_name = ? AND login = ?',
+            (options.game_name, options.player),
+        )
+        return [types.HeadToHead(*row) for row in rows]
+
+    async def replace_stats(self, context: SQLiteContext, options: types.ImportHeadToHeadOptions):
+        await context.execute('DELETE FROM head_to_head WHERE game_name = ?', (options.game_name,))
+        await context.executemany(UPSERT_HEAD_TO_HEAD, (
+            (options.game_name, player, opponent, delta.games_played, delta.games_won, delta.games_lost)
+            for player, opponents in options.players.items()
+            for opponent, delta in opponents.items()
+        ))
+
+    async def merge_players(self, context: SQLiteContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if not renames:
+            return
+        await fill_renames(context, renames)
+        for statement in MERGE_HEAD_TO_HEAD_STATEMENTS:
+            await context.execute(statement, (options.game_name,))
+
+
+@dataclass
+class SQLiteProfilesRepository:
+    # Profiles are stored as the JSON of their Redis hashes and updated in Python, the context is a transaction.
+    aggregation: ProfileAggregation
+
+    async def add_game(self, context: SQLiteContext, options: types.ProfileGameOptions):
+        logins = [player.login for player in options.players]
+        profiles = {
+            login: load_profile(json.loads(raw))
+            for login, raw in await context.fetchall(
+                'SELECT login, profile FROM profiles WHERE game_name = ? AND login IN (SELECT value FROM json_each(?))',
+                (options.game_name, json.dumps(logins)),
+            )
+        }
+        for player in options.players:
+            self.aggregation.add(profiles.setdefault(player.login, types.PlayerProfile()), player)
+        await context.executemany(UPSERT_PROFILE, (
+            (options.game_name, login, json.dumps(dump_profile(profile)))
+            for login, profile in profiles.items()
+        ))
+
+    async def profile(self, context: SQLiteContext, options: types.OneProfileOptions) -> types.PlayerProfile | None:
+        row = await context.fetchone(
+            'SELECT profile FROM profiles WHERE game_name = ? AND login = ?',
+            (options.game_name, options.player),
+        )
+        return load_profile(json.loads(row[0])) if row is not None else None
+
+    async def replace_profiles(self, context: SQLiteContext, options: types.ImportProfilesOptions):
+        await context.execute('DELETE FROM profiles WHERE game_name = ?', (options.game_name,))
+        await context.executemany(UPSERT_PROFILE, (
+            (options.game_name, login, json.dumps(dump_profile(profile)))
+            for login, profile in options.profiles.items()
+        ))
+
+    async def merge_players(self, context: SQLiteContext, options: types.MergePlayersOptions):
+        renames = {alias: player for alias, player in options.aliases.items() if alias != player}
+        if not renames:
+            return
+        profiles = {
+            login: load_profile(json.loads(raw))
+            for login, raw in await context.fetchall(
+                'SELECT login, profile FROM profiles WHERE game_name = ? AND login IN (SELECT value FROM json_each(?))',
+                (options.game_name, json.dumps([*renames, *renames.values()])),
+            )
+        }
+        merged = {}
+        for alias, player in renames.items():
+            if alias in profiles:
+                profile = merged[player] = profiles.setdefault(player, types.PlayerProfile())
+                self.aggregation.merge(profile, profiles.pop(alias))
+        await context.executemany(
+            'DELETE FROM profiles WHERE game_name = ? AND login = ?',
+            ((options.game_name, alias) for alias in renames),
+        )
+        await context.executemany(UPSERT_PROFILE, (
+            (options.game_name, login, json.dumps(dump_profile(profile)))
+            for login, profile in merged.items()
+        ))
+
+
+@dataclass
+class SQLiteGamesRepository:
+    async def add_played_game(self, context: SQLiteContext, options: types.GameOptions) -> types.AddGameResults:
+        added = await context.execute(
+            'INSERT OR IGNORE INTO games (game_name, id) VALUES (?, ?)',
+            (options.game_name, options.id),
+        )
+        if added and options.record is not None:
+            await context.execute(
+                'INSERT INTO game_records (game_name, record) VALUES (?, ?)',
+                (options.record.game_name, dump_game_record(options.record)),
+            )
+        status = types.AddGameStatus.ADDED if added else types.AddGameStatus.DUPLICATE
+        return types.AddGameResults(status)
+
+    async def is_played_game(self, context: SQLiteContext, options: types.GameOptions) -> bool:
+        row = await context.fetchone(
+            'SELECT EXISTS (SELECT 1 FROM games WHERE game_name = ? AND id = ?)',
+            (options.game_name, options.id),
+        )
+        return bool(row[0])
+
+
+@dataclass
+class SQLiteGameRecordsRepository:
+    async def game_records(
+            self,
+            context: SQLiteContext,
+            options: types.AllGameRecordsOptions,
+    ) -> AsyncIterator[types.GameRecord]:
+        last_seq = 0
+        while rows := await context.fetchall(
+                'SELECT seq, record FROM game_records WHERE game_name = ? AND seq > ? ORDER BY seq LIMIT ?',
+                (options.game_name, last_seq, options.batch_size),
+        ):
+            for _, raw in rows:
+                yield load_game_record(raw, options.game_name)
+            last_seq = rows[-1][0]
+
+
+@dataclass
+class SQLitePlayersRepository:
+    async def add_alias(self, context: SQLiteContext, options: types.AddPlayerAliasOptions):
+        await context.execute(UPSERT_ALIAS, (options.alias, options.login))
+
+    async def add_aliases(self, context: SQLiteContext, options: types.AddPlayerAliasesOptions):
+        await context.executemany(UPSERT_ALIAS, options.aliases.items())
+
+    async def normalize_players(self, context: SQLiteContext, players: Iterable[Login]) -> Iterable[Login | None]:
+        players = list(players)
+        aliases: Mapping[Login, Login] = dict(await context.fetchall(
+            'SELECT alias, login FROM aliases WHERE alias IN (SELECT value FROM json_each(?))',
+            (json.dumps(players),),
+        ))
+        return [aliases.get(p) for p in players]
+
+
+async def fill_renames(context: SQLiteContext, renames: Mapping[Login, Login]):
+    await context.execute('DELETE FROM temp.renames')
+    await context.executemany('INSERT INTO temp.renames (alias, login) VALUES (?, ?)', renames.items())
+
+
+STATS_TABLES = ('individual_stats', 'group_stats', 'groups')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS individual_stats (
+    game_name TEXT NOT NULL,
+    login TEXT NOT NULL,
+    games_played INTEGER NOT NULL DEFAULT 0,
+    games_won INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (game_name, login)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS groups (
+    game_name TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    members TEXT NOT NULL,
+    PRIMARY KEY (game_name, group_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS group_stats (
+    game_name TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    login TEXT NOT NULL,
+    games_played INTEGER NOT NULL DEFAULT 0,
+    games_won INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (game_name, group_id, login)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS group_stats_by_login ON group_stats (game_name, login);
+
+CREATE TABLE IF NOT EXISTS period_stats (
+    game_name TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    login TEXT NOT NULL,
+    games_played INTEGER NOT NULL DEFAULT 0,
+    games_won INTEGER NOT NULL DEFAULT 0,
+    expires_at INTEGER,
+    PRIMARY KEY (game_name, bucket, login)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS period_stats_by_expiration ON period_stats (expires_at) WHERE expires_at IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS ratings (
+    game_name TEXT NOT NULL,
+    login TEXT NOT NULL,
+    rating REAL NOT NULL,
+    PRIMARY KEY (game_name, login)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS ratings_by_rating ON ratings (game_name, rating, login);
+
+CREATE TABLE IF NOT EXISTS head_to_head (
+    game_name TEXT NOT NULL,
+    login TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    games_played INTEGER NOT NULL DEFAULT 0,
+    games_won INTEGER NOT NULL DEFAULT 0,
+    games_lost INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (game_name, login, opponent)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS profiles (
+    game_name TEXT NOT NULL,
+    login TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    PRIMARY KEY (game_name, login)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS games (
+    game_name TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (game_name, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS game_records (
+    seq INTEGER PRIMARY KEY,
+    game_name TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS game_records_by_game_name ON game_records (game_name, seq);
+
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    login TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TEMP TABLE IF NOT EXISTS renames (alias TEXT PRIMARY KEY, login TEXT NOT NULL);
+CREATE TEMP TABLE IF NOT EXISTS group_renames (group_id TEXT PRIMARY KEY, new_group_id TEXT NOT NULL);
+"""
+
+UPSERT_STATS = """
+INSERT INTO individual_stats (game_name, login, games_played, games_won) VALUES (?, ?, ?, ?)
+ON CONFLICT DO UPDATE SET
+    games_played = games_played + excluded.games_played,
+    games_won = games_won + excluded.games_won
+"""
+
+UPSERT_GROUP_STATS = """
+INSERT INTO group_stats (game_name, group_id, login, games_played, games_won) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT DO UPDATE SET
+    games_played = games_played + excluded.games_played,
+    games_won = games_won + excluded.games_won
+"""
+
+UPSERT_PERIOD_STATS = """
+INSERT INTO period_stats (game_name, bucket, login, games_played, games_won, expires_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT DO UPDATE SET
+    games_played = games_played + excluded.games_played,
+    games_won = games_won + excluded.games_won
+"""
+
+SELECT_PERIOD_STATS = """
+SELECT login, sum(games_played), sum(games_won) FROM period_stats
+WHERE game_name = ? AND bucket IN (SELECT value FROM json_each(?)) AND coalesce(expires_at > ?, TRUE)
+GROUP BY login
+"""
+
+UPSERT_RATING = 'INSERT INTO ratings (game_name, login, rating) VALUES (?, ?, ?) ON CONFLICT DO UPDATE SET rating = excluded.rating'
+
+SELECT_PLAYER_RATING = """
+SELECT r.rating, 1 + (
+    SELECT count(*) FROM ratings o
+    WHERE o.game_name = r.game_name AND (o.rating > r.rating OR o.rating = r.rating AND o.login > r.login)
+)
+FROM ratings r WHERE r.game_name = ? AND r.login = ?
+"""
+
+UPSERT_HEAD_TO_HEAD = """
+INSERT INTO head_to_head (game_name, login, opponent, games_played, games_won, games_lost) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT DO UPDATE SET
+    games_played = games_played + excluded.games_played,
+    games_won = games_won + excluded.games_won,
+    games_lost = games_lost + excluded.games_lost
+"""
+
+UPSERT_PROFILE = 'INSERT INTO profiles (game_name, login, profile) VALUES (?, ?, ?) ON CONFLICT DO UPDATE SET profile = excluded.profile'
+
+INSERT_GROUP = 'INSERT OR IGNORE INTO groups (game_name, group_id, members) VALUES (?, ?, ?)'
+
+UPSERT_ALIAS = 'INSERT INTO aliases (alias, login) VALUES (?, ?) ON CONFLICT DO UPDATE SET login = excluded.login'
+
+SELECT_PLAYER_GROUPS = """
+SELECT g.members, s.games_played, s.games_won
+FROM group_stats s JOIN groups g ON g.game_name = s.game_name AND g.group_id = s.group_id
+WHERE s.game_name = ? AND s.login = ?
+"""
+
+SELECT_BEST_GROUP = """
+SELECT g.members, s.games_played, s.games_won
+FROM group_stats s JOIN groups g ON g.game_name = s.game_name AND g.group_id = s.group_id
+WHERE s.game_name = ? AND s.login = ? AND s.games_played >= ? AND s.games_played > 0
+ORDER BY CAST(s.games_won AS REAL) / s.games_played DESC, s.games_played DESC, g.members
+LIMIT 1
+"""
+
+SELECT_RENAMED_GROUPS = """
+SELECT group_id, members FROM groups
+WHERE game_name = ?1 AND group_id IN (
+    SELECT group_id FROM group_stats WHERE game_name = ?1 AND login IN (SELECT alias FROM temp.renames)
+)
+"""
+
+# Run after temp.renames and temp.group_renames are filled, each statement takes the game name as its only parameter.
+# INSERT ... SELECT ... ON CONFLICT needs the WHERE clause, without it the parser takes ON for a join constraint.
+MERGE_PLAYERS_STATEMENTS = (
+    """
+    INSERT INTO individual_stats (game_name, login, games_played, games_won)
+    SELECT s.game_name, r.login, s.games_played, s.games_won
+    FROM individual_stats s JOIN temp.renames r ON r.alias = s.login
+    WHERE s.game_name = ?1
+    ON CONFLICT DO UPDATE SET
+        games_played = games_played + excluded.games_played,
+        games_won = games_won + excluded.games_won
+    """,
+    'DELETE FROM individual_stats WHERE game_name = ?1 AND login IN (SELECT alias FROM temp.renames)',
+    """
+    INSERT INTO group_stats (game_name, group_id, login, games_played, games_won)
+    SELECT s.game_name, gr.new_group_id, coalesce(r.login, s.login), s.games_played, s.games_won
+    FROM group_stats s
+    JOIN temp.group_renames gr ON gr.group_id = s.group_id
+    LEFT JOIN temp.renames r ON r.alias = s.login
+    WHERE s.game_name = ?1
+    ON CONFLICT DO UPDATE SET
+        games_played = games_played + excluded.games_played,
+        games_won = games_won + excluded.games_won
+    """,
+    'DELETE FROM group_stats WHERE game_name = ?1 AND group_id IN (SELECT group_id FROM temp.group_renames)',
+    'DELETE FROM groups WHERE game_name = ?1 AND group_id IN (SELECT group_id FROM temp.group_renames)',
+)
+# Run after temp.renames is filled, like MERGE_PLAYERS_STATEMENTS. The rows of an alias against its player are dropped.
+MERGE_HEAD_TO_HEAD_STATEMENTS = (
+    """
+    INSERT INTO head_to_head (game_name, login, opponent, games_played, games_won, games_lost)
+    SELECT h.game_name, coalesce(rl.login, h.login), coalesce(ro.login, h.opponent), h.games_played, h.games_won,
+        h.games_lost
+    FROM head_to_head h
+    LEFT JOIN temp.renames rl ON rl.alias = h.login
+    LEFT JOIN temp.renames ro ON ro.alias = h.opponent
+    WHERE h.game_name = ?1
+        AND (rl.alias IS NOT NULL OR ro.alias IS NOT NULL)
+        AND coalesce(rl.login, h.login) != coalesce(ro.login, h.opponent)
+    ON CONFLICT DO UPDATE SET
+        games_played = games_played + excluded.games_played,
+        games_won = games_won + excluded.games_won,
+        games_lost = games_lost + excluded.games_lost
+    """,
+    """
+    DELETE FROM head_to_head
+    WHERE game_name = ?1 AND (login IN (SELECT alias FROM temp.renames) OR opponent IN (SELECT alias FROM temp.renames))
+    """,
+)
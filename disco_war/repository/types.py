@@ -1,15 +1,24 @@
-from collections.abc import Iterable
-from dataclasses import dataclass
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Mapping
+from dataclasses import dataclass, field
 from enum import Enum, auto
 from typing import Protocol, TypeVar, AsyncContextManager
 
 from disco_war.common_types import Login, GameName, SURVIVAL_CHAOS, GameID, GroupDescriptor
+from disco_war.periods import PeriodBucket
 
 RepositoryContext = TypeVar('RepositoryContext', bound=AsyncContextManager)
+# Contexts run these after their writes are committed, which is after the flush for the writes left to write-behind.
+CommitCallback = Callable[[], Awaitable[None]]
+
+
+class TransactionConflict(Exception):
+    def __str__(self):
+        return 'Data read by the transaction was changed concurrently!'
 
 
 class RepositoryContextManager(Protocol[RepositoryContext]):
-    def start(self) -> RepositoryContext: ...
+    # Buffered contexts may leave their writes to a write-behind buffer and don't need to see the buffered ones.
+    def start(self, buffered: bool = False) -> RepositoryContext: ...
 
 
 @dataclass
@@ -19,6 +28,12 @@ class IndividualStats:
     games_won: int
 
 
+@dataclass
+class PlayerGroupStats:
+    group: GroupDescriptor
+    stats: IndividualStats
+
+
 @dataclass
 class ChangeIndividualStatsOptions:
     player: Login
@@ -34,6 +49,20 @@ class ChangeIndividualGroupStatsOptions:
     game_name: GameName = SURVIVAL_CHAOS
 
 
+@dataclass
+class IndividualStatsDelta:
+    games_played: int = 0
+    games_won: int = 0
+
+
+@dataclass
+class ImportIndividualStatsOptions:
+    players: Mapping[Login, IndividualStatsDelta]
+    groups: Mapping[GroupDescriptor, Mapping[Login, IndividualStatsDelta]] = field(default_factory=dict)
+    batch_size: int = 1000
+    game_name: GameName = SURVIVAL_CHAOS
+
+
 @dataclass
 class AllIndividualStatsOptions:
     game_name: GameName = SURVIVAL_CHAOS
@@ -51,10 +80,174 @@ class OneIndividualStatsOptions:
     game_name: GameName = SURVIVAL_CHAOS
 
 
+@dataclass
+class BestGroupOptions:
+    player: Login
+    min_games_played: int = 3
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class MergePlayersOptions:
+    aliases: Mapping[Login, Login]
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class AddPeriodGameOptions:
+    players: list[Login]
+    winner: Login | None
+    buckets: list[PeriodBucket]
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class PeriodStatsOptions:
+    buckets: list[PeriodBucket]
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class ImportPeriodStatsOptions:
+    buckets: Mapping[PeriodBucket, Mapping[Login, IndividualStatsDelta]]
+    batch_size: int = 1000
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class PlayerRating:
+    login: Login
+    rating: float
+    place: int
+
+
+@dataclass
+class RateGameOptions:
+    players: list[Login]
+    winner: Login | None
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class LeaderboardOptions:
+    offset: int = 0
+    limit: int = 20
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class OnePlayerRatingOptions:
+    player: Login
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class ImportRatingsOptions:
+    ratings: Mapping[Login, float]
+    batch_size: int = 1000
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class HeadToHead:
+    opponent: Login
+    games_played: int
+    games_won: int
+    games_lost: int
+
+
+@dataclass
+class HeadToHeadDelta:
+    games_played: int = 0
+    games_won: int = 0
+    games_lost: int = 0
+
+
+@dataclass
+class HeadToHeadGameOptions:
+    players: list[Login]
+    winner: Login | None
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class RivalsOptions:
+    player: Login
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class ImportHeadToHeadOptions:
+    players: Mapping[Login, Mapping[Login, HeadToHeadDelta]]
+    batch_size: int = 1000
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class GamePlayerRecord:
+    login: Login
+    apm: float
+    research_cancels: int
+    small_defense_used: int
+    ultimate_used: int
+
+
+@dataclass
+class GameRecord:
+    id: GameID
+    players: list[GamePlayerRecord]
+    winner: Login | None
+    replay_length: str
+    played_at: float
+    game_name: GameName = SURVIVAL_CHAOS
+
+
 @dataclass
 class GameOptions:
     id: GameID
     game_name: GameName = SURVIVAL_CHAOS
+    record: GameRecord | None = None
+    # A game claimed with the same claim id whose writes weren't committed is added again instead of being a duplicate.
+    claim_id: str | None = None
+
+
+@dataclass
+class MetricAggregate:
+    total: float = 0
+    total_squares: float = 0
+    ewma: float | None = None
+
+
+@dataclass
+class PlayerProfile:
+    games: int = 0
+    metrics: dict[str, MetricAggregate] = field(default_factory=dict)
+    apm_sketch: dict[int, int] = field(default_factory=dict)
+
+
+@dataclass
+class ProfileGameOptions:
+    players: list[GamePlayerRecord]
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class OneProfileOptions:
+    player: Login
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class ImportProfilesOptions:
+    profiles: Mapping[Login, PlayerProfile]
+    batch_size: int = 1000
+    game_name: GameName = SURVIVAL_CHAOS
+
+
+@dataclass
+class AllGameRecordsOptions:
+    batch_size: int = 1000
+    game_name: GameName = SURVIVAL_CHAOS
 
 
 @dataclass
@@ -63,6 +256,11 @@ class AddPlayerAliasOptions:
     alias: Login
 
 
+@dataclass
+class AddPlayerAliasesOptions:
+    aliases: Mapping[Login, Login]
+
+
 class AddGameStatus(Enum):
     ADDED = auto()
     DUPLICATE = auto()
@@ -80,14 +278,62 @@ class IndividualStatsRepository(Protocol[RepositoryContext]):
     async def add_game_won_in_group_for_player(self, context: RepositoryContext, options: ChangeIndividualGroupStatsOptions): ...
     async def stats(self, context: RepositoryContext, options: AllIndividualStatsOptions) -> list[IndividualStats]: ...
     async def stats_for_player(self, context: RepositoryContext, options: OneIndividualStatsOptions) -> IndividualStats | None: ...
+    async def import_stats(self, context: RepositoryContext, options: ImportIndividualStatsOptions): ...
+    async def merge_players(self, context: RepositoryContext, options: MergePlayersOptions): ...
+    async def groups_stats_for_player(self, context: RepositoryContext, options: OneIndividualStatsOptions) -> list[PlayerGroupStats]: ...
+    async def best_group_for_player(self, context: RepositoryContext, options: BestGroupOptions) -> PlayerGroupStats | None: ...
     async def remove_stats(self, context: RepositoryContext, options: OneIndividualStatsOptions): ...
     async def group_stats(self, context: RepositoryContext, options: GroupIndividualStatsOptions): ...
+    async def replace_stats(self, context: RepositoryContext, options: ImportIndividualStatsOptions): ...
+
+
+class PeriodStatsRepository(Protocol[RepositoryContext]):
+    async def add_game(self, context: RepositoryContext, options: AddPeriodGameOptions): ...
+    # Sums the stats of the buckets, logins are returned as they were when the games were added.
+    async def stats(self, context: RepositoryContext, options: PeriodStatsOptions) -> list[IndividualStats]: ...
+    async def replace_stats(self, context: RepositoryContext, options: ImportPeriodStatsOptions): ...
+
+
+class RatingsRepository(Protocol[RepositoryContext]):
+    # Ratings are updated by the storage in the order the games are written, games without a winner are not rated.
+    async def add_game(self, context: RepositoryContext, options: RateGameOptions): ...
+    async def leaderboard(self, context: RepositoryContext, options: LeaderboardOptions) -> list[PlayerRating]: ...
+    async def rating_for_player(self, context: RepositoryContext, options: OnePlayerRatingOptions) -> PlayerRating | None: ...
+    async def replace_ratings(self, context: RepositoryContext, options: ImportRatingsOptions): ...
+    async def merge_players(self, context: RepositoryContext, options: MergePlayersOptions): ...
+
+
+class HeadToHeadRepository(Protocol[RepositoryContext]):
+    # Games are won against and lost to the winner only.
+    async def add_game(self, context: RepositoryContext, options: HeadToHeadGameOptions): ...
+    async def rivals(self, context: RepositoryContext, options: RivalsOptions) -> list[HeadToHead]: ...
+    async def replace_stats(self, context: RepositoryContext, options: ImportHeadToHeadOptions): ...
+    # Games of an alias against its player are dropped, the player can't be their own rival.
+    async def merge_players(self, context: RepositoryContext, options: MergePlayersOptions): ...
+
+
+class ProfilesRepository(Protocol[RepositoryContext]):
+    async def add_game(self, context: RepositoryContext, options: ProfileGameOptions): ...
+    async def profile(self, context: RepositoryContext, options: OneProfileOptions) -> PlayerProfile | None: ...
+    async def replace_profiles(self, context: RepositoryContext, options: ImportProfilesOptions): ...
+    async def merge_players(self, context: RepositoryContext, options: MergePlayersOptions): ...
 
 
 class GamesRepository(Protocol[RepositoryContext]):
     async def add_played_game(self, context: RepositoryContext, options: GameOptions) -> AddGameResults: ...
+    async def is_played_game(self, context: RepositoryContext, options: GameOptions) -> bool: ...
+
+
+class GameRecordsRepository(Protocol[RepositoryContext]):
+    def game_records(self, context: RepositoryContext, options: AllGameRecordsOptions) -> AsyncIterator[GameRecord]: ...
+
+
+class Service(Protocol):
+    async def start(self): ...
+    async def close(self): ...
 
 
 class PlayersRepository(Protocol[RepositoryContext]):
     async def add_alias(self, context: RepositoryContext, options: AddPlayerAliasOptions): ...
+    async def add_aliases(self, context: RepositoryContext, options: AddPlayerAliasesOptions): ...
     async def normalize_players(self, context: RepositoryContext, players: Iterable[Login]) -> Iterable[Login | None]: ...
@@ -20,8 +20,7 @@ async def main():
         types.Login('Lev'): types.Login('Leo'),
     }
 
-    for alias, player in aliases.items():
-        await configuration.players_controller.add_alias(player, alias)
+    await configuration.players_controller.add_aliases(aliases)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+
+import redis.asyncio as redis
+
+from disco_war.common_types import Login, GameID
+from disco_war.configuration import (
+    AppConfiguration,
+    make_memory_based_configuration,
+    make_redis_based_configuration,
+    make_sqlite_based_configuration,
+)
+from disco_war.markdown import MarkdownBuilder
+from disco_war.metrics import REGISTRY
+from disco_war.parsing import ReplayProcessingResult, Player
+from disco_war.repository.redis import make_redis, make_redis_replica, delete_namespace, RedisKeysManager
+
+
+async def main():
+    games = int(os.getenv('BENCHMARK_GAMES', 2000))
+    queries = int(os.getenv('BENCHMARK_QUERIES', 200))
+    players = [Login(f'player{i}') for i in range(int(os.getenv('BENCHMARK_PLAYERS', 200)))]
+
+    timings = {'memory': await run(make_memory_based_configuration('none'), players, games, queries)}
+    with tempfile.TemporaryDirectory() as directory:
+        configuration = make_sqlite_based_configuration(os.path.join(directory, 'benchmark.sqlite3'), 'none')
+        timings['sqlite'] = await run(configuration, players, games, queries)
+    r = make_redis()
+    try:
+        await r.ping()
+    except redis.ConnectionError:
+        print('Redis is not available, skipping it')
+    else:
+        keys_manager = RedisKeysManager(BENCHMARK_KEYS_ROOT)
+        await delete_namespace(r, keys_manager)
+        configuration = make_redis_based_configuration(
+            r,
+            'none',
+            keys_root=BENCHMARK_KEYS_ROOT,
+            replica=make_redis_replica(),
+        )
+        REGISTRY.clear()
+        try:
+            timings['redis'] = await run(configuration, players, games, queries)
+        finally:
+            await delete_namespace(r, keys_manager)
+            await r.close()
+        print_redis_counters()
+
+    rows = []
+    for backend, operations in timings.items():
+        for operation, samples in operations.items():
+            baseline = statistics.fmean(timings['memory'][operation])
+            mean = statistics.fmean(samples)
+            percentiles = statistics.quantiles(samples, n=100)
+            rows.append((
+                backend,
+                operation,
+                f'{mean * 1000:.3f}',
+                f'{percentiles[49] * 1000:.3f}',
+                f'{percentiles[98] * 1000:.3f}',
+                f'{(mean - baseline) * 1000:+.3f}',
+            ))
+    print(MarkdownBuilder(new_line_size=1)
+          .text(f'{games} games of {len(players)} players, {queries} queries of each kind, latencies in ms')
+          .new_line()
+          .table()
+          .with_header(('Storage', 'Operation', 'Mean', 'p50', 'p99', 'Storage overhead'))
+          .with_rows(rows)
+          .build())
+
+
+def print_redis_counters():
+    rows = [
+        (operation, *(f'{counters[counter]:.1f}' for counter in REDIS_COUNTERS))
+        for operation, counters in sorted(REGISTRY.means().items())
+    ]
+    print(MarkdownBuilder(new_line_size=1)
+          .text('Redis traffic per controller call, mean')
+          .new_line()
+          .table()
+          .with_header(('Operation', *REDIS_COUNTERS))
+          .with_rows(rows)
+          .build())
+
+
+async def run(
+        configuration: AppConfiguration,
+        players: list[Login],
+        games: int,
+        queries: int,
+) -> dict[str, list[float]]:
+    rnd = random.Random(BENCHMARK_SEED)
+    results = [make_result(rnd, players, GameID(i)) for i in range(games)]
+    groups = [result.group for result in rnd.sample(results, min(queries, games))]
+    queried_players = [rnd.choice(players) for _ in range(queries)]
+
+    async def ingest(result: ReplayProcessingResult):
+        await configuration.replay_processing.process(result)
+
+    await configuration.start()
+    try:
+        controller = configuration.individual_stats_controller
+        return {
+            'ingestion': await measure(ingest, results),
+            '/stats': await measure(lambda _: controller.get(), range(queries)),
+            'group stats': await measure(controller.get_group, groups),
+            '/groups': await measure(controller.get_player_groups, queried_players),
+            '/best_group': await measure(controller.get_best_group, queried_players),
+            '/rating': await measure(lambda _: configuration.ratings_controller.get_leaderboard(), range(queries)),
+            '/profile': await measure(configuration.profiles_controller.get, queried_players),
+        }
+    finally:
+        await configuration.close()
+
+
+async def measure(operation: Callable[[object], Awaitable], arguments) -> list[float]:
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        await operation(argument)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def make_result(rnd: random.Random, players: list[Login], game_id: GameID) -> ReplayProcessingResult:
+    logins = rnd.sample(players, rnd.randint(2, 8))
+    return ReplayProcessingResult(
+        players=[Player(login, rnd.uniform(50, 250), rnd.randint(0, 5), rnd.randint(0, 10), rnd.randint(0, 3)) for login in logins],
+        winner=rnd.choice(logins),
+        replay_length='30:00',
+        id=game_id,
+    )
+
+
+BENCHMARK_KEYS_ROOT = 'benchmark'
+BENCHMARK_SEED = 42
+REDIS_COUNTERS = ('commands', 'pipelines', 'round_trips', 'bytes_sent', 'bytes_received')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,18 @@
+import asyncio
+
+from disco_war.repository.redis import make_redis, GROUP_KEY, GROUP_MEMBERS_KEY, PLAYER_GROUPS_KEY
+
+
+async def main():
+    r = make_redis()
+    members_suffix = f':{GROUP_KEY}:{GROUP_MEMBERS_KEY}'
+    async for members_key in r.scan_iter(match=f'main:individual_stats:*{members_suffix}'):
+        game_key, group_id = members_key.removesuffix(members_suffix).rsplit(':', 1)
+        async with r.pipeline(transaction=False) as p:
+            for player in await r.smembers(members_key):
+                await p.sadd(f'{game_key}:{PLAYER_GROUPS_KEY}:{player}', group_id)
+            await p.execute()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
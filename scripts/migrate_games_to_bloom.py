@@ -0,0 +1,48 @@
+import asyncio
+import os
+from collections.abc import AsyncIterator
+
+from disco_war.common_types import SURVIVAL_CHAOS
+from disco_war.repository import types
+from disco_war.repository.redis import (
+    make_redis,
+    sscan_unique,
+    BloomGamesRepository,
+    GameRecordsRepository,
+    RedisContext,
+    RedisKeysManager,
+    RepositoryContextManager,
+    GAMES_INDEX_KEY,
+)
+
+
+async def main():
+    r = make_redis()
+    keys_manager = RedisKeysManager('main').namespace('games')
+    games_repository = BloomGamesRepository(
+        r,
+        keys_manager,
+        capacity=int(os.getenv('GAMES_BLOOM_CAPACITY', 1_000_000)),
+        error_rate=float(os.getenv('GAMES_BLOOM_ERROR_RATE', 0.001)),
+        recent_window=int(os.getenv('GAMES_RECENT_WINDOW', 10_000)),
+    )
+    records_repository = GameRecordsRepository(r, keys_manager)
+    async with RepositoryContextManager(r).start() as c:
+        await games_repository.rebuild_filter(c, games_ids(c, keys_manager, records_repository))
+    print(f'Bloom filter: {games_repository.bits} bits, {games_repository.hashes} hash functions')
+
+
+async def games_ids(
+        context: RedisContext,
+        keys_manager: RedisKeysManager,
+        records_repository: GameRecordsRepository,
+) -> AsyncIterator[str]:
+    # The records stream has every game accepted since it was added, the set index only those of the set mode.
+    async for game_id in sscan_unique(context.r, keys_manager.unit(SURVIVAL_CHAOS).key(GAMES_INDEX_KEY), 1000):
+        yield game_id
+    async for record in records_repository.game_records(context, types.AllGameRecordsOptions()):
+        yield str(record.id)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
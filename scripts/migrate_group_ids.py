@@ -0,0 +1,44 @@
+import asyncio
+
+from disco_war.common_types import GroupDescriptor
+from disco_war.repository.redis import (
+    make_redis,
+    serialize_group,
+    dump_group,
+    MergeScriptCall,
+    MERGE_PLAYERS_SCRIPT,
+    GROUP_KEY,
+    GROUP_MEMBERS_KEY,
+    GROUP_REGISTRY_KEY,
+    PLAYER_GROUPS_KEY,
+)
+
+
+async def main():
+    r = make_redis()
+    merge_script = r.register_script(MERGE_PLAYERS_SCRIPT)
+    members_suffix = f':{GROUP_KEY}:{GROUP_MEMBERS_KEY}'
+    members_keys = [key async for key in r.scan_iter(match=f'main:individual_stats:*{members_suffix}')]
+    for members_key in members_keys:
+        game_key, group_id = members_key.removesuffix(members_suffix).rsplit(':', 1)
+        members = await r.smembers(members_key)
+        group = GroupDescriptor(frozenset(members))
+        new_group_id = serialize_group(group)
+        if new_group_id == group_id:
+            continue
+
+        call = MergeScriptCall({})
+        for member in members:
+            call.merge_hashes(
+                f'{game_key}:{group_id}:{GROUP_KEY}:{member}',
+                f'{game_key}:{new_group_id}:{GROUP_KEY}:{member}',
+            )
+            call.replace_member(f'{game_key}:{PLAYER_GROUPS_KEY}:{member}', group_id, new_group_id)
+        call.move_set(members_key, f'{game_key}:{new_group_id}{members_suffix}')
+        call.set_field(f'{game_key}:{GROUP_REGISTRY_KEY}', new_group_id, dump_group(group))
+        await merge_script(keys=call.keys, args=call.args)
+        print(f'{group_id} -> {new_group_id}: {", ".join(sorted(group))}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -16,18 +16,10 @@ async def main():
     }
 
     games_played = sum(results.values())
-    async with configuration.context_manager.start() as c:
-        for player, games_won in results.items():
-            for _ in range(games_won):
-                await configuration.individual_stats_repository.add_game_won_for_player(
-                    c,
-                    types.ChangeIndividualStatsOptions(player)
-                )
-            for _ in range(games_played):
-                await configuration.individual_stats_repository.add_game_played_for_player(
-                    c,
-                    types.ChangeIndividualStatsOptions(player)
-                )
+    await configuration.stats_import_controller.import_stats(players=[
+        types.IndividualStats(player, games_played=games_played, games_won=games_won)
+        for player, games_won in results.items()
+    ])
 
 
 if __name__ == '__main__':
@@ -18,24 +18,12 @@ async def main():
     games_played = sum(results.values())
     group = GroupDescriptor(frozenset(results))
 
-    async with configuration.context_manager.start() as c:
-        for player, games_won in results.items():
-            await configuration.individual_stats_repository.add_game_won_in_group_for_player(
-                c,
-                types.ChangeIndividualGroupStatsOptions(
-                    player,
-                    group,
-                    amount=games_won,
-                ),
-            )
-            await configuration.individual_stats_repository.add_game_played_in_group_for_player(
-                c,
-                types.ChangeIndividualGroupStatsOptions(
-                    player,
-                    group,
-                    amount=games_played,
-                ),
-            )
+    await configuration.stats_import_controller.import_stats(groups={
+        group: [
+            types.IndividualStats(player, games_played=games_played, games_won=games_won)
+            for player, games_won in results.items()
+        ],
+    })
 
 
 if __name__ == '__main__':
@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+import redis.asyncio as redis
+
+from disco_war.common_types import SURVIVAL_CHAOS
+from disco_war.repository import types
+from disco_war.repository.redis import (
+    make_redis,
+    batched,
+    chunked,
+    load_group,
+    serialize_group,
+    RedisGenerations,
+    RedisKeysManager,
+    RepositoryContextManager,
+    RedisIndividualStatsRepository,
+    PackedRedisIndividualStatsRepository,
+    GROUP_KEY,
+    GROUP_MEMBERS_KEY,
+    GROUP_REGISTRY_KEY,
+    INDIVIDUAL_PLAYERS_INDEX_KEY,
+)
+
+
+async def main():
+    r = make_redis()
+    # The stats may be a generation written by a rebuild.
+    generations = RedisGenerations(r, RedisKeysManager('main'))
+    await generations.start()
+    keys_manager = generations.keys_manager_for(RedisKeysManager('main').namespace('individual_stats'))
+    game_keys = keys_manager.namespace(SURVIVAL_CHAOS)
+    context_manager = RepositoryContextManager(r)
+    hashes = RedisIndividualStatsRepository(r, keys_manager)
+    packed = PackedRedisIndividualStatsRepository(r, keys_manager, buckets=int(os.getenv('PACKED_STATS_BUCKETS', 64)))
+
+    keys_before, memory_before = await measure(r, keys_manager)
+
+    async with context_manager.start() as c:
+        players = await hashes.stats(c, types.AllIndividualStatsOptions())
+        groups = {}
+        async for _, raw_group in r.hscan_iter(game_keys.key(GROUP_REGISTRY_KEY)):
+            group = load_group(raw_group)
+            groups[group] = await hashes.group_stats(c, types.GroupIndividualStatsOptions(group))
+        await packed.import_stats(c, types.ImportIndividualStatsOptions(
+            players={s.login: to_delta(s) for s in players},
+            groups={group: {s.login: to_delta(s) for s in stats} for group, stats in groups.items()},
+        ))
+
+    old_keys = [game_keys.key(INDIVIDUAL_PLAYERS_INDEX_KEY), *(game_keys.key(s.login) for s in players)]
+    for group, stats in groups.items():
+        group_keys = game_keys.namespace(serialize_group(group)).namespace(GROUP_KEY)
+        old_keys.append(group_keys.key(GROUP_MEMBERS_KEY))
+        old_keys.extend(group_keys.key(s.login) for s in stats)
+    for keys in chunked(old_keys, 1000):
+        await r.unlink(*keys)
+    await generations.close()
+
+    keys_after, memory_after = await measure(r, keys_manager)
+    print(f'Keys: {keys_before} -> {keys_after}')
+    print(f'MEMORY USAGE: {memory_before} -> {memory_after} bytes ({1 - memory_after / max(memory_before, 1):.1%} less)')
+
+
+async def measure(r: redis.Redis, keys_manager: RedisKeysManager) -> tuple[int, int]:
+    keys_count, memory = 0, 0
+    async for keys in batched(r.scan_iter(match=keys_manager.pattern(), count=1000), 1000):
+        async with r.pipeline(transaction=False) as p:
+            for key in keys:
+                await p.memory_usage(key)
+            usages = await p.execute()
+        keys_count += len(keys)
+        memory += sum(usage or 0 for usage in usages)
+    return keys_count, memory
+
+
+def to_delta(stats: types.IndividualStats) -> types.IndividualStatsDelta:
+    return types.IndividualStatsDelta(games_played=stats.games_played, games_won=stats.games_won)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import os
+import random
+import uuid
+from dataclasses import dataclass
+
+import fakeredis
+import pytest
+import redis.asyncio as redis
+
+from disco_war.common_types import GameID, Login
+from disco_war.configuration import (
+    AppConfiguration,
+    make_memory_based_configuration,
+    make_redis_based_configuration,
+    make_sqlite_based_configuration,
+)
+from disco_war.parsing import Player, ReplayProcessingResult
+from disco_war.repository.redis import RedisCluster, RedisKeysManager, delete_namespace, make_redis
+
+LOGINS = [Login(f'player{i}') for i in range(8)]
+
+
+def make_result(game_id: int, winner: str = 'alice', loser: str = 'bob') -> ReplayProcessingResult:
+    players = [Player(Login(winner), 100.0, 1, 2, 0), Player(Login(loser), 120.0, 0, 1, 1)]
+    return ReplayProcessingResult(players, Login(winner), '30:00', GameID(game_id))
+
+
+def make_random_result(seed: int) -> ReplayProcessingResult:
+    rnd = random.Random(seed)
+    logins = rnd.sample(LOGINS, rnd.randint(2, 6))
+    players = [
+        Player(login, rnd.uniform(1, 300), rnd.randint(0, 5), rnd.randint(0, 9), rnd.randint(0, 3))
+        for login in logins
+    ]
+    return ReplayProcessingResult(players, rnd.choice(logins), '30:00', GameID(seed))
+
+
+def make_fake_redis_configuration(**kwargs) -> AppConfiguration:
+    kwargs.setdefault('generation_grace', 0)
+    return make_redis_based_configuration(fakeredis.FakeAsyncRedis(decode_responses=True), 'none', **kwargs)
+
+
+def make_server_redis() -> redis.Redis:
+    # For the scripts that fakeredis can't run.
+    if os.getenv('REDIS_TESTS') != '1':
+        pytest.skip('needs a Redis server, set REDIS_TESTS=1 to run')
+    return make_redis(cluster=False)
+
+
+def make_cluster_redis() -> RedisCluster:
+    if os.getenv('REDIS_CLUSTER_TESTS') != '1':
+        pytest.skip('needs a Redis Cluster, set REDIS_CLUSTER_TESTS=1 to run')
+    return make_redis(port=int(os.getenv('REDIS_CLUSTER_PORT', 7000)), cluster=True)
+
+
+def make_cluster_configuration() -> AppConfiguration:
+    # Every configuration writes under its own key root, which is deleted when it is closed.
+    r = make_cluster_redis()
+    keys_manager = RedisKeysManager(f'test-{uuid.uuid4().hex}')
+    configuration = make_redis_based_configuration(r, 'none', keys_root=keys_manager.root, generation_grace=0)
+    configuration.services.insert(1, DeletedOnClose(r, keys_manager))
+    return configuration
+
+
+@dataclass
+class DeletedOnClose:
+    r: RedisCluster
+    keys_manager: RedisKeysManager
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        await delete_namespace(self.r, self.keys_manager)
+
+
+def make_test_configuration(storage: str, tmp_path) -> AppConfiguration:
+    match storage:
+        case 'memory':
+            return make_memory_based_configuration('none')
+        case 'sqlite':
+            return make_sqlite_based_configuration(str(tmp_path / 'stats.sqlite3'), 'none')
+        case 'redis':
+            return make_fake_redis_configuration()
+        case 'redis-packed':
+            return make_fake_redis_configuration(stats_layout='packed')
+        case 'redis-write-behind':
+            return make_fake_redis_configuration(write_behind_games=10)
+        case 'redis-cluster':
+            return make_cluster_configuration()
+
+
+async def stats(configuration: AppConfiguration) -> list[tuple]:
+    return sorted((s.login, s.games_played, s.games_won) for s in await configuration.individual_stats_controller.get())
+
+
+async def snapshot(configuration: AppConfiguration) -> dict:
+    return {
+        'stats': sorted(map(str, await configuration.individual_stats_controller.get())),
+        'ratings': sorted(
+            (r.login, r.rating) for r in await configuration.ratings_controller.get_leaderboard(0, len(LOGINS))
+        ),
+        'profiles': {login: await configuration.profiles_controller.get(login) for login in LOGINS},
+        'rivals': {
+            login: sorted(map(str, await configuration.head_to_head_controller.get_rivals(login))) for login in LOGINS
+        },
+    }
+
+
+async def process_and_rebuild(configuration: AppConfiguration, games: int = 60) -> tuple[dict, dict]:
+    await configuration.start()
+    try:
+        for seed in range(games):
+            await configuration.replay_processing.process(make_random_result(seed))
+        live = await snapshot(configuration)
+        await configuration.stats_rebuild_controller.rebuild()
+        return live, await snapshot(configuration)
+    finally:
+        await configuration.close()
@@ -0,0 +1,63 @@
+import asyncio
+import uuid
+
+from disco_war.common_types import GameID
+from disco_war.repository.redis import (
+    BloomGamesRepository,
+    RedisContext,
+    RedisKeysManager,
+    bloom_bits,
+    bloom_hashes,
+    delete_namespace,
+)
+from disco_war.repository.types import AddGameStatus, GameOptions
+from tests.conftest import make_server_redis
+
+
+async def with_repository(test, **kwargs):
+    # The filter hashes ids with redis.sha1hex, which fakeredis doesn't have.
+    r = make_server_redis()
+    keys_manager = RedisKeysManager(f'test-{uuid.uuid4().hex}')
+    try:
+        await test(BloomGamesRepository(r, keys_manager, **kwargs), RedisContext(r))
+    finally:
+        await delete_namespace(r, keys_manager)
+        await r.close()
+
+
+def test_filter_size():
+    bits = bloom_bits(1_000_000, 0.001)
+    assert 14_000_000 < bits < 14_500_000
+    assert bloom_hashes(bits, 1_000_000) == 10
+
+
+def test_duplicates_are_rejected_after_the_recent_window():
+    async def test(repository: BloomGamesRepository, context: RedisContext):
+        for game_id in range(20):
+            assert (await repository.add_played_game(context, GameOptions(GameID(game_id)))).status == AddGameStatus.ADDED
+        for game_id in range(20):
+            assert await repository.is_played_game(context, GameOptions(GameID(game_id)))
+            duplicate = await repository.add_played_game(context, GameOptions(GameID(game_id)))
+            assert duplicate.status == AddGameStatus.DUPLICATE
+        assert not await repository.is_played_game(context, GameOptions(GameID(20)))
+
+    asyncio.run(with_repository(test, capacity=1000, recent_window=5))
+
+
+def test_rebuild_filter():
+    async def games_ids(ids):
+        for game_id in ids:
+            yield str(game_id)
+
+    async def test(repository: BloomGamesRepository, context: RedisContext):
+        await repository.add_played_game(context, GameOptions(GameID(1000)))
+        await repository.rebuild_filter(context, games_ids(range(100)), batch_size=7)
+        assert all([await repository.is_played_game(context, GameOptions(GameID(i))) for i in range(100)])
+        false_positives = sum([await repository.is_played_game(context, GameOptions(GameID(i))) for i in range(100, 1100)])
+        assert false_positives <= 10
+        await repository.rebuild_filter(context, games_ids([]))
+        # Only the ids of the recent window are left.
+        assert not await repository.is_played_game(context, GameOptions(GameID(5)))
+        assert await repository.is_played_game(context, GameOptions(GameID(1000)))
+
+    asyncio.run(with_repository(test, capacity=1000, recent_window=5))
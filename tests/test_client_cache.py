@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import uuid
+
+import fakeredis
+
+from disco_war.repository.redis import ClientSideCache
+from tests.conftest import make_server_redis
+
+
+def test_results_are_copies():
+    async def run():
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await r.hset('stats', mapping={'alice': 1})
+        cache = ClientSideCache(r, [''], _enabled=True)
+        client = cache.client(r)
+        first = await client.hgetall('stats')
+        first['alice'] = 'changed'
+        # Not invalidated, so the cached value is served.
+        await r.hset('stats', 'alice', 2)
+        return await client.hgetall('stats')
+
+    assert asyncio.run(run()) == {'alice': '1'}
+
+
+def test_other_pipelined_commands_are_sent():
+    async def run():
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await r.sadd('players', 'alice')
+        cache = ClientSideCache(r, [''], _enabled=True)
+        async with cache.client(r).pipeline() as p:
+            await p.smembers('players')
+            await p.scard('players')
+            await p.hget('missing', 'field')
+            first = await p.execute()
+        await r.sadd('players', 'bob')
+        async with cache.client(r).pipeline() as p:
+            await p.smembers('players')
+            await p.scard('players')
+            second = await p.execute()
+        return first, second
+
+    assert asyncio.run(run()) == ([{'alice'}, 1, None], [{'alice'}, 2])
+
+
+def test_unexpected_tracking_errors_are_logged(caplog):
+    async def run():
+        cache = ClientSideCache(None, [''], reconnect_delay=0)
+        attempts = 0
+
+        async def track():
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise TypeError('unexpected')
+            await asyncio.Event().wait()
+
+        cache._track = track
+        await cache.start()
+        await asyncio.sleep(0.01)
+        await cache.close()
+        return attempts
+
+    with caplog.at_level(logging.ERROR):
+        assert asyncio.run(run()) == 2
+    assert 'Client side cache tracking failed' in caplog.text
+
+
+def test_tracking_invalidates_changed_keys():
+    async def run():
+        r = make_server_redis()
+        prefix = f'test-{uuid.uuid4().hex}:'
+        cache = ClientSideCache(r, [prefix])
+        await cache.start()
+        try:
+            while not cache._enabled:
+                await asyncio.sleep(0.01)
+            client = cache.client(r)
+            await r.hset(f'{prefix}stats', 'alice', 1)
+            first = await client.hgetall(f'{prefix}stats')
+            await r.hset(f'{prefix}stats', 'alice', 2)
+            for _ in range(100):
+                if f'{prefix}stats' not in cache._entries:
+                    break
+                await asyncio.sleep(0.01)
+            return first, await client.hgetall(f'{prefix}stats')
+        finally:
+            await cache.close()
+            await r.delete(f'{prefix}stats')
+            await r.close()
+
+    assert asyncio.run(run()) == ({'alice': '1'}, {'alice': '2'})
@@ -0,0 +1,71 @@
+import asyncio
+
+import fakeredis
+
+from disco_war.common_types import SURVIVAL_CHAOS
+from disco_war.configuration import make_redis_based_configuration
+from tests.conftest import make_random_result, stats
+
+
+def make_configuration(server: fakeredis.FakeServer):
+    return make_redis_based_configuration(
+        fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+        'none',
+        generation_grace=0,
+    )
+
+
+async def generation_roots(r) -> set[str]:
+    return {key.split(':')[2] async for key in r.scan_iter(match='main:individual_stats:*')}
+
+
+def test_rebuild_swaps_generations():
+    async def run():
+        server = fakeredis.FakeServer()
+        writer, reader = make_configuration(server), make_configuration(server)
+        await writer.start()
+        await reader.start()
+        try:
+            for seed in range(20):
+                await writer.replay_processing.process(make_random_result(seed))
+            expected = await stats(reader)
+            r = writer.individual_stats_repository.r
+            roots = [await generation_roots(r)]
+            for _ in range(2):
+                await writer.stats_rebuild_controller.rebuild()
+                await asyncio.gather(*writer.individual_stats_repository.keys_manager.generations._retiring)
+                roots.append(await generation_roots(r))
+            generations = reader.individual_stats_repository.keys_manager.generations
+            for _ in range(100):
+                if generations.current(f'main:individual_stats:{SURVIVAL_CHAOS}'):
+                    break
+                await asyncio.sleep(0.01)
+            return expected, await stats(reader), roots
+        finally:
+            await writer.close()
+            await reader.close()
+
+    expected, rebuilt, roots = asyncio.run(run())
+    assert rebuilt == expected
+    assert roots[0] == {SURVIVAL_CHAOS}
+    assert len(roots[1]) == len(roots[2]) == 1
+    assert roots[1] != roots[2]
+    assert all(root.startswith('#g') for root in roots[1] | roots[2])
+
+
+def test_unfinished_generation_is_removed():
+    async def run():
+        configuration = make_configuration(fakeredis.FakeServer())
+        await configuration.start()
+        try:
+            repository = configuration.ratings_repository
+            r = repository.r
+            await configuration.replay_processing.process(make_random_result(0))
+            unfinished = await repository.keys_manager.begin_generation(r, SURVIVAL_CHAOS)
+            await r.set(unfinished.namespace(SURVIVAL_CHAOS).key('leftover'), 1)
+            await configuration.stats_rebuild_controller.rebuild()
+            return await r.exists(unfinished.namespace(SURVIVAL_CHAOS).key('leftover'))
+        finally:
+            await configuration.close()
+
+    assert asyncio.run(run()) == 0
@@ -0,0 +1,178 @@
+import asyncio
+import dataclasses
+import json
+import os
+
+import pytest
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+
+from disco_war.common_types import GameID, Login
+from disco_war.configuration import make_memory_based_configuration
+from disco_war.controllers.journal import JournaledReplayResultsProcessing, dump_entry
+from disco_war.controllers.results_processing import ResultAlreadyProcessed, WinnerNotInPlayersException
+from disco_war.parsing import ReplayProcessingResult
+from tests.conftest import make_fake_redis_configuration, make_result, stats
+
+
+class UnavailableStorage:
+    def __init__(self, error: Exception):
+        self.error = error
+        self.attempts = 0
+
+    async def ensure_not_processed(self, game_id):
+        raise self.error
+
+    async def process(self, result, played_at=None, claim_id=None):
+        self.attempts += 1
+        raise self.error
+
+
+async def wait_applied(path: str):
+    async def truncated():
+        while os.path.getsize(path):
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(truncated(), 5)
+
+
+def test_applied_games_are_truncated(tmp_path):
+    path = str(tmp_path / 'journal')
+
+    async def run():
+        configuration = make_memory_based_configuration('none')
+        journal = JournaledReplayResultsProcessing(configuration.replay_processing, path)
+        await journal.start()
+        for game_id in range(3):
+            await journal.process(make_result(game_id))
+        with pytest.raises(ResultAlreadyProcessed):
+            await journal.process(make_result(1))
+        await wait_applied(path)
+        await journal.close()
+        return await stats(configuration)
+
+    assert asyncio.run(run()) == [('alice', 3, 3), ('bob', 3, 0)]
+    assert os.path.getsize(path) == 0
+    with open(path + '.offset') as f:
+        assert f.read() == '0'
+
+
+def test_journal_is_replayed_after_restart(tmp_path):
+    path = str(tmp_path / 'journal')
+
+    async def run():
+        configuration = make_memory_based_configuration('none')
+        await configuration.replay_processing.process(make_result(0))
+        storage = UnavailableStorage(redis.ConnectionError('unavailable'))
+        journal = JournaledReplayResultsProcessing(storage, path, apply_timeout=0.01, retry_delay=0.01)
+        await journal.start()
+        # The first game is stored already, as if the offset wasn't committed before a crash.
+        for game_id in range(4):
+            await journal.process(make_result(game_id))
+        with pytest.raises(ResultAlreadyProcessed):
+            await journal.ensure_not_processed(GameID(2))
+        # The precheck is skipped while the storage is unavailable.
+        await journal.ensure_not_processed(GameID(10))
+        await journal.close()
+        assert storage.attempts > 1
+        with open(path, 'ab') as f:
+            f.write(dump_entry(make_result(4), 0, None)[:-10])
+
+        journal = JournaledReplayResultsProcessing(configuration.replay_processing, path)
+        await journal.start()
+        await wait_applied(path)
+        await journal.close()
+        return await stats(configuration)
+
+    assert asyncio.run(run()) == [('alice', 4, 4), ('bob', 4, 0)]
+
+
+def test_aliases_are_resolved_when_applied(tmp_path):
+    path = str(tmp_path / 'journal')
+
+    async def run():
+        configuration = make_memory_based_configuration('none')
+        await configuration.players_controller.add_alias(Login('alice'), Login('alice2'))
+        journal = JournaledReplayResultsProcessing(configuration.replay_processing, path)
+        await journal.start()
+        await journal.process(make_result(0, winner='alice2'))
+        with pytest.raises(WinnerNotInPlayersException):
+            await journal.process(ReplayProcessingResult(make_result(1).players, Login('carol'), '30:00', GameID(1)))
+        await journal.close()
+        return await stats(configuration)
+
+    assert asyncio.run(run()) == [('alice', 1, 1), ('bob', 1, 0)]
+
+
+def test_failed_game_is_set_aside(tmp_path):
+    path = str(tmp_path / 'journal')
+
+    async def run():
+        configuration = make_memory_based_configuration('none')
+        processing = configuration.replay_processing
+        journal = JournaledReplayResultsProcessing(UnavailableStorage(ValueError('broken')), path)
+        await journal.start()
+        with pytest.raises(ValueError):
+            await journal.process(make_result(0))
+        journal.processing = processing
+        await journal.process(make_result(1))
+        await wait_applied(path)
+        await journal.close()
+        return await stats(configuration)
+
+    assert asyncio.run(run()) == [('alice', 1, 1), ('bob', 1, 0)]
+    with open(path + '.failed') as f:
+        [(raw_result, _, _)] = map(json.loads, f)
+    assert raw_result['id'] == 0
+
+
+@pytest.mark.parametrize('applied', [False, True])
+def test_interrupted_writes_are_retried(applied, tmp_path, monkeypatch):
+    path = str(tmp_path / 'journal')
+    execute = Pipeline.execute
+    failures = []
+
+    async def interrupted_execute(self, *args, **kwargs):
+        # The first write of the stats of a game fails, before or after Redis applies it.
+        if not failures and any(command[0] == 'HDEL' for command, _ in self.command_stack):
+            failures.append(self)
+            if applied:
+                await execute(self, *args, **kwargs)
+            raise redis.ConnectionError('connection lost')
+        return await execute(self, *args, **kwargs)
+
+    async def run():
+        configuration = make_fake_redis_configuration()
+        await configuration.start()
+        journal = JournaledReplayResultsProcessing(configuration.replay_processing, path, apply_timeout=0, retry_delay=0.01)
+        await journal.start()
+        for game_id in range(2):
+            await journal.process(make_result(game_id))
+        await wait_applied(path)
+        await journal.close()
+        with pytest.raises(ResultAlreadyProcessed):
+            await configuration.replay_processing.process(make_result(0))
+        try:
+            return await stats(configuration)
+        finally:
+            await configuration.close()
+
+    monkeypatch.setattr(Pipeline, 'execute', interrupted_execute)
+    assert asyncio.run(run()) == [('alice', 2, 2), ('bob', 2, 0)]
+    assert failures
+
+
+def test_entries_without_claim_ids_are_replayed(tmp_path):
+    path = str(tmp_path / 'journal')
+    with open(path, 'wb') as f:
+        f.write(json.dumps([dataclasses.asdict(make_result(0)), 0]).encode() + b'\n')
+
+    async def run():
+        configuration = make_memory_based_configuration('none')
+        journal = JournaledReplayResultsProcessing(configuration.replay_processing, path)
+        await journal.start()
+        await wait_applied(path)
+        await journal.close()
+        return await stats(configuration)
+
+    assert asyncio.run(run()) == [('alice', 1, 1), ('bob', 1, 0)]
@@ -0,0 +1,66 @@
+import pytest
+
+from disco_war.markdown import MarkdownBuilder, MarkdownTablePages
+
+
+def make_table(rows: int) -> str:
+    return MarkdownBuilder().table().with_header(('#', 'Игрок', 'Игры')).with_rows(
+        [(str(i), f'player{i}', str(i * 7)) for i in range(rows)]
+    ).build()
+
+
+def table_rows(text: str) -> list[str]:
+    return text.split('\n')[2:]
+
+
+@pytest.mark.parametrize('rows', [0, 1, 5, 100, 101, 1000])
+def test_pages_are_cut_at_row_boundaries(rows):
+    table = make_table(rows)
+    pages = MarkdownTablePages(table, before='```\n', after='\n```', max_size=500)
+    header = table.split('\n')[:2]
+    joined = []
+    for i in range(pages.pages_count):
+        page = pages.page(i)
+        assert len(page) <= 500
+        assert page.startswith('```\n') and page.endswith('\n```')
+        lines = page[4:-4].split('\n')
+        assert lines[:2] == header
+        joined.extend(table_rows(page[4:-4]))
+    assert joined == table_rows(table)
+
+
+def test_page_sizes_reach_the_limit():
+    table = make_table(1000)
+    line_size = table.index('\n') + 1
+    pages = MarkdownTablePages(table, max_size=2000)
+    assert all(len(pages.page(i)) <= 2000 for i in range(pages.pages_count))
+    assert len(pages.page(0)) + line_size > 2000
+
+
+def test_page_out_of_range():
+    pages = MarkdownTablePages(make_table(10), max_size=2000)
+    assert pages.pages_count == 1
+    with pytest.raises(IndexError):
+        pages.page(1)
+    with pytest.raises(IndexError):
+        pages.page(-1)
+
+
+
+@pytest.mark.parametrize(
+    'header, before',
+    [('x' * 1000, '```\n'), ('Игрок', 'x' * 1950), ('x' * 3000, 'x' * 1990)],
+    ids=['wide header', 'wide before', 'both'],
+)
+def test_wide_tables_are_cut_to_the_limit(header, before):
+    table = MarkdownBuilder().table().with_header(('#', header)).with_rows(
+        [(str(i), f'player{i}') for i in range(20)]
+    ).build()
+    pages = MarkdownTablePages(table, before=before, after='\n```', max_size=2000)
+    rows = []
+    for i in range(pages.pages_count):
+        page = pages.page(i)
+        assert len(page) <= 2000
+        assert page.startswith(before) and page.endswith('\n```')
+        rows.extend(table_rows(page[len(before):-4]))
+    assert len(rows) == 20
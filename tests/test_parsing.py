@@ -0,0 +1,103 @@
+import asyncio
+import struct
+import zlib
+
+import pytest
+
+from disco_war.bot import AttachmentProcessing
+from disco_war.controllers.results_processing import ResultAlreadyProcessed
+from disco_war.parsing import read_game_id, REPLAY_HEADER_SIZE
+
+
+def bliz_encode(raw: bytes) -> bytes:
+    # The reverse of w3g.blizdecomp: every 7 bytes are prefixed with a mask of the ones that are not zero.
+    encoded = bytearray()
+    for i in range(0, len(raw), 7):
+        chunk = raw[i:i + 7]
+        mask = 1
+        data = bytearray()
+        for j, byte in enumerate(chunk, start=1):
+            if byte == 0:
+                data.append(1)
+            else:
+                mask |= 1 << j
+                data.append(byte)
+        encoded.append(mask)
+        encoded += data
+    encoded.append(0)
+    return bytes(encoded)
+
+
+def make_startup(seed: int, names: tuple[str, ...] = ('Alice', 'Bob')) -> bytes:
+    data = bytearray(b'\0\0\0\0')
+    data += b'\x00\x01' + names[0].encode() + b'\0\x01\x00'
+    data += b'Game\0\0'
+    settings = bytes([1, 1, 1, 1, 0, 0, 0, 0, 0, 1, 2, 3, 4])
+    data += bliz_encode(settings + b'Maps\\SurvivalChaos.w3x\0creator\0')
+    data += struct.pack('<I', len(names)) + b'\x09\x00\0\0\0\0\0\0'
+    for i, name in enumerate(names[1:], start=2):
+        data += b'\x16' + bytes([i]) + name.encode() + b'\0\x01\x00\0\0\0\0'
+    data += b'\x19' + struct.pack('<H', 7 + 9 * len(names)) + bytes([len(names)])
+    for i in range(len(names)):
+        data += bytes([i + 1, 100, 2, 0, i, i, 1, 1, 100])
+    data += struct.pack('<I', seed) + b'\x00\x02'
+    return bytes(data)
+
+
+def make_replay(seed: int, reforged: bool = False, split: int | None = None) -> bytes:
+    data = make_startup(seed) + b'\x00'
+    parts = [data] if split is None else [data[:split], data[split:]]
+    blocks = b''
+    for part in parts:
+        compressed = zlib.compress(part)
+        if reforged:
+            blocks += struct.pack('<HHHHI', len(compressed), 0, len(part), 0, 0) + compressed
+        else:
+            blocks += struct.pack('<HHI', len(compressed), len(part), 0) + compressed
+    header = b'Warcraft III recorded game\x1A\0'
+    header += struct.pack('<IIIII', REPLAY_HEADER_SIZE, REPLAY_HEADER_SIZE + len(blocks), 1, len(data), len(parts))
+    header += b'PX3W' + struct.pack('<IHHII', 26, 6105 if reforged else 6059, 0x8000, 0, 0)
+    return header + blocks
+
+
+@pytest.mark.parametrize('reforged', [False, True])
+def test_read_game_id(reforged):
+    assert read_game_id(make_replay(123456789, reforged)) == 123456789
+
+
+@pytest.mark.parametrize('reforged', [False, True])
+@pytest.mark.parametrize('split', [None, 20])
+def test_read_game_id_of_truncated_prefix(reforged, split):
+    replay = make_replay(42, reforged, split)
+    for size in range(len(replay)):
+        assert read_game_id(replay[:size]) in (None, 42)
+    assert read_game_id(replay) == 42
+
+
+def test_read_game_id_waits_for_startup_split_between_blocks():
+    replay = make_replay(42, split=20)
+    first_block_end = REPLAY_HEADER_SIZE + 8 + struct.unpack('<H', replay[REPLAY_HEADER_SIZE:REPLAY_HEADER_SIZE + 2])[0]
+    assert read_game_id(replay[:first_block_end]) is None
+
+
+def test_read_game_id_of_unknown_header():
+    replay = bytearray(make_replay(42))
+    replay[0x24:0x28] = struct.pack('<I', 7)
+    assert read_game_id(bytes(replay)) is None
+
+
+def test_check_prefix_falls_back_to_full_download():
+    async def failing_precheck(game_id):
+        raise ConnectionError('storage is unavailable')
+
+    processing = AttachmentProcessing(None, failing_precheck)
+    assert asyncio.run(processing.check_prefix(bytearray(make_replay(42)))) is None
+
+
+def test_check_prefix_rejects_processed_game():
+    async def precheck(game_id):
+        raise ResultAlreadyProcessed(game_id)
+
+    processing = AttachmentProcessing(None, precheck)
+    with pytest.raises(ResultAlreadyProcessed):
+        asyncio.run(processing.check_prefix(bytearray(make_replay(42))))
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from disco_war.common_types import Login
+from disco_war.periods import Period, PeriodBucket, PeriodsCalendar, UnknownPeriod
+from tests.conftest import make_result, make_test_configuration
+
+
+def timestamp(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def test_game_buckets():
+    calendar = PeriodsCalendar(season_months=3, max_window_days=90)
+    buckets = calendar.game_buckets(timestamp(2024, 5, 16, 23, 59))
+    assert buckets == [
+        PeriodBucket(Period.DAY, date(2024, 5, 16)),
+        PeriodBucket(Period.WEEK, date(2024, 5, 13)),
+        PeriodBucket(Period.MONTH, date(2024, 5, 1)),
+        PeriodBucket(Period.SEASON, date(2024, 4, 1)),
+    ]
+    day, week, month, season = buckets
+    assert day.expires_at == timestamp(2024, 8, 15)
+    assert week.expires_at == timestamp(2024, 8, 18)
+    assert month.expires_at is None and season.expires_at is None
+
+
+@pytest.mark.parametrize('season_months, month, start', [(3, 3, 1), (3, 12, 10), (6, 6, 1), (6, 7, 7), (12, 11, 1)])
+def test_season_start(season_months, month, start):
+    calendar = PeriodsCalendar(season_months=season_months)
+    assert calendar.bucket(Period.SEASON, date(2024, month, 20)).start == date(2024, start, 1)
+
+
+@pytest.mark.parametrize('days', range(1, 31))
+@pytest.mark.parametrize('today', [date(2024, 5, 12), date(2024, 5, 13), date(2024, 5, 16)])
+def test_window_covers_every_day_once(days, today):
+    covered = []
+    for bucket in PeriodsCalendar().window(days, today):
+        if bucket.period == Period.WEEK:
+            assert bucket.start.weekday() == 0
+            covered.extend(bucket.start + timedelta(days=i) for i in range(7))
+        else:
+            assert bucket.period == Period.DAY
+            covered.append(bucket.start)
+    assert covered == [today - timedelta(days=i) for i in reversed(range(days))]
+
+
+def test_parse():
+    calendar = PeriodsCalendar(max_window_days=90)
+    now = timestamp(2024, 5, 16, 12)
+    assert calendar.parse(' Week ', now)[1] == [PeriodBucket(Period.WEEK, date(2024, 5, 13))]
+    # Two days up to the first Monday, twelve whole weeks and four days of the current week.
+    assert len(calendar.parse('90d', now)[1]) == 18
+    for query in ('0d', '91d', 'year', ''):
+        with pytest.raises(UnknownPeriod):
+            calendar.parse(query, now)
+
+
+
+@pytest.mark.parametrize('storage', ['memory', 'sqlite', 'redis'])
+def test_period_stats(storage, tmp_path):
+    # Buckets expire, so the games are played relative to now.
+    now = time.time()
+    calendar = PeriodsCalendar()
+
+    async def run():
+        configuration = make_test_configuration(storage, tmp_path)
+        await configuration.start()
+        try:
+            await configuration.replay_processing.process(make_result(0, 'alice', 'bob'), now - 6 * DAY)
+            await configuration.replay_processing.process(make_result(1, 'bob', 'alice'), now - 2 * DAY)
+            await configuration.replay_processing.process(make_result(2, 'bobby', 'carol'), now)
+            await configuration.players_controller.add_alias(Login('bob'), Login('bobby'))
+            return {
+                query: sorted(
+                    (s.login, s.games_played, s.games_won)
+                    for s in await configuration.individual_stats_controller.get_for_period(calendar.parse(query, now)[1])
+                )
+                for query in ('today', '3d', '7d')
+            }
+        finally:
+            await configuration.close()
+
+    assert asyncio.run(run()) == {
+        'today': [('bob', 1, 1), ('carol', 1, 0)],
+        '3d': [('alice', 1, 0), ('bob', 2, 2), ('carol', 1, 0)],
+        '7d': [('alice', 2, 1), ('bob', 3, 2), ('carol', 1, 0)],
+    }
+
+
+DAY = 24 * 60 * 60
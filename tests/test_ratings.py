@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from disco_war.common_types import Login
+from disco_war.ratings import EloRating
+from tests.conftest import LOGINS, make_random_result, make_result, make_test_configuration
+
+
+@pytest.mark.parametrize('ratings, winner', [([1500, 1500], 0), ([1400, 1600], 0), ([1600, 1400, 1500, 1500], 3)])
+def test_deltas_are_zero_sum(ratings, winner):
+    rating = EloRating(k=32)
+    deltas = rating.deltas(ratings, winner)
+    assert sum(deltas) == pytest.approx(0)
+    assert deltas[winner] > 0
+    assert all(delta < 0 for i, delta in enumerate(deltas) if i != winner)
+    assert deltas[winner] <= 32
+
+
+def test_upset_moves_more_points():
+    rating = EloRating(k=32)
+    assert rating.deltas([1500, 1500], 0) == [16, -16]
+    assert rating.deltas([1400, 1600], 0)[0] > rating.deltas([1600, 1400], 0)[0]
+
+
+@pytest.mark.parametrize('storage', ['memory', 'sqlite', 'redis'])
+def test_leaderboard(storage, tmp_path):
+    async def run():
+        configuration = make_test_configuration(storage, tmp_path)
+        await configuration.start()
+        try:
+            await configuration.replay_processing.process(make_result(0, 'alice', 'bob'))
+            await configuration.replay_processing.process(make_result(1, 'alice', 'carol'))
+            for seed in range(2, 40):
+                await configuration.replay_processing.process(make_random_result(seed))
+            leaderboard = await configuration.ratings_controller.get_leaderboard(0, 100)
+            page = await configuration.ratings_controller.get_leaderboard(3, 2)
+            players = [await configuration.ratings_controller.get_player(r.login) for r in leaderboard]
+            missing = await configuration.ratings_controller.get_player(Login('nobody'))
+        finally:
+            await configuration.close()
+        return leaderboard, page, players, missing
+
+    leaderboard, page, players, missing = asyncio.run(run())
+    assert {r.login for r in leaderboard} == {*LOGINS, 'alice', 'bob', 'carol'}
+    assert [r.place for r in leaderboard] == list(range(1, len(leaderboard) + 1))
+    assert [r.rating for r in leaderboard] == sorted((r.rating for r in leaderboard), reverse=True)
+    assert page == leaderboard[3:5]
+    assert players == leaderboard
+    assert missing is None
+    assert sum(r.rating for r in leaderboard) == pytest.approx(1500 * len(leaderboard))
+
+
+@pytest.mark.parametrize('storage', ['redis', 'redis-write-behind'])
+def test_scripts_flushed_by_the_server_are_sent_again(storage, tmp_path):
+    async def run(storage):
+        configuration = make_test_configuration(storage, tmp_path)
+        await configuration.start()
+        try:
+            for seed in range(20):
+                if seed == 10 and storage != 'memory':
+                    await configuration.ratings_repository.r.script_flush()
+                await configuration.replay_processing.process(make_random_result(seed))
+            return (
+                await configuration.ratings_controller.get_leaderboard(0, 100),
+                {login: await configuration.profiles_controller.get(login) for login in LOGINS},
+            )
+        finally:
+            await configuration.close()
+
+    assert asyncio.run(run(storage)) == asyncio.run(run('memory'))
@@ -0,0 +1,23 @@
+import asyncio
+
+from tests.conftest import make_test_configuration, process_and_rebuild, snapshot
+
+
+def test_sqlite_matches_memory(tmp_path):
+    expected, _ = asyncio.run(process_and_rebuild(make_test_configuration('memory', tmp_path)))
+    live, rebuilt = asyncio.run(process_and_rebuild(make_test_configuration('sqlite', tmp_path)))
+    assert live == expected
+    assert rebuilt == expected
+
+
+def test_sqlite_keeps_stats_across_restarts(tmp_path):
+    async def reopen():
+        configuration = make_test_configuration('sqlite', tmp_path)
+        await configuration.start()
+        try:
+            return await snapshot(configuration)
+        finally:
+            await configuration.close()
+
+    _, rebuilt = asyncio.run(process_and_rebuild(make_test_configuration('sqlite', tmp_path), games=30))
+    assert asyncio.run(reopen()) == rebuilt
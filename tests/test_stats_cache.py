@@ -0,0 +1,73 @@
+import asyncio
+
+import fakeredis
+
+from disco_war.cache import CachedRedisStatsCache
+from disco_war.common_types import GroupDescriptor, Login
+from disco_war.configuration import make_redis_based_configuration
+from disco_war.repository.redis import RedisKeysManager
+from tests.conftest import make_result
+
+GROUP = GroupDescriptor(frozenset([Login('alice'), Login('bob')]))
+
+
+async def subscribed(cache: CachedRedisStatsCache):
+    await cache.start()
+    while not cache._subscribed:
+        await asyncio.sleep(0.01)
+    return cache
+
+
+def test_invalidations_reach_other_processes():
+    async def run():
+        server = fakeredis.FakeServer()
+        first, second = [
+            await subscribed(CachedRedisStatsCache(
+                fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+                RedisKeysManager('cache'),
+            ))
+            for _ in range(2)
+        ]
+        try:
+            await first.set(None, 'all')
+            await first.set(GROUP, 'group')
+            assert (await second.get(None), await second.get(GROUP)) == ('all', 'group')
+            # Served by the process, even if the Redis entry is gone.
+            await second.r.delete('cache:#stats_tables')
+            cached = await second.get(GROUP)
+            await first.invalidate(GROUP)
+            for _ in range(100):
+                if 'alice,bob' not in second._entries:
+                    break
+                await asyncio.sleep(0.01)
+            invalidated = await second.get(GROUP)
+            await first.invalidate_all()
+            await asyncio.sleep(0.05)
+            return cached, invalidated, await second.get(None), await first.get(None)
+        finally:
+            await first.close()
+            await second.close()
+
+    assert asyncio.run(run()) == ('group', None, None, None)
+
+
+def test_stats_are_invalidated_after_the_flush():
+    async def run():
+        configuration = make_redis_based_configuration(
+            fakeredis.FakeAsyncRedis(decode_responses=True),
+            write_behind_games=100,
+            write_behind_interval=100_000,
+        )
+        await configuration.start()
+        try:
+            stats_cache = configuration.stats_messages_controller.stats_cache
+            await configuration.stats_messages_controller.stats_message()
+            await configuration.replay_processing.process(make_result(1))
+            # Left to write-behind, so the cached table stays until the flush.
+            still_cached = await stats_cache.get(None) is not None
+            await configuration.context_manager.buffer.flush()
+            return still_cached, await stats_cache.get(None)
+        finally:
+            await configuration.close()
+
+    assert asyncio.run(run()) == (True, None)
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+import redis.asyncio as redis
+
+from disco_war.common_types import Login
+from disco_war.configuration import make_redis_based_configuration
+from disco_war.parsing import ReplayProcessingResult
+from tests.conftest import LOGINS, make_random_result, make_test_configuration, process_and_rebuild, snapshot
+
+
+def test_memory_rebuild_matches_live_stats(tmp_path):
+    live, rebuilt = asyncio.run(process_and_rebuild(make_test_configuration('memory', tmp_path)))
+    assert rebuilt == live
+
+
+@pytest.mark.parametrize('storage', ['redis', 'redis-packed', 'redis-write-behind', 'redis-cluster'])
+def test_redis_matches_memory(storage, tmp_path):
+    expected, _ = asyncio.run(process_and_rebuild(make_test_configuration('memory', tmp_path)))
+    live, rebuilt = asyncio.run(process_and_rebuild(make_test_configuration(storage, tmp_path)))
+    assert live == expected
+    assert rebuilt == expected
+
+
+ALIASES = {Login(f'{LOGINS[0]}-alt'): LOGINS[0], Login(f'{LOGINS[2]}-alt'): LOGINS[2]}
+
+
+def make_aliased_result(seed: int) -> ReplayProcessingResult:
+    # Every other game is played under the aliases, a game never has both an alias and its player.
+    result = make_random_result(seed)
+    if seed % 2:
+        renames = {player: alias for alias, player in ALIASES.items()}
+        for player in result.players:
+            player.login = renames.get(player.login, player.login)
+        result.winner = renames.get(result.winner, result.winner)
+    return result
+
+
+@pytest.mark.parametrize('storage', ['memory', 'sqlite', 'redis', 'redis-packed', 'redis-cluster'])
+def test_alias_merge_matches_rebuild(storage, tmp_path):
+    async def run():
+        configuration = make_test_configuration(storage, tmp_path)
+        await configuration.start()
+        try:
+            for seed in range(60):
+                await configuration.replay_processing.process(make_aliased_result(seed))
+            await configuration.players_controller.add_aliases(ALIASES)
+            merged = await snapshot(configuration)
+            await configuration.stats_rebuild_controller.rebuild()
+            return merged, await snapshot(configuration)
+        finally:
+            await configuration.close()
+
+    merged, rebuilt = asyncio.run(run())
+    assert merged['stats'] == rebuilt['stats']
+    assert merged['rivals'] == rebuilt['rivals']
+    # Ratings can't be merged exactly, but no points are lost with the aliases.
+    assert [login for login, _ in merged['ratings']] == [login for login, _ in rebuilt['ratings']]
+    assert sum(rating for _, rating in merged['ratings']) == pytest.approx(sum(rating for _, rating in rebuilt['ratings']))
+    for login, profile in merged['profiles'].items():
+        expected = rebuilt['profiles'][login]
+        assert (profile.games, profile.apm_sketch) == (expected.games, expected.apm_sketch)
+        for metric, aggregate in profile.metrics.items():
+            assert aggregate.total == pytest.approx(expected.metrics[metric].total)
+            assert aggregate.total_squares == pytest.approx(expected.metrics[metric].total_squares)
+
+
+def test_stock_cluster_client_is_rejected():
+    async def run():
+        r = redis.RedisCluster(host='localhost', port=7000)
+        try:
+            make_redis_based_configuration(r)
+        finally:
+            await r.close()
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
@@ -0,0 +1,131 @@
+import asyncio
+
+import fakeredis
+import pytest
+import redis.asyncio as redis
+
+from disco_war import metrics
+from disco_war.common_types import GameID
+from disco_war.configuration import AppConfiguration, make_redis_based_configuration
+from disco_war.controllers.results_processing import ResultAlreadyProcessed
+from disco_war.repository.redis import WriteBehindBatch
+from tests.conftest import make_result, stats
+
+
+def make_configuration(r: redis.Redis) -> AppConfiguration:
+    # Flushed only by hand.
+    return make_redis_based_configuration(
+        r,
+        'none',
+        write_behind_games=100,
+        write_behind_interval=100_000,
+        generation_grace=0,
+    )
+
+
+def test_batch_aggregates_writes():
+    batch = WriteBehindBatch()
+    batch.add([('HINCRBY', 'a', 'games', '1'), ('SADD', 'players', 'a'), ('HSETNX', 'a', 'since', '1')], [])
+    batch.add([('HINCRBY', 'a', 'games', '2'), ('SADD', 'players', 'a', 'b'), ('HSETNX', 'a', 'since', '2')], [])
+    batch.add([('EXPIREAT', 'day', '10'), ('EXPIREAT', 'day', '20'), ('EVAL', 'script', '1', 'a')], [])
+    assert batch.games == 3
+    assert batch.increments == {('a', 'games'): 3}
+    assert batch.members == {'players': {'a', 'b'}}
+    assert batch.new_fields == {('a', 'since'): '1'}
+    assert batch.expirations == {'day': '20'}
+    assert batch.scripts == [('EVAL', 'script', '1', 'a')]
+
+
+def test_stats_are_written_on_flush():
+    async def run():
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        configuration = make_configuration(r)
+        await configuration.start()
+        await configuration.replay_processing.process(make_result(1, 'alice', 'bob'))
+        await configuration.replay_processing.process(make_result(2, 'alice', 'carol'))
+        # The games are claimed right away, so a duplicate is rejected before the flush.
+        with pytest.raises(ResultAlreadyProcessed):
+            await configuration.replay_processing.ensure_not_processed(GameID(2))
+        buffered = await r.keys('main:individual_stats:*')
+        # Reads flush the buffer first.
+        result = await stats(configuration)
+        await configuration.close()
+        return buffered, result
+
+    buffered, result = asyncio.run(run())
+    assert buffered == []
+    assert result == [('alice', 2, 2), ('bob', 1, 0), ('carol', 1, 0)]
+
+
+def test_retry_after_lost_reply_is_not_applied_twice(monkeypatch):
+    execute = redis.client.Pipeline.execute
+
+    async def lost_reply(self, *args, **kwargs):
+        await execute(self, *args, **kwargs)
+        raise redis.ConnectionError('reply lost')
+
+    async def refused(self, *args, **kwargs):
+        raise redis.ConnectionError('refused')
+
+    async def run():
+        configuration = make_configuration(fakeredis.FakeAsyncRedis(decode_responses=True))
+        await configuration.start()
+        buffer = configuration.context_manager.buffer
+        await configuration.replay_processing.process(make_result(1, 'alice', 'bob'))
+        for failure in (lost_reply, refused):
+            monkeypatch.setattr(redis.client.Pipeline, 'execute', failure)
+            with pytest.raises(redis.ConnectionError):
+                await buffer.flush()
+            monkeypatch.setattr(redis.client.Pipeline, 'execute', execute)
+            await configuration.replay_processing.process(make_result(2 if failure is lost_reply else 3, 'bob', 'carol'))
+        await buffer.flush()
+        result = await stats(configuration)
+        await configuration.close()
+        return result
+
+    assert asyncio.run(run()) == [('alice', 1, 1), ('bob', 3, 2), ('carol', 2, 0)]
+
+
+
+def test_buffer_is_flushed_on_close():
+    async def run():
+        server = fakeredis.FakeServer()
+        configuration = make_configuration(fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        await configuration.start()
+        await configuration.replay_processing.process(make_result(1, 'alice', 'bob'))
+        await configuration.close()
+        reopened = make_configuration(fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        await reopened.start()
+        try:
+            return await stats(reopened)
+        finally:
+            await reopened.close()
+
+    assert asyncio.run(run()) == [('alice', 1, 1), ('bob', 1, 0)]
+
+
+def test_timer_flush_is_not_counted_by_the_game():
+    async def run():
+        configuration = make_redis_based_configuration(
+            fakeredis.FakeAsyncRedis(decode_responses=True),
+            'none',
+            write_behind_games=100,
+            write_behind_interval=1,
+            generation_grace=0,
+        )
+        await configuration.start()
+        buffer = configuration.context_manager.buffer
+        flush = buffer.flush
+        operations = []
+
+        async def counted_flush():
+            operations.append(metrics.current_operations.get())
+            await flush()
+
+        buffer.flush = counted_flush
+        await configuration.replay_processing.process(make_result(1, 'alice', 'bob'))
+        await asyncio.sleep(0.05)
+        await configuration.close()
+        return operations
+
+    assert asyncio.run(run())[0] == ()